@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, Literal, TypedDict
+from typing import Dict, Optional, Literal, TypedDict
+from models.media import MediaHandle
 
 @dataclass
 class VideoGenerationInput:
@@ -8,13 +9,34 @@ class VideoGenerationInput:
     global_context: str
     duration_seconds: int = 6
 
+# Image fields of VideoJobRequest
+IMAGE_FIELDS = ("starting_image", "ending_image", "base_layer", "annotation_layer", "ending_base_layer")
+
 @dataclass
 class VideoJobRequest:
-    starting_image: bytes
+    starting_image: Optional[MediaHandle]  # flattened frame; may be omitted when base_layer is sent
     global_context: str
     custom_prompt: str
     duration_seconds: int = 6
-    ending_image: Optional[bytes] = None
+    ending_image: Optional[MediaHandle] = None
+    # Canvas layers: the artwork without annotations and the annotations on their own
+    # (transparent, same size). A clean layer replaces the Gemini cleanup of that frame.
+    base_layer: Optional[MediaHandle] = None
+    annotation_layer: Optional[MediaHandle] = None
+    ending_base_layer: Optional[MediaHandle] = None
+    # Image fields uploaded straight to the bucket: field name -> uploads/ object name.
+    # Read from the bucket when the job runs, so the bytes never pass through the API.
+    objects: Optional[Dict[str, str]] = None
+
+    def has(self, field: str) -> bool:
+        """Whether an image field was sent, as bytes or as an object reference"""
+        return getattr(self, field) is not None or field in (self.objects or {})
+
+    def release(self):
+        """Free the images once the pipeline no longer needs the originals"""
+        for field in IMAGE_FIELDS:
+            if getattr(self, field) is not None:
+                getattr(self, field).release()
 
 @dataclass
 class JobStatus:
@@ -24,6 +46,8 @@ class JobStatus:
     video_url: Optional[str] = None
     error: Optional[str] = None
     metadata: Optional[dict] = None
+    # Video returned inline (no output_gcs_uri), for the job service to store
+    video_bytes: Optional[bytes] = None
 
 class VideoJob(TypedDict):
     """Type hint for video job stored in Redis"""
@@ -0,0 +1,79 @@
+from typing import BinaryIO, Optional
+from utils.env import settings
+import asyncio
+import os
+import shutil
+import tempfile
+import weakref
+
+# Chunk size for spilling uploads to disk
+SPOOL_COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class MediaHandle:
+    """
+    An uploaded image held by a job until it has been sent on: the bytes themselves when
+    small, a temp file when bigger than MEDIA_SPOOL_THRESHOLD_BYTES. Jobs that wait for a
+    worker then cost a file handle instead of megabytes of resident memory.
+    read() loads the contents (from disk if spilled), release() drops them and deletes the
+    temp file; an unreleased file is deleted when the handle is garbage collected.
+    """
+
+    def __init__(self, data: Optional[bytes] = None, path: Optional[str] = None):
+        self._data = data
+        self._path = path
+        self._finalizer = weakref.finalize(self, _remove, path) if path else None
+        self.size = len(data) if data is not None else os.path.getsize(path)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "MediaHandle":
+        return cls(data=data)
+
+    @classmethod
+    def from_file(cls, source: BinaryIO, threshold: Optional[int] = None) -> "MediaHandle":
+        """Copy a (seekable) file, spilling it to a temp file above the threshold. Blocking."""
+        threshold = settings.MEDIA_SPOOL_THRESHOLD_BYTES if threshold is None else threshold
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(0)
+        if size <= threshold:
+            return cls(data=source.read())
+        fd, path = tempfile.mkstemp(prefix="flowboard-media-")
+        try:
+            with os.fdopen(fd, "wb") as destination:
+                shutil.copyfileobj(source, destination, SPOOL_COPY_CHUNK_BYTES)
+        except BaseException:
+            _remove(path)
+            raise
+        return cls(path=path)
+
+    @property
+    def on_disk(self) -> bool:
+        return self._path is not None
+
+    def read_sync(self) -> bytes:
+        if self._data is not None:
+            return self._data
+        if self._path is None:
+            raise ValueError("Media was already released")
+        with open(self._path, "rb") as f:
+            return f.read()
+
+    async def read(self) -> bytes:
+        if self._data is not None:
+            return self._data
+        return await asyncio.to_thread(self.read_sync)
+
+    def release(self):
+        """Drop the contents; read() fails afterwards"""
+        self._data = None
+        if self._finalizer is not None:
+            self._finalizer()
+        self._path = None
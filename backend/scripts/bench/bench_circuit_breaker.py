@@ -0,0 +1,80 @@
+"""
+Benchmark: video jobs while Veo's quota is exhausted, with and without circuit breakers.
+
+Every generate_videos call fails with 429 while Gemini keeps working. Without a breaker
+each job still runs its Gemini calls and retries generate_videos before failing; with one,
+jobs are turned away with 503 + Retry-After once the Veo breaker has opened. Reports the
+Gemini calls spent on doomed jobs and how long clients waited for their answer.
+
+Usage (from backend/):
+    python scripts/bench/bench_circuit_breaker.py --jobs 50
+"""
+
+import argparse
+import asyncio
+
+from common import app_client, submit_and_wait  # sets up sys.path and settings defaults
+from fake_vertex import FakeVertexClient, unique_png
+
+from google.genai import errors as genai_errors
+
+import server
+from services.vertex_service import IMAGE_MODEL, TEXT_MODEL
+from utils.env import settings
+from utils.stats import percentile
+
+
+async def quota_exhausted(*args, **kwargs):
+    raise genai_errors.ClientError(429, {"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}})
+
+
+async def run_load(jobs: int, concurrency: int, latency: float, breaker: bool) -> dict:
+    # a threshold no run reaches disables the breaker
+    settings.VERTEX_CIRCUIT_FAILURES = 5 if breaker else 1_000_000
+    client = FakeVertexClient(latency=latency)
+    client.aio.models.generate_videos = quota_exhausted
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with app_client(client) as http:
+
+        async def limited() -> tuple:
+            async with semaphore:
+                return await submit_and_wait(http, {"files": ("start.png", unique_png(), "image/png")}, interval=0.02)
+
+        results = await asyncio.gather(*(limited() for _ in range(jobs)))
+
+    vertex = server.vertex_service.get_stats()
+    elapsed = [seconds for _, seconds in results]
+    return {
+        # turned away with 503 at submission; every other job fails at generate_videos
+        "shed": sum(1 for status, _ in results if status == 503),
+        "gemini_calls": vertex[IMAGE_MODEL]["calls"] + vertex[TEXT_MODEL]["calls"],
+        "veo_attempts": vertex["resilience"]["veo.generate_videos"]["attempts"],
+        "p50_ms": percentile(elapsed, 50) * 1000,
+        "p95_ms": percentile(elapsed, 95) * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=50, help="number of video jobs")
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs in flight at once")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake latency of a Gemini call (seconds)")
+    args = parser.parse_args()
+    # Scale the backoff down with the fake latencies
+    settings.VERTEX_RETRY_BASE_DELAY = args.latency
+
+    results = {}
+    for label, breaker in (("no breaker", False), ("breaker", True)):
+        results[label] = await run_load(args.jobs, args.concurrency, args.latency, breaker)
+
+    print(f"\n{args.jobs} jobs while every generate_videos call fails with 429, "
+          f"Gemini latency {args.latency * 1000:.0f} ms")
+    print(f"{'mode':<12}{'shed':>6}{'gemini calls':>14}{'veo attempts':>14}{'p50 (ms)':>10}{'p95 (ms)':>10}")
+    for label, result in results.items():
+        print(f"{label:<12}{result['shed']:>6}{result['gemini_calls']:>14}{result['veo_attempts']:>14}"
+              f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+Benchmark: separate annotation analysis + frame cleanup calls vs. one combined call.
+
+Runs concurrent video jobs (starting frame only, so the starting frame's two Gemini calls
+are the whole pre-Veo critical path) through the FastAPI app against a fake Vertex client,
+with VERTEX_COMBINED_FRAME_CALL off and on. Text answers take --latency, anything that
+returns an image takes --image-latency, and inline bytes cost --bandwidth. Reports Gemini
+calls and bytes per job and the time until the Veo operation was started.
+
+Usage (from backend/):
+    python scripts/bench/bench_combined_frame_call.py --jobs 16 --concurrency 8
+"""
+
+import argparse
+import asyncio
+
+from common import app_client, submit_and_wait  # sets up sys.path and settings defaults
+from fake_vertex import FakeVertexClient, unique_png
+
+import server
+from services.vertex_service import IMAGE_MODEL, TEXT_MODEL
+from utils.env import settings
+from utils.stats import percentile
+
+
+async def run_load(jobs: int, latency: float, image_latency: float, bandwidth: float, combined: bool) -> dict:
+    settings.VERTEX_COMBINED_FRAME_CALL = combined
+    client = FakeVertexClient(latency=latency, image_latency=image_latency, upload_bandwidth=bandwidth)
+
+    async with app_client(client) as http:
+        # a different, big-ish frame per job so the caches stay out of the picture
+        # and uploading it twice shows up
+        results = await asyncio.gather(*(
+            submit_and_wait(http, {"files": ("start.png", unique_png(640, 360), "image/png")}, interval=0.02)
+            for _ in range(jobs)
+        ))
+
+    elapsed = [seconds for _, seconds in results]
+    vertex = server.vertex_service.get_stats()
+    gemini_calls = vertex[IMAGE_MODEL]["calls"] + vertex[TEXT_MODEL]["calls"]
+    return {
+        "gemini_calls_per_job": gemini_calls / jobs,
+        "bytes_per_job": (vertex[IMAGE_MODEL]["bytes_sent"] + vertex[TEXT_MODEL]["bytes_sent"]) / jobs,
+        "fallbacks": vertex["combined_frame_calls"]["fallbacks"],
+        "p50_ms": percentile(elapsed, 50) * 1000,
+        "p95_ms": percentile(elapsed, 95) * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=16, help="number of concurrent video jobs")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake latency of a text answer (seconds)")
+    parser.add_argument("--image-latency", type=float, default=0.6, help="fake latency of an image answer (seconds)")
+    parser.add_argument("--bandwidth", type=float, default=5e6, help="simulated upload bandwidth to Gemini (bytes/s)")
+    parser.add_argument("--concurrency", type=int, default=settings.VERTEX_MAX_CONCURRENCY,
+                        help="VERTEX_MAX_CONCURRENCY")
+    args = parser.parse_args()
+    settings.VERTEX_MAX_CONCURRENCY = args.concurrency
+
+    results = {}
+    for label, combined in (("separate", False), ("combined", True)):
+        results[label] = await run_load(args.jobs, args.latency, args.image_latency, args.bandwidth, combined)
+
+    print(f"\n{args.jobs} jobs, text {args.latency * 1000:.0f} ms / image {args.image_latency * 1000:.0f} ms "
+          f"+ upload at {args.bandwidth / 1e6:.1f} MB/s, concurrency limit {args.concurrency}")
+    print(f"{'mode':<10}{'calls/job':>11}{'bytes/job':>12}{'fallbacks':>11}{'p50 (ms)':>10}{'p95 (ms)':>10}")
+    for label, result in results.items():
+        print(f"{label:<10}{result['gemini_calls_per_job']:>11.2f}{result['bytes_per_job']:>12,.0f}"
+              f"{result['fallbacks']:>11}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}")
+    separate, combined = results["separate"], results["combined"]
+    print(f"calls saved per job: {separate['gemini_calls_per_job'] - combined['gemini_calls_per_job']:.2f}, "
+          f"p50 change: {combined['p50_ms'] - separate['p50_ms']:+.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""
+Benchmark: /api/gemini/extract-context with scene keyframes vs. the whole video inline.
+
+Generates a test video with a few hard scene cuts, then posts it to the endpoint with a fake
+Vertex client whose latency grows with the inline bytes it receives (--bandwidth), once with
+keyframe extraction and once with ffmpeg disabled (the previous behaviour of sending the
+whole upload). Reports bytes sent to Gemini and end-to-end latency per request.
+
+The keyframe path trades upload time for ffmpeg time: it always sends far fewer bytes, but
+it is only faster end to end when the upload it saves takes longer than decoding the clip.
+The last line estimates the upload bandwidth below which that is the case; on fast links
+(e.g. Cloud Run to Vertex in the same region) sending the whole video can be quicker. The
+server therefore only extracts keyframes from videos of at least CONTEXT_KEYFRAME_MIN_BYTES;
+this bench sets it to 0 so the keyframe run always takes that path.
+
+Usage (from backend/):
+    python scripts/bench/bench_extract_context.py --seconds 12 --requests 5 --bandwidth 5e6
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+from common import app_client  # sets up sys.path and settings defaults
+from fake_vertex import FakeVertexClient
+
+import server
+from utils.env import settings
+from utils.stats import percentile
+
+CONTEXT_JSON = json.dumps({"entities": [], "environment": "", "style": ""})
+
+
+def make_video(path: str, seconds: int):
+    """720p test video: test pattern, a flat color and a fractal, with a tone on top"""
+    part = seconds / 3
+    subprocess.run([
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc=s=1280x720:r=24:d={part}",
+        "-f", "lavfi", "-i", f"color=c=navy:s=1280x720:r=24:d={part}",
+        "-f", "lavfi", "-i", "mandelbrot=s=1280x720:r=24",
+        "-f", "lavfi", "-i", f"sine=d={seconds}",
+        "-filter_complex", f"[2]trim=duration={part}[m];[0][1][m]concat=n=3:v=1[v]",
+        "-map", "[v]", "-map", "3:a",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest",
+        path
+    ], check=True)
+
+
+async def run_load(video: bytes, requests: int, latency: float, bandwidth: float, keyframes: bool) -> dict:
+    client = FakeVertexClient(latency=latency, upload_bandwidth=bandwidth, text=CONTEXT_JSON)
+    ffmpeg_available = server.video_merge_service.ffmpeg_available
+    min_bytes = settings.CONTEXT_KEYFRAME_MIN_BYTES
+    server.video_merge_service.ffmpeg_available = keyframes
+    settings.CONTEXT_KEYFRAME_MIN_BYTES = 0
+
+    latencies = []
+    try:
+        async with app_client(client) as http:
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = await http.post(
+                    "/api/gemini/extract-context",
+                    files={"video": ("clip.mp4", video, "video/mp4")}
+                )
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+    finally:
+        server.video_merge_service.ffmpeg_available = ffmpeg_available
+        settings.CONTEXT_KEYFRAME_MIN_BYTES = min_bytes
+
+    return {
+        "bytes_per_request": client.bytes_sent / requests,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=12, help="length of the generated test video")
+    parser.add_argument("--requests", type=int, default=5, help="requests per mode (sequential)")
+    parser.add_argument("--latency", type=float, default=0.5, help="fixed fake latency per Gemini call (seconds)")
+    parser.add_argument("--bandwidth", type=float, default=5e6, help="simulated upload bandwidth to Gemini (bytes/s)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.mp4")
+        make_video(path, args.seconds)
+        with open(path, "rb") as f:
+            video = f.read()
+
+    results = {}
+    for label, keyframes in (("inline", False), ("keyframes", True)):
+        results[label] = await run_load(video, args.requests, args.latency, args.bandwidth, keyframes)
+
+    print(f"\n{len(video) / 1e6:.1f} MB video ({args.seconds}s), {args.latency * 1000:.0f} ms + upload at "
+          f"{args.bandwidth / 1e6:.1f} MB/s per Gemini call")
+    print(f"{'mode':<12}{'bytes sent':>14}{'p50 (ms)':>12}{'max (ms)':>12}")
+    for label, result in results.items():
+        print(f"{label:<12}{result['bytes_per_request']:>14,.0f}{result['p50_ms']:>12.1f}{result['max_ms']:>12.1f}")
+    inline, keyframes = results["inline"], results["keyframes"]
+    print(f"bytes reduction: {inline['bytes_per_request'] / keyframes['bytes_per_request']:.1f}x, "
+          f"p50 latency: {inline['p50_ms'] / keyframes['p50_ms']:.2f}x")
+    # inline = base + V / bandwidth, keyframes = base + extraction + K / bandwidth, so the
+    # keyframe path wins below bandwidth = (V - K) / extraction
+    bytes_saved = inline["bytes_per_request"] - keyframes["bytes_per_request"]
+    extraction_seconds = (keyframes["p50_ms"] - inline["p50_ms"]) / 1000 + bytes_saved / args.bandwidth
+    if extraction_seconds <= 0:
+        print("keyframes are faster end to end at any upload bandwidth")
+    else:
+        print(f"keyframe extraction costs ~{extraction_seconds * 1000:.0f} ms: keyframes are faster end to end "
+              f"below ~{bytes_saved / extraction_seconds / 1e6:.1f} MB/s upload to Gemini, slower above")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
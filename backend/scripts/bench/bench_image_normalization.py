@@ -0,0 +1,90 @@
+"""
+Benchmark: video jobs with and without image normalization.
+
+Posts 4K canvas-style PNGs (flat shapes, strokes and a photo-like area, like a tldraw
+export with a pasted reference image) to /api/jobs/video, against a fake Vertex client
+whose latency grows with the inline bytes it receives (--bandwidth). Reports bytes sent to
+Gemini, Gemini call latency and end-to-end time to a started Veo operation.
+
+Usage (from backend/):
+    python scripts/bench/bench_image_normalization.py --jobs 6 --bandwidth 5e6
+"""
+
+import argparse
+import asyncio
+import io
+import os
+
+from common import app_client, submit_and_wait  # sets up sys.path and settings defaults
+from fake_vertex import FakeVertexClient
+
+from PIL import Image, ImageDraw
+
+import server
+from services.vertex_service import IMAGE_MODEL, TEXT_MODEL
+from utils.env import settings
+from utils.stats import percentile
+
+
+def make_canvas(width: int = 3840, height: int = 2160) -> bytes:
+    image = Image.new("RGBA", (width, height), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((200, 300, 1600, 1400), fill=(90, 160, 220, 255), outline=(20, 20, 20, 255), width=12)
+    draw.ellipse((2200, 500, 3300, 1600), fill=(240, 200, 60, 255), outline=(20, 20, 20, 255), width=12)
+    draw.line((400, 1900, 3400, 1700), fill=(220, 40, 40, 255), width=24)
+    draw.polygon(((3400, 1700), (3250, 1620), (3280, 1800)), fill=(220, 40, 40, 255))
+    # pasted photo: noise compresses about as badly as a real one
+    photo = Image.frombytes("RGB", (1200, 800), os.urandom(1200 * 800 * 3)).resize((1800, 1200))
+    image.paste(photo, (1000, 800))
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+async def run_load(canvases: list[bytes], jobs: int, latency: float, bandwidth: float, normalize: bool) -> dict:
+    settings.IMAGE_NORMALIZE = normalize
+    client = FakeVertexClient(latency=latency, upload_bandwidth=bandwidth)
+
+    def frames(index: int) -> dict:
+        # every frame is different, so the frame/analysis caches stay out of the picture
+        return {
+            "files": ("start.png", canvases[2 * index], "image/png"),
+            "ending_image": ("end.png", canvases[2 * index + 1], "image/png"),
+        }
+
+    async with app_client(client) as http:
+        results = await asyncio.gather(*(submit_and_wait(http, frames(index)) for index in range(jobs)))
+
+    elapsed = [seconds for _, seconds in results]
+    vertex = server.vertex_service.get_stats()
+    return {
+        "bytes_per_job": (vertex[IMAGE_MODEL]["bytes_sent"] + vertex[TEXT_MODEL]["bytes_sent"]) / jobs,
+        "gemini_p50_ms": max(vertex[IMAGE_MODEL]["p50_ms"], vertex[TEXT_MODEL]["p50_ms"]),
+        "job_p50_ms": percentile(elapsed, 50) * 1000,
+        "normalize_p50_ms": server.job_service.image_normalizer.get_stats()["p50_ms"],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=6, help="number of concurrent video jobs")
+    parser.add_argument("--latency", type=float, default=0.5, help="fixed fake latency per Vertex call (seconds)")
+    parser.add_argument("--bandwidth", type=float, default=5e6, help="simulated upload bandwidth to Gemini (bytes/s)")
+    args = parser.parse_args()
+
+    # the pasted photo is random, so every canvas is a different image
+    canvases = [make_canvas() for _ in range(2 * args.jobs)]
+    results = {}
+    for label, normalize in (("raw", False), ("normalized", True)):
+        results[label] = await run_load(canvases, args.jobs, args.latency, args.bandwidth, normalize)
+
+    print(f"\n{args.jobs} jobs with ~{len(canvases[0]) / 1e6:.1f} MB 4K PNG start and end frames, "
+          f"{args.latency * 1000:.0f} ms + upload at {args.bandwidth / 1e6:.1f} MB/s per Gemini call")
+    print(f"{'mode':<12}{'bytes/job':>14}{'Gemini p50 (ms)':>18}{'job p50 (ms)':>15}{'normalize p50 (ms)':>21}")
+    for label, result in results.items():
+        print(f"{label:<12}{result['bytes_per_job']:>14,.0f}{result['gemini_p50_ms']:>18.1f}"
+              f"{result['job_p50_ms']:>15.1f}{result['normalize_p50_ms']:>21.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+"""
+Benchmark: peak memory of a burst of video jobs, with job images held in memory vs. spilled
+to temp files (MEDIA_SPOOL_THRESHOLD_BYTES).
+
+Posts --jobs jobs with 4K canvas PNG start and end frames back to back, so most of them
+wait for an image normalization worker while the first ones run, then waits for all of them
+to start their Veo operation. Each mode runs in its own process and reports how far its
+peak RSS rose above the RSS before the burst.
+
+Usage (from backend/):
+    python scripts/bench/bench_job_memory.py --jobs 32
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from common import app_client, submit_job, wait_for_job  # sets up sys.path and settings defaults
+from bench_image_normalization import make_canvas
+from fake_vertex import FakeVertexClient
+
+from utils.env import settings
+from utils.stats import percentile
+
+MODES = (
+    ("in memory", 1 << 62),
+    ("spilled", None),
+)
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def peak_rss_bytes() -> int:
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def run_load(args, threshold: int) -> dict:
+    settings.MEDIA_SPOOL_THRESHOLD_BYTES = threshold
+    canvases = [make_canvas(), make_canvas()]
+    frames = {
+        "files": ("start.png", canvases[0], "image/png"),
+        "ending_image": ("end.png", canvases[1], "image/png"),
+    }
+
+    async with app_client(FakeVertexClient(latency=args.latency)) as http:
+        baseline = rss_bytes()
+        start = time.perf_counter()
+        job_ids = []
+        for _ in range(args.jobs):
+            response = await submit_job(http, frames)
+            job_ids.append(response.json()["job_id"])
+
+        async def wait(job_id: str) -> float:
+            await wait_for_job(http, job_id)
+            return time.perf_counter() - start
+
+        elapsed = await asyncio.gather(*(wait(job_id) for job_id in job_ids))
+
+    return {
+        "image_mb": (len(canvases[0]) + len(canvases[1])) / 2 / 1e6,
+        "peak_rss_mb": (peak_rss_bytes() - baseline) / 1e6,
+        "job_p50_ms": percentile(elapsed, 50) * 1000,
+        "all_done_s": max(elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=32, help="number of jobs posted in one burst")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake latency per Vertex call (seconds)")
+    parser.add_argument("--threshold", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.threshold is not None:
+        # one mode, in this process (peak RSS can't be reset)
+        print(json.dumps(asyncio.run(run_load(args, args.threshold))))
+        return
+
+    results = {}
+    for label, threshold in MODES:
+        threshold = settings.MEDIA_SPOOL_THRESHOLD_BYTES if threshold is None else threshold
+        output = subprocess.run(
+            [sys.executable, __file__, "--jobs", str(args.jobs), "--latency", str(args.latency), "--threshold", str(threshold)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results[label] = json.loads(output.strip().splitlines()[-1])
+
+    image_mb = next(iter(results.values()))["image_mb"]
+    print(f"\n{args.jobs} jobs posted at once, ~{image_mb:.1f} MB 4K PNG start and end frames, "
+          f"{settings.IMAGE_NORMALIZE_WORKERS} normalization workers, {args.latency * 1000:.0f} ms per Vertex call")
+    print(f"{'images':<12}{'peak RSS rise (MB)':>20}{'job p50 (ms)':>15}{'all done (s)':>14}")
+    for label, result in results.items():
+        print(f"{label:<12}{result['peak_rss_mb']:>20.1f}{result['job_p50_ms']:>15.1f}{result['all_done_s']:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
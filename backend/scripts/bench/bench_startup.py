@@ -0,0 +1,81 @@
+"""
+Benchmark: cold start of the API, the way Cloud Run with --min-instances=0 sees it.
+Launches `uvicorn server:app` --runs times per mode and polls /health; reports the time
+from launching the process until the first response (p50 / max), with and without the
+background warm-up (STARTUP_WARMUP).
+
+--backend-dir runs another checkout (e.g. a `git worktree` of an older revision) to compare.
+
+Usage (from backend/):
+    python scripts/bench/bench_startup.py --runs 5
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import common  # noqa: F401  (sets up sys.path and settings defaults)
+
+from utils.stats import percentile
+
+MODES = (
+    ("warm-up", "true"),
+    ("no warm-up", "false"),
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_response(backend_dir: str, warm_up: str, timeout: float) -> float:
+    port = free_port()
+    env = {**os.environ, "STARTUP_WARMUP": warm_up}
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=backend_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with code {process.returncode}")
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+                connection.request("GET", "/health")
+                if connection.getresponse().status == 200:
+                    return time.perf_counter() - start
+            except OSError:
+                # not listening yet
+                time.sleep(0.005)
+        raise TimeoutError(f"no response within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per mode")
+    parser.add_argument("--backend-dir", default=str(common.BACKEND_DIR), help="backend checkout to start")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for the first response")
+    args = parser.parse_args()
+
+    results = {}
+    for label, warm_up in MODES:
+        results[label] = [time_to_first_response(args.backend_dir, warm_up, args.timeout) for _ in range(args.runs)]
+
+    print(f"\nTime from launching uvicorn to the first /health response, {args.runs} runs per mode ({args.backend_dir})")
+    print(f"{'mode':<12}{'p50 (ms)':>10}{'max (ms)':>10}")
+    for label, seconds in results.items():
+        print(f"{label:<12}{percentile(seconds, 50) * 1000:>10.0f}{max(seconds) * 1000:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark: the previous upload path vs. StorageService, against a local fake-GCS server.
+
+The fake adds a connection setup cost (--connect-latency), a per-request round trip
+(--rtt) and a per-connection upload bandwidth (--bandwidth), and behaves like a bucket with
+uniform bucket-level access. Two workloads:
+
+- many small uploads at once (HLS segments, frames): the old path ran the blocking SDK on
+  the default to_thread pool and sent a make_public that always failed after each upload
+- one large upload (a merged video): a single stream vs. parallel composite parts
+
+Usage (from backend/):
+    python scripts/bench/bench_storage_upload.py --small 64 --large-mb 96
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import common  # noqa: F401  (sets up sys.path and settings defaults)
+from fake_gcs import FakeGCSServer
+
+from utils.env import settings
+
+BUCKET = "bench-bucket"
+
+
+async def legacy_upload(bucket, item_name: str, data: bytes, content_type: str):
+    """StorageService.upload_file as it was: blocking calls on the default pool, make_public per upload"""
+    blob = bucket.blob(item_name)
+    await asyncio.to_thread(blob.upload_from_string, data, content_type=content_type)
+
+    def public_url():
+        try:
+            blob.make_public()
+            return blob.public_url
+        except Exception:
+            return f"https://storage.googleapis.com/{bucket.name}/{blob.name}"
+
+    return await asyncio.to_thread(public_url)
+
+
+async def run(args, legacy: bool) -> dict:
+    with FakeGCSServer(
+        BUCKET, connect_latency=args.connect_latency, request_latency=args.rtt, bandwidth=args.bandwidth
+    ) as gcs:
+        settings.STORAGE_EMULATOR_HOST = gcs.url
+        settings.GOOGLE_CLOUD_BUCKET_NAME = BUCKET
+        if legacy:
+            # no composite uploads, one request (or the SDK's default chunking) per object
+            settings.STORAGE_COMPOSITE_THRESHOLD_BYTES = 1 << 62
+        from services.storage_service import GCSStorageService
+        service = GCSStorageService()
+
+        if legacy:
+            from google.auth.credentials import AnonymousCredentials
+            from google.cloud import storage
+            client = storage.Client(project="bench", credentials=AnonymousCredentials(),
+                                    client_options={"api_endpoint": gcs.url})
+            bucket = client.bucket(BUCKET)
+
+            async def upload(name: str, data: bytes):
+                return await legacy_upload(bucket, name, data, "video/mp4")
+        else:
+            await service.start()
+
+            async def upload(name: str, data: bytes):
+                return await service.upload_file(name, data, "video/mp4")
+
+        small = [os.urandom(args.small_kb * 1024) for _ in range(args.small)]
+        start = time.perf_counter()
+        await asyncio.gather(*(upload(f"small/{i}.m4s", data) for i, data in enumerate(small)))
+        small_seconds = time.perf_counter() - start
+        small_requests = gcs.requests
+
+        large = os.urandom(args.large_mb * 1024 * 1024)
+        start = time.perf_counter()
+        await upload("large/merged.mp4", large)
+        large_seconds = time.perf_counter() - start
+        assert gcs.objects["large/merged.mp4"]["data"] == large
+
+        return {
+            "small_seconds": small_seconds,
+            "small_requests": small_requests,
+            "failed_acl_calls": gcs.failed_acl_calls,
+            "connections": gcs.connections,
+            "large_seconds": large_seconds,
+        }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--small", type=int, default=64, help="number of small uploads sent at once")
+    parser.add_argument("--small-kb", type=int, default=256, help="size of a small upload (KiB)")
+    parser.add_argument("--large-mb", type=int, default=96, help="size of the large upload (MiB)")
+    parser.add_argument("--connect-latency", type=float, default=0.05, help="connection setup cost (seconds)")
+    parser.add_argument("--rtt", type=float, default=0.03, help="per-request round trip (seconds)")
+    parser.add_argument("--bandwidth", type=float, default=50e6, help="upload bandwidth per connection (bytes/s)")
+    args = parser.parse_args()
+
+    composite_threshold = settings.STORAGE_COMPOSITE_THRESHOLD_BYTES
+    results = {}
+    for label, legacy in (("before", True), ("after", False)):
+        settings.STORAGE_COMPOSITE_THRESHOLD_BYTES = composite_threshold
+        results[label] = await run(args, legacy)
+
+    print(f"\n{args.small} x {args.small_kb} KiB at once, then 1 x {args.large_mb} MiB; "
+          f"connect {args.connect_latency * 1000:.0f} ms, rtt {args.rtt * 1000:.0f} ms, "
+          f"{args.bandwidth / 1e6:.0f} MB/s per connection, uniform bucket-level access")
+    print(f"{'':<8}{'small (s)':>11}{'requests':>10}{'failed ACL':>12}{'connections':>13}{'large (s)':>11}")
+    for label, result in results.items():
+        print(f"{label:<8}{result['small_seconds']:>11.2f}{result['small_requests']:>10}"
+              f"{result['failed_acl_calls']:>12}{result['connections']:>13}{result['large_seconds']:>11.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
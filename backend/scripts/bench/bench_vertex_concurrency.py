@@ -0,0 +1,87 @@
+"""
+Benchmark: concurrent video jobs against a fake Vertex client with a fixed latency.
+
+Runs the same load twice through the FastAPI app - once with a client that blocks the
+event loop (how the synchronous SDK calls used to behave) and once with the async client -
+and reports the total pipeline time plus /health latency measured while the jobs run.
+
+Usage (from backend/):
+    python scripts/bench/bench_vertex_concurrency.py --jobs 10 --latency 0.25
+"""
+
+import argparse
+import asyncio
+import time
+
+from common import app_client, submit_and_wait  # sets up sys.path and settings defaults
+from fake_vertex import FakeVertexClient, unique_png
+
+from utils.env import settings
+from utils.stats import percentile
+
+
+async def run_load(jobs: int, latency: float, blocking: bool) -> dict:
+    client = FakeVertexClient(latency=latency, blocking=blocking)
+    health_latencies: list[float] = []
+    stop = asyncio.Event()
+
+    async with app_client(client) as http:
+
+        async def probe_health():
+            while not stop.is_set():
+                start = time.perf_counter()
+                await http.get("/health")
+                health_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.02)
+
+        def frames() -> dict:
+            # Unique frames per job so the frame/analysis caches don't hide the effect
+            return {
+                "files": ("start.png", unique_png(), "image/png"),
+                "ending_image": ("end.png", unique_png(), "image/png"),
+            }
+
+        probe = asyncio.create_task(probe_health())
+        start = time.perf_counter()
+        results = await asyncio.gather(*(submit_and_wait(http, frames(), "slow pan to the left") for _ in range(jobs)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await probe
+
+    statuses = [status for status, _ in results]
+
+    return {
+        "elapsed": elapsed,
+        "vertex_calls": client.calls,
+        "failed": sum(1 for status in statuses if status != 200),
+        "health_samples": len(health_latencies),
+        "health_p50_ms": percentile(health_latencies, 50) * 1000,
+        "health_p99_ms": percentile(health_latencies, 99) * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=10, help="number of concurrent video jobs")
+    parser.add_argument("--latency", type=float, default=0.25, help="fake latency per Vertex call (seconds)")
+    parser.add_argument("--concurrency", type=int, default=settings.VERTEX_MAX_CONCURRENCY,
+                        help="VERTEX_MAX_CONCURRENCY for the async run")
+    args = parser.parse_args()
+    settings.VERTEX_MAX_CONCURRENCY = args.concurrency
+
+    results = {}
+    for label, blocking in (("blocking", True), ("async", False)):
+        results[label] = await run_load(args.jobs, args.latency, blocking)
+
+    print(f"\n{args.jobs} jobs, {args.latency * 1000:.0f} ms per Vertex call, concurrency limit {args.concurrency}")
+    print(f"{'mode':<10}{'total (s)':>12}{'calls':>8}{'failed':>8}{'/health p50 (ms)':>19}{'/health p99 (ms)':>19}")
+    for label, result in results.items():
+        print(
+            f"{label:<10}{result['elapsed']:>12.2f}{result['vertex_calls']:>8}{result['failed']:>8}"
+            f"{result['health_p50_ms']:>19.1f}{result['health_p99_ms']:>19.1f}"
+        )
+    print(f"speedup: {results['blocking']['elapsed'] / results['async']['elapsed']:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Benchmark: video jobs against a flaky, occasionally slow fake Vertex client.
+
+A fraction of calls fails with 429 / 503 (--failure-rate) and a fraction takes
+--slow-latency instead of the usual latency (--slow-rate). The same load runs without
+retries, with retries (jittered backoff), and with retries plus hedged cleanup calls, and
+reports the job success rate, retries / hedges made, the time until the Veo operation
+was started, and the p95 of the (hedgeable) frame cleanup calls.
+
+Hedges are only sent while VERTEX_MAX_CONCURRENCY has free slots, so the default load
+(--concurrency 4) leaves headroom; with more jobs in flight than that the semaphore stays
+full and hedging turns itself off.
+
+Usage (from backend/):
+    python scripts/bench/bench_vertex_resilience.py --jobs 100 --concurrency 4 --failure-rate 0.1 --slow-rate 0.05
+"""
+
+import argparse
+import asyncio
+import random
+
+from common import app_client, submit_and_wait  # sets up sys.path and settings defaults
+from fake_vertex import FakeVertexClient, unique_png
+
+import server
+from services.vertex_service import IMAGE_MODEL
+from utils.env import settings
+from utils.stats import percentile
+
+MODES = (
+    ("no retries", 1, False),
+    ("retries", None, False),
+    ("retries+hedge", None, True),
+)
+
+
+async def run_load(args, attempts: int, hedge: bool) -> dict:
+    settings.VERTEX_RETRY_ATTEMPTS = attempts
+    settings.VERTEX_HEDGE_IMAGE_CALLS = hedge
+    # same faults in every mode
+    random.seed(args.seed)
+    client = FakeVertexClient(
+        latency=args.latency, failure_rate=args.failure_rate, slow_rate=args.slow_rate, slow_latency=args.slow_latency
+    )
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with app_client(client) as http:
+
+        async def limited() -> tuple:
+            async with semaphore:
+                return await submit_and_wait(http, {"files": ("start.png", unique_png(), "image/png")}, interval=0.02)
+
+        results = await asyncio.gather(*(limited() for _ in range(args.jobs)))
+
+    elapsed = [seconds for status, seconds in results if status == 200]
+    operations = server.vertex_service.resilience.get_stats().values()
+    return {
+        "success_rate": len(elapsed) / args.jobs,
+        "injected_failures": client.failures,
+        "retries": sum(operation["retries"] for operation in operations),
+        "hedges": sum(operation["hedges"] for operation in operations),
+        "hedges_won": sum(operation["hedges_won"] for operation in operations),
+        "p50_ms": percentile(elapsed, 50) * 1000,
+        "p99_ms": percentile(elapsed, 99) * 1000,
+        "cleanup_p95_ms": server.vertex_service.get_stats()[IMAGE_MODEL]["p95_ms"],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=100, help="number of video jobs")
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs in flight at once")
+    parser.add_argument("--latency", type=float, default=0.1, help="fake latency of a normal call (seconds)")
+    parser.add_argument("--failure-rate", type=float, default=0.1, help="fraction of calls that fail with 429/503")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="fraction of calls that are slow")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="latency of a slow call (seconds)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    # Scale the backoff down with the fake latencies
+    settings.VERTEX_RETRY_BASE_DELAY = args.latency
+    # Only the slow calls should hit the hedge threshold
+    settings.VERTEX_HEDGE_MAX_RATIO = max(settings.VERTEX_HEDGE_MAX_RATIO, args.slow_rate * 2)
+    attempts = settings.VERTEX_RETRY_ATTEMPTS
+
+    results = {}
+    for label, mode_attempts, hedge in MODES:
+        results[label] = await run_load(args, mode_attempts or attempts, hedge)
+
+    print(f"\n{args.jobs} jobs, {args.failure_rate:.0%} of calls fail, {args.slow_rate:.0%} take "
+          f"{args.slow_latency:.1f}s instead of {args.latency * 1000:.0f} ms")
+    print(f"{'mode':<15}{'success':>9}{'injected':>10}{'retries':>9}{'hedges':>8}{'won':>6}"
+          f"{'p50 (ms)':>10}{'p99 (ms)':>10}{'cleanup p95':>13}")
+    for label, result in results.items():
+        print(f"{label:<15}{result['success_rate']:>9.1%}{result['injected_failures']:>10}{result['retries']:>9}"
+              f"{result['hedges']:>8}{result['hedges_won']:>6}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+              f"{result['cleanup_p95_ms']:>13.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
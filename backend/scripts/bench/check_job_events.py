@@ -0,0 +1,53 @@
+"""
+Check: a Veo operation that finishes with an error reaches SSE subscribers as an "error" event.
+
+Submits a job against a fake Vertex client whose operations run for a moment and then fail,
+subscribes to /api/jobs/video/events while the operation is still running, and expects the
+stream to end with an error transition published by the status poller. Also checks that the
+job left the poller's active set and that its status endpoint reports the failure.
+
+Usage (from backend/):
+    python scripts/bench/check_job_events.py
+"""
+
+import asyncio
+import json
+
+from common import app_client, submit_job  # sets up sys.path and settings defaults
+from fake_vertex import FakeVertexClient, unique_png
+
+import server
+
+
+async def read_events(http, job_id: str) -> list[dict]:
+    events = []
+    async with http.stream("GET", "/api/jobs/video/events", params={"job_ids": job_id}) as response:
+        assert response.status_code == 200, response.status_code
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                events.append(json.loads(line[len("data: "):]))
+    return events
+
+
+async def main():
+    # long enough for the subscription to see the operation running first
+    client = FakeVertexClient(latency=0.01, video_seconds=0.5, video_failure_rate=1.0)
+
+    async with app_client(client) as http:
+        response = await submit_job(http, {"files": ("start.png", unique_png(), "image/png")})
+        job_id = response.json()["job_id"]
+        events = await asyncio.wait_for(read_events(http, job_id), timeout=30)
+
+        statuses = [event["status"] for event in events]
+        assert "generating" in statuses, statuses
+        assert statuses[-1] == "error", statuses
+        assert events[-1]["error_message"] == "injected video failure", events[-1]
+        assert job_id not in await server.job_service.store.active_job_ids()
+        status = await http.get(f"/api/jobs/video/{job_id}")
+        assert status.status_code == 500, status.status_code
+
+    print(f"ok: {' -> '.join(statuses)} ({events[-1]['error_message']})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+Check: RedisJobQueue delivery guarantees and JobService's handling of claimed jobs, on fakeredis.
+
+- A claimed job that is never acked stays hidden for the visibility timeout, then is
+  delivered again with the next attempt number.
+- The delivery after JOB_QUEUE_MAX_ATTEMPTS marks the job failed and removes it from the queue.
+- A job claimed while a model it needs has an open circuit breaker is put back for the
+  breaker's retry_after without using up an attempt, and runs once the breaker lets calls through.
+
+Usage (from backend/, after pip install -r scripts/bench/requirements.txt for fakeredis):
+    python scripts/bench/check_job_queue.py
+"""
+
+import asyncio
+
+import common  # noqa: F401  (sets up sys.path and settings defaults)
+from fake_vertex import FakeVertexClient, unique_png
+
+import fakeredis
+import fakeredis.aioredis
+
+from models.job import VideoJobRequest
+from models.media import MediaHandle
+from services.job_queue import RedisJobQueue
+from services.job_service import JobService
+from services.job_store import RedisJobStore
+from services.vertex_service import VIDEO_MODEL, VertexService
+from utils.env import settings
+
+VISIBILITY = 0.3
+
+
+def make_request() -> VideoJobRequest:
+    return VideoJobRequest(
+        starting_image=MediaHandle.from_bytes(unique_png()),
+        global_context="",
+        custom_prompt="the ball rolls along the arrow",
+    )
+
+
+async def check_redelivery(service: JobService, queue: RedisJobQueue):
+    job_id = await service.create_video_job(make_request())
+
+    # claimed by a worker that dies: hidden until the visibility timeout runs out
+    for attempt in range(1, settings.JOB_QUEUE_MAX_ATTEMPTS + 1):
+        assert await queue.claim(VISIBILITY) == (job_id, attempt)
+        assert await queue.claim(VISIBILITY) is None
+        assert (await queue.get_stats())["in_flight"] == 1
+        await asyncio.sleep(VISIBILITY + 0.1)
+
+    # one delivery too many: the job fails instead of running again
+    claimed = await queue.claim(VISIBILITY)
+    assert claimed == (job_id, settings.JOB_QUEUE_MAX_ATTEMPTS + 1), claimed
+    await service._run_claimed_job(*claimed)
+    job = await service.store.get(job_id)
+    assert job["status"] == "error", job
+    assert job["error"] == f"Job failed after {settings.JOB_QUEUE_MAX_ATTEMPTS} attempts", job
+    assert await queue.get_stats() == {"ready": 0, "in_flight": 0}
+    assert await queue.load_request(job_id) is None
+
+
+async def check_deferral(service: JobService, queue: RedisJobQueue):
+    job_id = await service.create_video_job(make_request())
+    breaker = service.vertex_service.resilience.breaker(VIDEO_MODEL)
+    breaker._open()
+
+    claimed = await queue.claim(VISIBILITY)
+    assert claimed == (job_id, 1), claimed
+    await service._run_claimed_job(*claimed)
+    assert (await service.store.get(job_id))["status"] == "pending"
+    assert await queue.load_request(job_id) is not None
+    assert await queue.claim(VISIBILITY) is None
+    assert (await service.get_stats())["jobs_deferred"] == 1
+
+    # visible again once the breaker lets a probe through, still on its first attempt
+    await asyncio.sleep(settings.VERTEX_CIRCUIT_OPEN_SECONDS + 0.1)
+    claimed = await queue.claim(VISIBILITY)
+    assert claimed == (job_id, 1), claimed
+    await service._run_claimed_job(*claimed)
+    job = await service.store.get(job_id)
+    assert job["status"] == "waiting", job
+    assert breaker.state == "closed"
+    assert await queue.get_stats() == {"ready": 0, "in_flight": 0}
+
+
+async def main():
+    settings.JOB_QUEUE_MAX_ATTEMPTS = 2
+    settings.VERTEX_CIRCUIT_OPEN_SECONDS = 0.5
+    server = fakeredis.FakeServer()
+    # the store decodes responses, the queue keeps raw image bytes
+    store = RedisJobStore(client=fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    queue = RedisJobQueue(client=fakeredis.aioredis.FakeRedis(server=server))
+    service = JobService(VertexService(client=FakeVertexClient(latency=0.01)), store=store, queue=queue)
+    try:
+        await check_redelivery(service, queue)
+        await check_deferral(service, queue)
+    finally:
+        await service.stop()
+    print("ok: RedisJobQueue redelivery, max attempts and breaker deferral")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
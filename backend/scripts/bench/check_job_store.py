@@ -0,0 +1,107 @@
+"""
+Check: RedisJobStore against fakeredis (or a local Redis with --redis-url).
+
+Covers the record round trip, batch reads, partial updates (which must not recreate an
+expired hash), the active set, the poller lease script and event delivery over pub/sub.
+
+Usage (from backend/, after pip install -r scripts/bench/requirements.txt for fakeredis):
+    python scripts/bench/check_job_store.py [--redis-url redis://localhost:6379/15]
+"""
+
+import argparse
+import asyncio
+import uuid
+
+import common  # noqa: F401  (sets up sys.path and settings defaults)
+
+from services.job_store import RedisJobStore
+
+
+def waiting_job(job_id: str) -> dict:
+    return {
+        "job_id": job_id,
+        "status": "waiting",
+        "operation_name": f"projects/check/operations/{job_id}",
+        "job_start_time": "2026-01-01T00:00:00",
+        "metadata": {"annotation_description": "an arrow"},
+        "video_url": None,
+        "next_poll_at": 1.5,
+    }
+
+
+async def check(store: RedisJobStore):
+    events = asyncio.Queue()
+
+    async def on_event(event: dict):
+        events.put_nowait(event)
+
+    store.set_event_handler(on_event)
+    await store.start()
+    try:
+        assert await store.ping()
+        first, second, short_lived = (str(uuid.uuid4()) for _ in range(3))
+
+        # put / get: None fields are left out, metadata and floats come back typed
+        await store.put(first, waiting_job(first), ttl=60)
+        job = await store.get(first)
+        expected = {field: value for field, value in waiting_job(first).items() if value is not None}
+        assert job == expected, job
+        assert await store.get(str(uuid.uuid4())) is None
+
+        # get_many skips ids that don't exist
+        await store.put(second, {**waiting_job(second), "status": "pending"}, ttl=60)
+        jobs = await store.get_many([first, second, "missing"])
+        assert set(jobs) == {first, second}, jobs
+        assert await store.get_many([]) == {}
+
+        # update keeps the TTL, and never recreates a hash that has expired
+        await store.update(first, {"next_poll_at": 9.0})
+        assert (await store.get(first))["next_poll_at"] == 9.0
+        assert 0 < await store.redis.ttl(store._key(first)) <= 60
+        await store.put(short_lived, waiting_job(short_lived), ttl=1)
+        await asyncio.sleep(1.2)
+        await store.update(short_lived, {"next_poll_at": 2.0})
+        assert await store.get(short_lived) is None
+        assert not await store.redis.exists(store._key(short_lived))
+
+        # active set: only waiting jobs, expired ones are pruned, finished ones removed
+        assert await store.redis.sismember(store.ACTIVE_KEY, short_lived)
+        assert set(await store.active_job_ids()) == {first}
+        assert not await store.redis.sismember(store.ACTIVE_KEY, short_lived)
+        await store.put(first, {**waiting_job(first), "status": "done", "video_url": "https://v"}, ttl=60)
+        assert await store.active_job_ids() == []
+
+        # lease: free -> taken, renewable by its owner only, free again after its TTL
+        lock = f"check-{uuid.uuid4()}"
+        assert await store.try_acquire_lock(lock, "a", ttl=0.5)
+        assert await store.try_acquire_lock(lock, "a", ttl=0.5)
+        assert not await store.try_acquire_lock(lock, "b", ttl=0.5)
+        await asyncio.sleep(0.7)
+        assert await store.try_acquire_lock(lock, "b", ttl=0.5)
+
+        # pub/sub: events published by any store reach this one's handler
+        await asyncio.sleep(0.1)  # let the listener subscribe
+        event = {"job_id": second, "status": "error", "error_message": "boom"}
+        await store.publish(event)
+        assert await asyncio.wait_for(events.get(), timeout=5) == event
+    finally:
+        await store.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", help="check against this Redis instead of fakeredis")
+    args = parser.parse_args()
+    if args.redis_url:
+        store = RedisJobStore(args.redis_url)
+    else:
+        # test-only dependency, see scripts/bench/requirements.txt
+        import fakeredis.aioredis
+
+        store = RedisJobStore(client=fakeredis.aioredis.FakeRedis(decode_responses=True))
+    await check(store)
+    print("ok: RedisJobStore")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+Check: direct uploads end to end on the local storage backend.
+
+Gets a signed upload URL from /api/uploads, PUTs the file to it, then passes the object to
+/api/jobs/video and /api/gemini/extract-context. Also checks the rejections: a malformed
+Content-Length, a Content-Type other than the signed one, and objects of the wrong kind
+(a video as a frame, an image as the video).
+
+Usage (from backend/):
+    python scripts/bench/check_uploads.py
+"""
+
+import asyncio
+import os
+import tempfile
+from urllib.parse import urlsplit
+
+from common import app_client, wait_for_job  # sets up sys.path and settings defaults
+from fake_vertex import FakeVertexClient, unique_png
+
+from utils.env import settings
+
+
+async def upload(http, content_type: str, data: bytes) -> str:
+    """Upload through a signed URL like a client would; the object name"""
+    response = await http.post("/api/uploads", json={"content_type": content_type})
+    assert response.status_code == 200, response.text
+    signed = response.json()
+    url = urlsplit(signed["upload_url"])
+    response = await http.put(f"{url.path}?{url.query}", content=data, headers=signed["upload_headers"])
+    assert response.status_code == 200, response.text
+    return signed["object"]
+
+
+async def main():
+    # before the app (and its storage service) is imported
+    settings.STORAGE_BACKEND = "local"
+    settings.LOCAL_STORAGE_DIR = tempfile.mkdtemp(prefix="flowboard-check-")
+
+    async with app_client(FakeVertexClient(latency=0.01)) as http:
+        image = await upload(http, "image/png", unique_png())
+        video = await upload(http, "video/mp4", os.urandom(4096))
+
+        # the signed URL only takes the signed content type and a valid length
+        signed = (await http.post("/api/uploads", json={"content_type": "image/png"})).json()
+        url = urlsplit(signed["upload_url"])
+        response = await http.put(f"{url.path}?{url.query}", content=b"x", headers={"Content-Type": "image/jpeg"})
+        assert response.status_code == 403, response.status_code
+        response = await http.put(f"{url.path}?{url.query}", content=b"x",
+                                  headers={"Content-Type": "image/png", "Content-Length": "abc"})
+        assert response.status_code == 400, response.status_code
+
+        # objects only go into fields of their kind
+        response = await http.post("/api/jobs/video", data={"starting_image_object": video, "custom_prompt": ""})
+        assert response.status_code == 400, response.text
+        response = await http.post("/api/gemini/extract-context", data={"video_object": image})
+        assert response.status_code == 400, response.text
+
+        # an image object runs through the whole job
+        response = await http.post("/api/jobs/video", data={"starting_image_object": image, "custom_prompt": ""})
+        assert response.status_code == 200, response.text
+        status = await wait_for_job(http, response.json()["job_id"])
+        assert status == 200, status
+
+    print("ok: direct uploads, signed URL checks and object kinds")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
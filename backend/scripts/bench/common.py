@@ -0,0 +1,87 @@
+"""
+Shared setup for the benchmark scripts in this folder.
+Import this before anything from the backend so the backend package is importable and
+the required settings have harmless defaults (no real project or bucket is contacted).
+
+The helpers below run the FastAPI app in-process against a fake Vertex client, so each
+benchmark only has to describe its load and its metrics.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "bench-project")
+os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "us-central1")
+os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "true")
+
+DEFAULT_PROMPT = "the ball rolls along the arrow"
+# Status poller interval with fast_poll: fake operations finish right away
+FAST_POLL_INTERVAL = 0.05
+
+
+@asynccontextmanager
+async def app_client(vertex_client, fast_poll: bool = True, **job_service_options):
+    """
+    Point the app's services at `vertex_client`, run the app's lifespan and yield an
+    httpx client that calls it in-process. `job_service_options` go to JobService, which
+    uses the app's storage service unless one is given. With `fast_poll` the status poller
+    checks operations every FAST_POLL_INTERVAL instead of on the production schedule.
+    """
+    # Imported here so benchmarks that never start the app (startup time) don't load it
+    import httpx
+
+    import server
+    from services.job_service import JobService
+    from services.vertex_service import VertexService
+    from utils.env import settings
+
+    if fast_poll:
+        settings.JOB_POLL_MIN_INTERVAL = settings.JOB_POLL_MAX_INTERVAL = settings.JOB_POLL_TICK = FAST_POLL_INTERVAL
+    job_service_options.setdefault("storage_service", server.storage_service)
+    server.vertex_service = VertexService(client=vertex_client)
+    server.job_service = JobService(server.vertex_service, **job_service_options)
+    async with server.lifespan(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+            yield http
+
+
+async def submit_job(http, files: dict, custom_prompt: str = DEFAULT_PROMPT):
+    """POST /api/jobs/video; the response, whether it was accepted or not"""
+    return await http.post(
+        "/api/jobs/video",
+        files=files,
+        data={"global_context": "", "custom_prompt": custom_prompt},
+    )
+
+
+async def wait_for_job(http, job_id: str, interval: float = 0.05, timeout: float = 300.0) -> int:
+    """Poll a job until it has finished; the status code of its final status response"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = await http.get(f"/api/jobs/video/{job_id}")
+        if response.status_code != 202:
+            return response.status_code
+        await asyncio.sleep(interval)
+    raise TimeoutError(f"job {job_id} still running after {timeout:.0f}s")
+
+
+async def submit_and_wait(http, files: dict, custom_prompt: str = DEFAULT_PROMPT, interval: float = 0.05) -> tuple:
+    """
+    Submit a job and wait for it to finish: (status code, seconds). The status code is
+    the final status response's, or the submission's if the job wasn't accepted.
+    """
+    start = time.perf_counter()
+    response = await submit_job(http, files, custom_prompt)
+    if response.status_code != 200:
+        return response.status_code, time.perf_counter() - start
+    status = await wait_for_job(http, response.json()["job_id"], interval)
+    return status, time.perf_counter() - start
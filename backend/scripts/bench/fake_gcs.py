@@ -0,0 +1,236 @@
+"""
+Minimal in-memory stand-in for the Cloud Storage JSON API, for benchmarks.
+Implements what StorageService uses: bucket metadata, multipart and resumable uploads,
+compose, object metadata / ACL patch / delete, and path-style downloads and uploads (what
+signed URLs point at; signatures are not checked). Point the client at it
+with STORAGE_EMULATOR_HOST (see FakeGCSServer.url).
+
+connect_latency: seconds added when a client opens a connection (think TLS handshake)
+request_latency: seconds added to every request (think round trip to the region)
+bandwidth: bytes per second a single connection uploads at (None = unlimited)
+uniform_access: reject per-object ACLs like a bucket with uniform bucket-level access
+"""
+
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import google_crc32c
+
+
+class FakeGCSServer:
+    def __init__(self, bucket: str, connect_latency: float = 0.0, request_latency: float = 0.0, uniform_access: bool = True,
+                 bandwidth: float = None):
+        self.bucket = bucket
+        self.connect_latency = connect_latency
+        self.request_latency = request_latency
+        self.uniform_access = uniform_access
+        self.bandwidth = bandwidth
+        self.objects: dict[str, dict] = {}
+        self.sessions: dict[str, dict] = {}
+        self.connections = 0
+        self.requests = 0
+        self.failed_acl_calls = 0
+        self.lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def __enter__(self) -> "FakeGCSServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def resource(self, name: str) -> dict:
+        obj = self.objects[name]
+        data = obj["data"]
+        return {
+            "kind": "storage#object",
+            "bucket": self.bucket,
+            "name": name,
+            "id": f"{self.bucket}/{name}/1",
+            "generation": "1",
+            "metageneration": "1",
+            "size": str(len(data)),
+            "contentType": obj.get("contentType") or "application/octet-stream",
+            "cacheControl": obj.get("cacheControl"),
+            "md5Hash": base64.b64encode(hashlib.md5(data).digest()).decode(),
+            "crc32c": base64.b64encode(google_crc32c.Checksum(data).digest()).decode(),
+            "acl": obj.get("acl", []),
+        }
+
+    def store(self, metadata: dict, data: bytes, predefined_acl: str = None) -> dict:
+        with self.lock:
+            self.objects[metadata["name"]] = {
+                "data": data,
+                "contentType": metadata.get("contentType"),
+                "cacheControl": metadata.get("cacheControl"),
+                "acl": [{"entity": "allUsers", "role": "READER"}] if predefined_acl == "publicRead" else [],
+            }
+            return self.resource(metadata["name"])
+
+
+def _handler(server: FakeGCSServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            server.connections += 1
+            time.sleep(server.connect_latency)
+
+        def log_message(self, *args):
+            pass
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def _send(self, status: int, payload=None, headers: dict = None, raw: bytes = None):
+            body = raw if raw is not None else (json.dumps(payload).encode() if payload is not None else b"")
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            if raw is None and payload is not None:
+                self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status: int, message: str):
+            self._send(status, {"error": {"code": status, "message": message}})
+
+        def _route(self, method: str):
+            server.requests += 1
+            time.sleep(server.request_latency)
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            path = url.path
+            body = self._body() if method in ("POST", "PUT", "PATCH") else b""
+            if server.bandwidth:
+                time.sleep(len(body) / server.bandwidth)
+
+            if path == f"/storage/v1/b/{server.bucket}" and method == "GET":
+                return self._send(200, {
+                    "kind": "storage#bucket",
+                    "name": server.bucket,
+                    "iamConfiguration": {"uniformBucketLevelAccess": {"enabled": server.uniform_access}},
+                })
+
+            if path == f"/upload/storage/v1/b/{server.bucket}/o":
+                if "upload_id" in query:
+                    return self._resumable_chunk(query["upload_id"], body)
+                if query.get("uploadType") == "multipart":
+                    message = BytesParser(policy=HTTP).parsebytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+                    )
+                    metadata_part, media_part = list(message.iter_parts())
+                    metadata = json.loads(metadata_part.get_payload(decode=True))
+                    if query.get("predefinedAcl") and server.uniform_access:
+                        return self._error(400, "Cannot use ACL API to set object policy when uniform bucket-level access is enabled")
+                    return self._send(200, server.store(metadata, media_part.get_payload(decode=True), query.get("predefinedAcl")))
+                if query.get("uploadType") == "resumable":
+                    if query.get("predefinedAcl") and server.uniform_access:
+                        return self._error(400, "Cannot use ACL API to set object policy when uniform bucket-level access is enabled")
+                    upload_id = uuid.uuid4().hex
+                    server.sessions[upload_id] = {
+                        "metadata": json.loads(body or b"{}"), "data": bytearray(), "acl": query.get("predefinedAcl")
+                    }
+                    location = f"{server.url}/upload/storage/v1/b/{server.bucket}/o?uploadType=resumable&upload_id={upload_id}"
+                    return self._send(200, headers={"Location": location})
+
+            match = re.fullmatch(rf"/storage/v1/b/{re.escape(server.bucket)}/o/(.+?)(/compose|/acl)?", path)
+            if match:
+                name = unquote(match.group(1))
+                if match.group(2) == "/compose" and method == "POST":
+                    request = json.loads(body)
+                    try:
+                        data = b"".join(server.objects[source["name"]]["data"] for source in request["sourceObjects"])
+                    except KeyError:
+                        return self._error(404, "source object not found")
+                    metadata = {**request.get("destination", {}), "name": name}
+                    return self._send(200, server.store(metadata, data))
+                if name not in server.objects:
+                    return self._error(404, "No such object")
+                if match.group(2) == "/acl" or method == "PATCH":
+                    if server.uniform_access:
+                        server.failed_acl_calls += 1
+                        return self._error(400, "Cannot use ACL API when uniform bucket-level access is enabled")
+                    if method == "GET":
+                        return self._send(200, {"kind": "storage#objectAccessControls", "items": server.objects[name].get("acl", [])})
+                if method == "GET":
+                    return self._send(200, server.resource(name))
+                if method == "DELETE":
+                    with server.lock:
+                        server.objects.pop(name, None)
+                    return self._send(204)
+                if method == "PATCH":
+                    server.objects[name]["acl"] = json.loads(body).get("acl", [])
+                    return self._send(200, server.resource(name))
+
+            match = re.fullmatch(rf"/download/storage/v1/b/{re.escape(server.bucket)}/o/(.+)", path)
+            if match and method == "GET":
+                obj = server.objects.get(unquote(match.group(1)))
+                if obj is None:
+                    return self._error(404, "No such object")
+                return self._send(200, raw=obj["data"], headers={"Content-Type": obj.get("contentType") or "application/octet-stream"})
+
+            match = re.fullmatch(rf"/{re.escape(server.bucket)}/(.+)", path)
+            if match and method == "PUT":
+                size_range = self.headers.get("x-goog-content-length-range")
+                if size_range and not int(size_range.split(",")[0]) <= len(body) <= int(size_range.split(",")[1]):
+                    return self._error(400, "EntityTooLarge")
+                metadata = {"name": unquote(match.group(1)), "contentType": self.headers.get("Content-Type")}
+                server.store(metadata, body)
+                return self._send(200)
+            if match and method == "GET":
+                obj = server.objects.get(unquote(match.group(1)))
+                if obj is None:
+                    return self._error(404, "No such object")
+                return self._send(200, raw=obj["data"], headers={"Content-Type": obj.get("contentType") or "application/octet-stream"})
+
+            self._error(404, f"{method} {path} not implemented by the fake")
+
+        def _resumable_chunk(self, upload_id: str, body: bytes):
+            session = server.sessions.get(upload_id)
+            if session is None:
+                return self._error(404, "No such upload")
+            session["data"] += body
+            # "bytes 0-1023/*" (or ".../2048" once the size is known) while more is coming,
+            # "bytes 1024-2047/2048" (or "bytes */2048") on the last chunk
+            total = (self.headers.get("Content-Range") or "").rpartition("/")[2]
+            if total == "*" or len(session["data"]) < int(total):
+                return self._send(308, headers={"Range": f"bytes=0-{len(session['data']) - 1}"})
+            del server.sessions[upload_id]
+            return self._send(200, server.store(session["metadata"], bytes(session["data"]), session["acl"]))
+
+        def do_GET(self):
+            self._route("GET")
+
+        def do_POST(self):
+            self._route("POST")
+
+        def do_PUT(self):
+            self._route("PUT")
+
+        def do_PATCH(self):
+            self._route("PATCH")
+
+        def do_DELETE(self):
+            self._route("DELETE")
+
+    return Handler
@@ -0,0 +1,148 @@
+"""
+Fake google-genai client for benchmarks.
+Mimics the parts of genai.Client that VertexService uses, with a fixed latency per call
+and no network access.
+"""
+
+import asyncio
+import base64
+import io
+import os
+import random
+import time
+import uuid
+from types import SimpleNamespace
+
+from PIL import Image
+
+from google.genai import errors as genai_errors
+from google.genai.types import (
+    Blob,
+    Candidate,
+    Content,
+    GenerateContentResponse,
+    GeneratedVideo,
+    GenerateVideosOperation,
+    GenerateVideosResponse,
+    Part,
+    Video,
+)
+
+# Smallest valid PNG (1x1 red pixel), returned as the "cleaned" frame
+FAKE_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=="
+)
+
+
+def unique_png(width: int = 64, height: int = 36) -> bytes:
+    """PNG of random pixels: a different frame every call, also after normalization re-encodes it"""
+    output = io.BytesIO()
+    Image.frombytes("RGB", (width, height), os.urandom(width * height * 3)).save(output, format="PNG")
+    return output.getvalue()
+
+
+class FakeVertexClient:
+    """
+    Stand-in for genai.Client.
+
+    latency: seconds every call takes
+    video_seconds: how long a Veo operation stays "running" after it was started
+    blocking: sleep with time.sleep instead of asyncio.sleep, which reproduces the old
+              behaviour of calling the synchronous SDK from inside async code
+    upload_bandwidth: bytes per second for inline request data, adds to the latency (None = free)
+    text: reply to text prompts
+    image_latency: seconds a call that returns an image takes (defaults to latency)
+    failure_rate: fraction of calls that fail with one of failure_codes (after their latency)
+    slow_rate: fraction of calls that take slow_latency instead, for a latency tail
+    video_data: video returned inline when generate_videos gets no output_gcs_uri, like Veo does
+    video_failure_rate: fraction of Veo operations that finish with an error instead of a video
+    """
+
+    def __init__(self, latency: float = 1.0, video_seconds: float = 0.0, blocking: bool = False,
+                 upload_bandwidth: float = None, text: str = "An arrow sweeps from left to right across the frame.",
+                 image_latency: float = None, failure_rate: float = 0.0, failure_codes: tuple = (429, 503),
+                 slow_rate: float = 0.0, slow_latency: float = 10.0, video_data: bytes = b"\x00" * 1024,
+                 video_failure_rate: float = 0.0):
+        self.latency = latency
+        self.image_latency = latency if image_latency is None else image_latency
+        self.video_seconds = video_seconds
+        self.blocking = blocking
+        self.upload_bandwidth = upload_bandwidth
+        self.text = text
+        self.failure_rate = failure_rate
+        self.failure_codes = failure_codes
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.video_data = video_data
+        self.video_failure_rate = video_failure_rate
+        self.calls = 0
+        self.failures = 0
+        self.bytes_sent = 0
+        self._operations: dict[str, float] = {}
+        self._inline_operations: set[str] = set()
+        self._failed_operations: set[str] = set()
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(
+                generate_content=self._generate_content,
+                generate_videos=self._generate_videos,
+            ),
+            operations=SimpleNamespace(get=self._get_operation),
+        )
+
+    async def _wait(self, sent: int = 0, latency: float = None):
+        self.calls += 1
+        self.bytes_sent += sent
+        latency = self.latency if latency is None else latency
+        if random.random() < self.slow_rate:
+            latency = self.slow_latency
+        if self.upload_bandwidth:
+            latency += sent / self.upload_bandwidth
+        if self.blocking:
+            time.sleep(latency)
+        else:
+            await asyncio.sleep(latency)
+        if random.random() < self.failure_rate:
+            self.failures += 1
+            code = random.choice(self.failure_codes)
+            error_class = genai_errors.ClientError if code < 500 else genai_errors.ServerError
+            raise error_class(code, {"error": {"code": code, "message": "injected failure", "status": "UNAVAILABLE"}})
+
+    async def _generate_content(self, model: str, contents, config=None) -> GenerateContentResponse:
+        sent = sum(len(part.inline_data.data) for part in contents if isinstance(part, Part) and part.inline_data)
+        modalities = (config.response_modalities if config is not None else None) or ["TEXT"]
+        await self._wait(sent, self.image_latency if "IMAGE" in modalities else self.latency)
+        parts = []
+        if "TEXT" in modalities:
+            parts.append(Part(text=self.text))
+        if "IMAGE" in modalities:
+            parts.append(Part(inline_data=Blob(data=FAKE_PNG, mime_type="image/png")))
+        return GenerateContentResponse(candidates=[Candidate(content=Content(role="model", parts=parts))])
+
+    async def _generate_videos(self, model: str, prompt: str, image=None, config=None) -> GenerateVideosOperation:
+        await self._wait()
+        name = f"projects/bench/operations/{uuid.uuid4()}"
+        self._operations[name] = time.monotonic()
+        if config is None or not config.output_gcs_uri:
+            self._inline_operations.add(name)
+        if random.random() < self.video_failure_rate:
+            self._failed_operations.add(name)
+        return GenerateVideosOperation(name=name)
+
+    async def _get_operation(self, operation: GenerateVideosOperation) -> GenerateVideosOperation:
+        await self._wait()
+        started = self._operations.get(operation.name, 0.0)
+        if time.monotonic() - started < self.video_seconds:
+            return GenerateVideosOperation(name=operation.name, done=False)
+        if operation.name in self._failed_operations:
+            return GenerateVideosOperation(
+                name=operation.name, done=True, error={"code": 3, "message": "injected video failure"}
+            )
+        if operation.name in self._inline_operations:
+            video = Video(video_bytes=self.video_data, mime_type="video/mp4")
+        else:
+            video = Video(uri=f"gs://bench/videos/{uuid.uuid4()}.mp4")
+        return GenerateVideosOperation(
+            name=operation.name,
+            done=True,
+            result=GenerateVideosResponse(generated_videos=[GeneratedVideo(video=video)]),
+        )
@@ -0,0 +1,71 @@
+"""
+Import-time profile of the API: runs `python -X importtime -c "import server"` in a fresh
+interpreter and reports the total, the slowest packages (self time summed per package) and
+what each of the module's own imports costs (cumulative).
+
+Usage (from backend/):
+    python scripts/bench/profile_imports.py --top 15
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+import common  # noqa: F401  (sets up sys.path and settings defaults)
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+# Namespace packages whose subpackages are separate distributions
+NAMESPACES = {"google"}
+
+
+def package(name: str) -> str:
+    parts = name.split(".")
+    return ".".join(parts[:2]) if parts[0] in NAMESPACES and len(parts) > 1 else parts[0]
+
+
+def profile(module: str) -> list[tuple[int, int, int, str]]:
+    """(self us, cumulative us, depth, name) per imported module, in import order"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=common.BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in output.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="server", help="module to import")
+    parser.add_argument("--top", type=int, default=15, help="rows per table")
+    args = parser.parse_args()
+
+    rows = profile(args.module)
+    # children are listed before their parent; anything before that belongs to interpreter startup
+    end = next(index for index, (_, _, depth, name) in enumerate(rows) if name == args.module and depth == 0)
+    start = next((index + 1 for index in range(end - 1, -1, -1) if rows[index][2] == 0), 0)
+    rows = rows[start:end + 1]
+    total_us = rows[-1][1]
+    by_package = defaultdict(int)
+    for self_us, _, _, name in rows:
+        by_package[package(name)] += self_us
+    # the module's own imports, cumulative
+    direct = [(cumulative, name) for _, cumulative, depth, name in rows if depth == 1]
+
+    print(f"\nimport {args.module}: {total_us / 1000:.0f} ms, {len(rows)} modules")
+    print(f"\n{'package':<32}{'self (ms)':>11}{'share':>8}")
+    for name, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<32}{self_us / 1000:>11.1f}{self_us / total_us:>8.1%}")
+    print(f"\n{'imported by ' + args.module:<32}{'cumulative (ms)':>17}")
+    for cumulative, name in sorted(direct, reverse=True)[:args.top]:
+        print(f"{name:<32}{cumulative / 1000:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,80 @@
 from fastapi import FastAPI, Request, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from contextlib import asynccontextmanager
-from services.storage_service import StorageService
+from models.media import MediaHandle
+from services.storage_service import FILES_ROUTE, LocalStorageService, create_storage_service
 from services.vertex_service import VertexService
 from services.job_service import JobService
-from services.video_merge_service import VideoMergeService
+from services.video_merge_service import VideoMergeService, OUTPUT_FORMATS
+from services.merge_scheduler import MergeQueueFullError
+from services.resilience import CircuitOpenError
+from utils import ffmpeg
 from utils.env import settings
-from typing import Optional
+from typing import BinaryIO, Optional
+import asyncio
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
 import traceback
 
-# Initialize services
-storage_service = StorageService()
+# Chunk size for copying uploads to disk
+UPLOAD_COPY_CHUNK_BYTES = 1024 * 1024
+
+# Initialize services. Construction is cheap: SDK clients are created and ffmpeg is looked
+# up on first use, or in the background right after startup (STARTUP_WARMUP)
+storage_service = create_storage_service()
 vertex_service = VertexService()
-job_service = JobService(vertex_service)
+job_service = JobService(vertex_service, storage_service=storage_service)
 video_merge_service = VideoMergeService(storage_service)
 
+def save_upload(source: BinaryIO, path: str):
+    """Copy an uploaded file to `path` in chunks instead of reading it into memory"""
+    with open(path, "wb") as destination:
+        shutil.copyfileobj(source, destination, UPLOAD_COPY_CHUNK_BYTES)
+
+
+def read_files(paths: list[str]) -> list[bytes]:
+    contents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    return contents
+
+
+async def warm_up():
+    """Create the SDK clients and look up ffmpeg, so the first requests that need them don't wait"""
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        storage_service.start(),
+        vertex_service.warm_up(),
+        video_merge_service.warm_up(),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"[ERROR] Warm-up: {result}")
+    print(f"   Warm-up finished in {time.perf_counter() - start:.2f}s")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("🚀 FlowBoard API starting...")
     print(f"   Project: {settings.GOOGLE_CLOUD_PROJECT}")
     print(f"   Location: {settings.GOOGLE_CLOUD_LOCATION}")
+    await job_service.start()
+    # In the background: requests are served while it runs
+    warm_up_task = asyncio.create_task(warm_up()) if settings.STARTUP_WARMUP else None
     yield
     # Shutdown
+    if warm_up_task:
+        warm_up_task.cancel()
+    await job_service.stop()
+    await video_merge_service.clip_cache.close()
     print("👋 FlowBoard API shutting down...")
 
 app = FastAPI(
@@ -62,33 +113,157 @@ async def test_route():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/redis")
+async def redis_health_check():
+    """Check that the job store (Redis when configured) is reachable"""
+    if await job_service.redis_health_check():
+        return {"status": "healthy"}
+    return JSONResponse(status_code=500, content={"status": "unhealthy"})
+
+@app.get("/internal/stats")
+async def internal_stats():
+    """Internal counters for sizing and debugging"""
+    return {
+        "jobs": await job_service.get_stats(),
+        "frame_cache": vertex_service.frame_cache.get_stats(),
+        "analysis_cache": vertex_service.analysis_cache.get_stats(),
+        "vertex": vertex_service.get_stats(),
+        "image_normalizer": job_service.image_normalizer.get_stats(),
+        "merge": video_merge_service.get_stats(),
+        "storage": storage_service.get_stats(),
+    }
+
 
 # ============== Jobs Routes ==============
 
 @app.post("/api/jobs/video")
 async def add_video_job(
     request: Request,
-    files: UploadFile = File(...),
+    files: Optional[UploadFile] = File(None),
     ending_image: Optional[UploadFile] = File(None),
+    base_layer: Optional[UploadFile] = File(None),
+    annotation_layer: Optional[UploadFile] = File(None),
+    ending_base_layer: Optional[UploadFile] = File(None),
+    starting_image_object: Optional[str] = Form(None),
+    ending_image_object: Optional[str] = Form(None),
+    base_layer_object: Optional[str] = Form(None),
+    annotation_layer_object: Optional[str] = Form(None),
+    ending_base_layer_object: Optional[str] = Form(None),
     global_context: str = Form(""),
     custom_prompt: str = Form("")
 ):
-    """Start a video generation job"""
-    starting_image_data = await files.read()
-    ending_image_data = await ending_image.read() if ending_image else None
+    """
+    Start a video generation job.
+    `files` is the flattened starting frame. Canvas layers can be sent instead of / next to it:
+    `base_layer` (artwork without annotations) plus `annotation_layer` (transparent overlay),
+    and `ending_base_layer` for the ending frame. Clean layers skip the Gemini cleanup step.
+    Each image can instead be uploaded to the bucket first (POST /api/uploads) and passed as
+    `<field>_object` (`starting_image_object` for `files`); the job reads it from there.
+    """
+    uploads = {
+        "starting_image": files,
+        "ending_image": ending_image,
+        "base_layer": base_layer,
+        "annotation_layer": annotation_layer,
+        "ending_base_layer": ending_base_layer,
+    }
+    objects = {
+        "starting_image": starting_image_object,
+        "ending_image": ending_image_object,
+        "base_layer": base_layer_object,
+        "annotation_layer": annotation_layer_object,
+        "ending_base_layer": ending_base_layer_object,
+    }
+    objects = {field: name for field, name in objects.items() if name}
+    for field, name in objects.items():
+        if uploads[field] is not None:
+            raise HTTPException(status_code=400, detail=f"Send {field} as a file or as an object, not both")
+        try:
+            storage_service.validate_upload_object(name, "image")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    sent = {field for field, upload in uploads.items() if upload is not None} | set(objects)
+    if "starting_image" not in sent and "base_layer" not in sent:
+        raise HTTPException(status_code=400, detail="files or base_layer is required")
+    if "annotation_layer" in sent and "base_layer" not in sent:
+        raise HTTPException(status_code=400, detail="annotation_layer requires base_layer")
+
+    async def read(upload: Optional[UploadFile]) -> Optional[MediaHandle]:
+        # Big images wait for the job in temp files (MEDIA_SPOOL_THRESHOLD_BYTES)
+        return await asyncio.to_thread(MediaHandle.from_file, upload.file) if upload else None
     
     from models.job import VideoJobRequest
     data = VideoJobRequest(
-        starting_image=starting_image_data,
-        ending_image=ending_image_data,
+        starting_image=await read(files),
+        ending_image=await read(ending_image),
+        base_layer=await read(base_layer),
+        annotation_layer=await read(annotation_layer),
+        ending_base_layer=await read(ending_base_layer),
+        objects=objects or None,
         global_context=global_context,
         custom_prompt=custom_prompt
     )
     
+    try:
+        job_service.check_upstreams(data)
+    except CircuitOpenError as e:
+        # quota exhausted / model down: fail fast instead of queueing work that can't succeed
+        data.release()
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(e)},
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
     job_id = await job_service.create_video_job(data)
     return {"job_id": job_id}
 
 
+@app.get("/api/jobs/video/events")
+async def stream_video_job_events(job_ids: str):
+    """
+    Server-Sent Events stream of status transitions for one or more jobs.
+    Query: job_ids=<id>[,<id>...]
+    Sends the current state of every job first, then each pending -> generating -> done/error
+    transition as it happens. The stream closes once every job has finished.
+    """
+    ids = list(dict.fromkeys(job_id for job_id in job_ids.split(",") if job_id))
+    if not ids:
+        raise HTTPException(status_code=400, detail="job_ids is required")
+
+    # Subscribe before reading the snapshot so no transition can slip in between
+    queue = job_service.subscribe(ids)
+
+    async def event_stream():
+        try:
+            remaining = set(ids)
+            for job_id in ids:
+                event = await job_service.get_job_event(job_id) or {"job_id": job_id, "status": "not_found"}
+                if event["status"] in ("done", "error", "not_found"):
+                    remaining.discard(job_id)
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+
+            while remaining:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None or event["job_id"] not in remaining:
+                    continue
+                if event["status"] in ("done", "error"):
+                    remaining.discard(event["job_id"])
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+        finally:
+            job_service.unsubscribe(ids, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/jobs/video/{job_id}")
 async def get_video_job_status(job_id: str):
     """Get status of a video generation job"""
@@ -156,15 +331,89 @@ async def merge_videos(request: Request):
         
         if len(video_urls) < 2:
             raise HTTPException(status_code=400, detail="At least 2 video URLs required")
+
+        # "hls" returns a playlist URL that is playable before the whole merge is uploaded
+        output_format = body.get("format", "mp4")
+        if output_format not in OUTPUT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(OUTPUT_FORMATS)}")
         
         # Use a generic user_id for storage path
-        merged_video_url = await video_merge_service.merge_videos(video_urls, "anonymous")
-        return {"video_url": merged_video_url}
+        merged_video_url = await video_merge_service.merge_videos(video_urls, "anonymous", output_format)
+        return {"video_url": merged_video_url, "format": output_format}
+    except HTTPException:
+        raise
+    except MergeQueueFullError as e:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(e)},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ============== Upload Routes ==============
+
+@app.post("/api/uploads")
+async def create_upload(request: Request):
+    """
+    Signed URLs for uploading a file straight to the bucket.
+    Body: {"content_type": "image/png"}
+    PUT the file to `upload_url` with `upload_headers`, then pass `object` to
+    /api/jobs/video (`<field>_object`) or /api/gemini/extract-context (`video_object`).
+    """
+    try:
+        body = await request.json()
+        return await storage_service.create_upload(body.get("content_type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============== Local Storage Routes ==============
+
+@app.api_route(FILES_ROUTE + "/{item_name:path}", methods=["GET", "HEAD"])
+async def get_file(item_name: str):
+    """Objects of the local storage backend (what its public URLs point at)"""
+    info = storage_service.file_info(item_name) if isinstance(storage_service, LocalStorageService) else None
+    if info is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    path, content_type, cache_control = info
+    # FileResponse sends the file with sendfile where the server supports it, and handles Range requests
+    return FileResponse(path, media_type=content_type, headers={"Cache-Control": cache_control} if cache_control else None)
+
+
+@app.put(FILES_ROUTE + "/{item_name:path}")
+async def put_file(item_name: str, request: Request, expires: int = 0, signature: str = ""):
+    """Direct uploads to the local storage backend, at the URLs /api/uploads signs"""
+    if not isinstance(storage_service, LocalStorageService) or not storage_service.verify_upload(item_name, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired upload URL")
+    # Like a GCS V4 signed URL, the URL is only valid with the content type it was created for
+    content_type = storage_service.upload_content_type(item_name)
+    if request.headers.get("content-type") != content_type:
+        raise HTTPException(status_code=403, detail=f"This upload URL requires Content-Type: {content_type}")
+    try:
+        content_length = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if content_length > settings.STORAGE_UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+    async def body():
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > settings.STORAGE_UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Upload too large")
+            yield chunk
+
+    await storage_service.upload_stream(item_name, body(), content_type)
+    return Response(status_code=200)
+
+
 # ============== Gemini Routes ==============
 
 @app.post("/api/gemini/image")
@@ -195,39 +444,87 @@ async def generate_image(
 @app.post("/api/gemini/extract-context")
 async def extract_context(
     request: Request,
-    video: UploadFile = File(...)
+    video: Optional[UploadFile] = File(None),
+    video_object: Optional[str] = Form(None)
 ):
-    """Extract context from video using Gemini"""
+    """
+    Extract context from video using Gemini.
+    The video is either uploaded here or, for large files, uploaded to the bucket first
+    (POST /api/uploads) and passed as `video_object`.
+    Bucket objects are sent to Gemini by reference. Anything else would be sent inline, so
+    videos of at least CONTEXT_KEYFRAME_MIN_BYTES are spooled to a temp file (objects on local
+    storage are read in place) and only a few downscaled scene keyframes are sent; smaller
+    ones, and videos no frames could be extracted from, are sent whole.
+    """
+    if (video is None) == (video_object is None):
+        raise HTTPException(status_code=400, detail="Send exactly one of video or video_object")
+    if video_object is not None:
+        try:
+            storage_service.validate_upload_object(video_object, "video")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        video_data = await video.read()
-        
-        prompt = (
-            "Extract structured scene information from this video.\n"
-            "Respond with ONLY valid JSON. No explanations, no markdown, no backticks.\n"
-            "Follow this exact structure, keys required:\n"
-            "{\n"
-            '  "entities": [\n'
-            '    { "id": "id-1", "description": "...", "appearance": "..." }\n'
-            "  ],\n"
-            '  "environment": "...",\n'
-            '  "style": "..."\n'
-            "}\n"
-            "If information is missing, use empty strings.\n"
-        )
-        
-        import json as pyjson
-        
-        # Create a simple object to hold video data
-        class VideoData:
-            def __init__(self, data):
-                self.data = data
-        
-        res = vertex_service.analyze_video_content(
-            prompt=prompt,
-            video_data=VideoData(video_data)
-        )
-        
-        raw = res.text or res.candidates[0].content.parts[0].text
+        with tempfile.TemporaryDirectory(prefix="flowboard-context-") as work_dir:
+            video_path = os.path.join(work_dir, "upload.mp4")
+            # Gemini can read a bucket object itself, so its bytes never pass through here
+            video_uri = storage_service.gs_uri(video_object) if video_object is not None else None
+            local_path = storage_service.local_path(video_object) if video_object is not None else None
+            if video is not None:
+                await asyncio.to_thread(save_upload, video.file, video_path)
+            elif local_path:
+                video_path = local_path
+            elif not video_uri:
+                await storage_service.download_to_path(video_object, video_path)
+
+            frames = []
+            # Keyframes replace uploading the whole video with decoding it, which only pays off
+            # for big videos (bench_extract_context: ~0.9s to decode 12s of 720p)
+            if (not video_uri and video_merge_service.ffmpeg_available
+                    and os.path.getsize(video_path) >= settings.CONTEXT_KEYFRAME_MIN_BYTES):
+                try:
+                    frame_paths = await ffmpeg.extract_keyframes(
+                        video_path, work_dir,
+                        count=settings.CONTEXT_KEYFRAME_COUNT,
+                        width=settings.CONTEXT_KEYFRAME_WIDTH,
+                        threshold=settings.CONTEXT_SCENE_THRESHOLD
+                    )
+                    frames = await asyncio.to_thread(read_files, frame_paths)
+                except Exception as e:
+                    print(f"[ERROR] Keyframe extraction failed, sending the whole video: {e}")
+
+            if frames:
+                source = f"these {len(frames)} keyframes of one video (in chronological order)"
+            else:
+                source = "this video"
+            prompt = (
+                f"Extract structured scene information from {source}.\n"
+                "Respond with ONLY valid JSON. No explanations, no markdown, no backticks.\n"
+                "Follow this exact structure, keys required:\n"
+                "{\n"
+                '  "entities": [\n'
+                '    { "id": "id-1", "description": "...", "appearance": "..." }\n'
+                "  ],\n"
+                '  "environment": "...",\n'
+                '  "style": "..."\n'
+                "}\n"
+                "If information is missing, use empty strings.\n"
+            )
+
+            if frames:
+                raw = await vertex_service.analyze_video_keyframes(prompt=prompt, frames=frames)
+            elif video_uri:
+                raw = await vertex_service.analyze_video_content(
+                    prompt=prompt,
+                    video_uri=video_uri,
+                    mime_type=storage_service.upload_content_type(video_object)
+                )
+            elif local_path:
+                video_data = await storage_service.download_file(video_object)
+                raw = await vertex_service.analyze_video_content(prompt=prompt, video_data=video_data)
+            else:
+                video_data = (await asyncio.to_thread(read_files, [video_path]))[0]
+                raw = await vertex_service.analyze_video_content(prompt=prompt, video_data=video_data)
         
         # Strip markdown if present
         cleaned = raw.strip()
@@ -239,13 +536,15 @@ async def extract_context(
         cleaned = cleaned.strip()
         
         try:
-            parsed = pyjson.loads(cleaned)
+            parsed = json.loads(cleaned)
             return parsed
         except Exception:
             raise HTTPException(status_code=500, detail=f"Failed to parse JSON: {raw}")
         
     except HTTPException:
         raise
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
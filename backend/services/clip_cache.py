@@ -0,0 +1,175 @@
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Optional
+from utils.cache import DiskCache
+from utils.env import settings
+import asyncio
+import hashlib
+import os
+import tempfile
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class ClipCache:
+    """
+    Local disk LRU of source clips for merging, keyed by URL + object version
+    (GCS generation, falling back to ETag / Last-Modified).
+    Re-merging a storyboard after changing one frame only downloads the changed clip;
+    everything else is served from disk and handed to ffmpeg as local files.
+    Clips without a version can't be reused, so they are downloaded to the caller's scratch
+    directory instead of taking up room in the cache.
+
+    resolve_local maps a URL to a file already on this machine (local storage backend);
+    such clips are handed to ffmpeg in place instead of being downloaded and cached.
+    """
+
+    def __init__(self, resolve_local: Optional[Callable[[str], Optional[str]]] = None):
+        self.disk = DiskCache(settings.CLIP_CACHE_DIR, settings.CLIP_CACHE_MAX_BYTES)
+        self.resolve_local = resolve_local
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._semaphore = asyncio.Semaphore(settings.CLIP_PREFETCH_CONCURRENCY)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.bytes_downloaded = 0
+        self.bytes_saved = 0
+        self.local_clips = 0
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        # Created on first use so it binds to the running event loop (and httpx isn't imported at startup)
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=settings.CLIP_PREFETCH_CONCURRENCY * 2),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @asynccontextmanager
+    async def checkout(self, urls: list[str], scratch_dir: str,
+                       versions: Optional[list[Optional[str]]] = None) -> AsyncIterator[list[str]]:
+        """
+        Local paths for `urls`, in order. Missing clips are downloaded concurrently.
+        Pass `versions` (from versions()) to skip looking them up again.
+        The cached files are pinned (not evictable) until the block exits; unversioned clips
+        are written to `scratch_dir`, which the caller cleans up.
+        """
+        if versions is None:
+            versions = await self.versions(urls)
+        paths: list[Optional[str]] = [self._local_path(url) for url in urls]
+        fetches = {}
+        for index, (url, version) in enumerate(zip(urls, versions)):
+            if paths[index] is not None:
+                continue
+            if version is None:
+                # Without a validator we can't tell if the object changed, so it's never reused
+                paths[index] = os.path.join(scratch_dir, f"source-{index}.mp4")
+                fetches[index] = self._stream(url, paths[index])
+            else:
+                fetches[index] = self._fetch(url, version)
+        results = await asyncio.gather(*fetches.values(), return_exceptions=True)
+        keys = [result for result in results if isinstance(result, str)]
+        try:
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if errors:
+                raise errors[0]
+            for index, result in zip(fetches, results):
+                if isinstance(result, str):
+                    paths[index] = self.disk.path(result)
+            self.local_clips += len(urls) - len(fetches)
+            yield paths
+        finally:
+            for key in keys:
+                self.disk.unpin(key)
+
+    def _local_path(self, url: str) -> Optional[str]:
+        return self.resolve_local(url) if self.resolve_local else None
+
+    async def version(self, url: str) -> Optional[str]:
+        """
+        Current version of the object behind a URL, None if the server gives no validator
+        or refuses HEAD (e.g. a signed URL that is only valid for GET)
+        """
+        local_path = self._local_path(url)
+        if local_path:
+            stat = await asyncio.to_thread(os.stat, local_path)
+            return f"{stat.st_mtime_ns}-{stat.st_size}"
+        async with self._semaphore:
+            response = await self.client.head(url)
+        if not response.is_success:
+            return None
+        headers = response.headers
+        return headers.get("x-goog-generation") or headers.get("etag") or headers.get("last-modified")
+
+    async def versions(self, urls: list[str]) -> list[Optional[str]]:
+        return list(await asyncio.gather(*(self.version(url) for url in urls)))
+
+    @staticmethod
+    def _key(url: str, version: str) -> str:
+        return hashlib.sha256(f"{url}\n{version}".encode()).hexdigest()
+
+    async def _fetch(self, url: str, version: str) -> str:
+        """Make sure `version` of `url` is on disk; returns its pinned cache key"""
+        key = self._key(url, version)
+
+        while True:
+            if self.disk.touch(key):
+                self.disk.pin(key)
+                self.bytes_saved += self.disk.size(key)
+                return key
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            # Another merge is downloading this clip - wait, then take it from disk
+            await asyncio.shield(in_flight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            await self._download(url, key)
+            future.set_result(None)
+            return key
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def _download(self, url: str, key: str):
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk.directory, prefix=".tmp-")
+        os.close(fd)
+        try:
+            await self._stream(url, tmp_path)
+            await asyncio.to_thread(self.disk.add_file, key, tmp_path, True)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    async def _stream(self, url: str, path: str):
+        with open(path, "wb") as f:
+            async with self._semaphore:
+                async with self.client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(1024 * 1024):
+                        await asyncio.to_thread(f.write, chunk)
+                        self.bytes_downloaded += len(chunk)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.disk.get_stats(),
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_saved": self.bytes_saved,
+            "local_clips": self.local_clips,
+        }
@@ -0,0 +1,66 @@
+from typing import Awaitable, Callable, Optional
+from utils.cache import DiskCache, LRUCache, SingleFlight
+from utils.env import settings
+import asyncio
+import hashlib
+
+
+class FrameCache:
+    """
+    Cache of cleaned frames from Gemini, keyed by (image SHA-256, prompt, model).
+    A storyboard reuses the ending frame of clip N as the starting frame of clip N+1, and
+    users regenerate the same frame repeatedly; each hit skips a multi-second, billed call.
+
+    Two tiers: an in-memory LRU, and an optional directory on disk (FRAME_CACHE_DIR) that
+    survives restarts. Concurrent misses for the same key share a single upstream call.
+    """
+
+    def __init__(self):
+        self.memory = LRUCache(settings.FRAME_CACHE_MEMORY_BYTES)
+        self.disk: Optional[DiskCache] = None
+        if settings.FRAME_CACHE_DIR:
+            self.disk = DiskCache(settings.FRAME_CACHE_DIR, settings.FRAME_CACHE_DISK_BYTES)
+        self._in_flight = SingleFlight()
+
+    @staticmethod
+    def key(image: bytes, prompt: str, model: str) -> str:
+        digest = hashlib.sha256()
+        for part in (hashlib.sha256(image).digest(), prompt.encode(), model.encode()):
+            digest.update(len(part).to_bytes(4, "big"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self.memory.get(key)
+        if data is not None:
+            return data
+        if self.disk:
+            data = await asyncio.to_thread(self.disk.get, key)
+            if data is not None:
+                self.memory.set(key, data)
+        return data
+
+    async def set(self, key: str, data: bytes):
+        self.memory.set(key, data)
+        if self.disk:
+            await asyncio.to_thread(self.disk.set, key, data)
+
+    async def get_or_create(self, key: str, create: Callable[[], Awaitable[bytes]]) -> bytes:
+        data = await self.get(key)
+        if data is not None:
+            return data
+
+        async def generate() -> bytes:
+            data = await create()
+            await self.set(key, data)
+            return data
+
+        # Concurrent misses for the same frame wait for a single generation
+        return await self._in_flight.run(key, generate)
+
+    def get_stats(self) -> dict:
+        return {
+            "memory": self.memory.get_stats(),
+            "disk": self.disk.get_stats() if self.disk else None,
+            "coalesced": self._in_flight.coalesced,
+        }
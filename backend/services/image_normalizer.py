@@ -0,0 +1,77 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+from models.media import MediaHandle
+from utils.env import settings
+from utils.image import normalize_image
+from utils.stats import percentile
+import asyncio
+import time
+
+
+class ImageNormalizer:
+    """
+    Shrinks canvas uploads before they are sent to Gemini / Veo: 16:9, at most
+    IMAGE_TARGET_WIDTH x IMAGE_TARGET_HEIGHT, JPEG. Browsers export multi-megabyte 4K PNGs,
+    while Veo's output is 720p anyway.
+
+    Pillow releases the GIL while decoding, resizing and encoding, so a small thread pool
+    keeps this off the event loop without the cost of shipping images to other processes.
+    """
+
+    def __init__(self):
+        self.enabled = settings.IMAGE_NORMALIZE
+        self._executor = ThreadPoolExecutor(max_workers=settings.IMAGE_NORMALIZE_WORKERS, thread_name_prefix="image")
+        self.images = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # recent samples, seconds
+        self._durations: deque = deque(maxlen=200)
+
+    async def normalize(self, image: MediaHandle, overlay: Optional[MediaHandle] = None) -> bytes:
+        """
+        Normalized copy of an image; the original if normalization is off or the image can't be decoded.
+        With an `overlay` the result is the composite of both, which is always produced.
+        The images are only read once a worker picks them up, so a backlog of jobs waiting
+        here doesn't hold their (possibly spilled) uploads in memory.
+        """
+        if not self.enabled and overlay is None:
+            return await image.read()
+        start = time.perf_counter()
+        try:
+            normalized = await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(self._normalize, image, overlay)
+            )
+        except Exception as e:
+            self.failures += 1
+            if overlay is not None:
+                raise
+            print(f"[ERROR] Image normalization failed, using the original: {e}")
+            return await image.read()
+        self._durations.append(time.perf_counter() - start)
+        self.images += 1
+        self.bytes_in += image.size
+        self.bytes_out += len(normalized)
+        return normalized
+
+    @staticmethod
+    def _normalize(image: MediaHandle, overlay: Optional[MediaHandle]) -> bytes:
+        return normalize_image(
+            image.read_sync(),
+            settings.IMAGE_TARGET_WIDTH, settings.IMAGE_TARGET_HEIGHT, settings.IMAGE_JPEG_QUALITY,
+            overlay=overlay.read_sync() if overlay is not None else None
+        )
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "images": self.images,
+            "failures": self.failures,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "size_ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else 0.0,
+            "p50_ms": round(percentile(self._durations, 50) * 1000, 1),
+            "p95_ms": round(percentile(self._durations, 95) * 1000, 1),
+        }
@@ -0,0 +1,130 @@
+from typing import Optional, Tuple
+from models.job import IMAGE_FIELDS, VideoJobRequest
+from models.media import MediaHandle
+from utils.env import settings
+import json
+import time
+
+
+class RedisJobQueue:
+    """
+    At-least-once work queue for video jobs, consumed by worker.py.
+
+    Queued and in-flight jobs live in one sorted set scored by the time they become visible.
+    Claiming a job moves its score forward by the visibility timeout; a worker that dies
+    without acking leaves the score to expire, and the job is handed out again.
+    A job that can't run yet (a model's circuit breaker is open) is deferred to a later score.
+    The VideoJobRequest itself is kept next to it in a hash until the job is acked.
+    """
+
+    QUEUE_KEY = "jobs:queue"
+    ATTEMPTS_KEY = "jobs:attempts"
+    REQUEST_PREFIX = "jobs:request:"
+    # Claim the oldest visible job: hide it for ARGV[2] ms and count the attempt
+    _CLAIM_SCRIPT = """
+    local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+    if #ids == 0 then
+        return nil
+    end
+    redis.call('ZADD', KEYS[1], ARGV[1] + ARGV[2], ids[1])
+    local attempts = redis.call('HINCRBY', KEYS[2], ids[1], 1)
+    return {ids[1], attempts}
+    """
+
+    def __init__(self, url: Optional[str] = None, client=None):
+        if client is None:
+            # Optional dependency - only needed when REDIS_URL is set
+            import redis.asyncio as redis
+            # Requests carry raw image bytes, so responses are not decoded
+            client = redis.from_url(url)
+        self.redis = client
+
+    def _request_key(self, job_id: str) -> str:
+        return f"{self.REQUEST_PREFIX}{job_id}"
+
+    @staticmethod
+    def _now_ms() -> int:
+        return int(time.time() * 1000)
+
+    async def enqueue(self, job_id: str, request: VideoJobRequest):
+        fields = {
+            "global_context": request.global_context,
+            "custom_prompt": request.custom_prompt,
+            "duration_seconds": request.duration_seconds,
+        }
+        # Image fields are stored only when set
+        for name in IMAGE_FIELDS:
+            if getattr(request, name) is not None:
+                fields[name] = await getattr(request, name).read()
+        if request.objects:
+            fields["objects"] = json.dumps(request.objects)
+
+        key = self._request_key(job_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=fields)
+            pipe.expire(key, settings.JOB_ACTIVE_TTL_SECONDS)
+            pipe.zadd(self.QUEUE_KEY, {job_id: self._now_ms()})
+            await pipe.execute()
+
+    async def claim(self, visibility_timeout: float) -> Optional[Tuple[str, int]]:
+        """Next visible job as (job_id, attempt number), or None when the queue is empty"""
+        claimed = await self.redis.eval(
+            self._CLAIM_SCRIPT, 2, self.QUEUE_KEY, self.ATTEMPTS_KEY,
+            self._now_ms(), int(visibility_timeout * 1000)
+        )
+        if not claimed:
+            return None
+        job_id, attempts = claimed
+        return job_id.decode() if isinstance(job_id, bytes) else job_id, int(attempts)
+
+    async def load_request(self, job_id: str) -> Optional[VideoJobRequest]:
+        raw = await self.redis.hgetall(self._request_key(job_id))
+        if not raw:
+            return None
+        raw = {key.decode(): value for key, value in raw.items()}
+        return VideoJobRequest(
+            global_context=raw["global_context"].decode(),
+            custom_prompt=raw["custom_prompt"].decode(),
+            duration_seconds=int(raw["duration_seconds"]),
+            **{name: MediaHandle.from_bytes(raw[name]) if name in raw else None for name in IMAGE_FIELDS},
+            objects=json.loads(raw["objects"]) if "objects" in raw else None,
+        )
+
+    async def extend(self, job_id: str, visibility_timeout: float):
+        """Keep a claimed job hidden while it is still being worked on"""
+        await self.redis.zadd(self.QUEUE_KEY, {job_id: self._now_ms() + int(visibility_timeout * 1000)}, xx=True)
+
+    async def defer(self, job_id: str, delay: float):
+        """Hand a claimed job back, visible again after `delay` seconds; it doesn't count as an attempt"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.QUEUE_KEY, {job_id: self._now_ms() + int(delay * 1000)}, xx=True)
+            pipe.hincrby(self.ATTEMPTS_KEY, job_id, -1)
+            await pipe.execute()
+
+    async def ack(self, job_id: str):
+        """Remove a finished (or abandoned) job for good"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.QUEUE_KEY, job_id)
+            pipe.hdel(self.ATTEMPTS_KEY, job_id)
+            pipe.delete(self._request_key(job_id))
+            await pipe.execute()
+
+    async def get_stats(self) -> dict:
+        now = self._now_ms()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zcount(self.QUEUE_KEY, "-inf", now)
+            pipe.zcount(self.QUEUE_KEY, f"({now}", "+inf")
+            ready, in_flight = await pipe.execute()
+        return {"ready": ready, "in_flight": in_flight}
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_job_queue() -> Optional[RedisJobQueue]:
+    """The work queue when JOB_EXECUTION_MODE is "queue", None when jobs run inline"""
+    if settings.JOB_EXECUTION_MODE != "queue":
+        return None
+    if not settings.REDIS_URL:
+        raise ValueError("JOB_EXECUTION_MODE=queue requires REDIS_URL")
+    return RedisJobQueue(settings.REDIS_URL)
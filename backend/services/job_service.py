@@ -1,74 +1,260 @@
+from dataclasses import replace
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, Iterable, Set
 from models.job import JobStatus, VideoJobRequest, VideoJob
-from services.vertex_service import VertexService
+from models.media import MediaHandle
+from services.vertex_service import IMAGE_MODEL, TEXT_MODEL, VIDEO_MODEL, VertexService
+from services.image_normalizer import ImageNormalizer
+from services.resilience import CircuitOpenError
+from services.storage_service import StorageService
+from services.job_store import JobStore, create_job_store
+from services.job_queue import RedisJobQueue, create_job_queue
 from utils.prompt_builder import create_video_prompt
 from utils.env import settings
 import uuid
 import asyncio
+import time
 import traceback
 
+# Same prompt for starting and ending frames, so a frame shared by two clips hits the frame cache
+FRAME_CLEANUP_PROMPT = "Remove all text, captions, subtitles, annotations from this image. Generate a clean version of the image with no text. Keep everything else, including the art/image style, the exact same."
+ANNOTATION_PROMPT = "Describe any animation annotations you see. Use this description to inform a video director. Be descriptive about location and purpose of the annotations."
+# Store lease held by the one worker that polls Veo operations
+POLLER_LEASE = "status-poller"
+
 class JobService:
     """
-    Simplified JobService that uses in-memory storage instead of Redis.
-    For production, you'd want to use Redis or a database for persistence.
+    Runs the video pipeline in the background and tracks jobs in a JobStore.
+    With REDIS_URL set the store is shared, so any worker can answer for any job.
+    With JOB_EXECUTION_MODE=queue the pipeline runs in worker.py processes instead of the API.
     """
     
-    def __init__(self, vertex_service: VertexService):
+    def __init__(self, vertex_service: VertexService, store: Optional[JobStore] = None, queue: Optional[RedisJobQueue] = None,
+                 storage_service: Optional[StorageService] = None):
         self.vertex_service = vertex_service
-        # In-memory job storage (replaces Redis for MVP)
-        self._jobs: Dict[str, dict] = {}
-        self._pending_jobs: Dict[str, dict] = {}
-        self._error_jobs: Dict[str, dict] = {}
+        # Reads images that were uploaded straight to storage (VideoJobRequest.objects),
+        # stores videos Veo returns inline (no Cloud Storage bucket to write to)
+        self.storage_service = storage_service
+        self.image_normalizer = ImageNormalizer()
+        self.store = store or create_job_store()
+        self.queue = queue or create_job_queue()
+        self.store.set_event_handler(self._dispatch_event)
+        # Identifies this process when taking the status poller lease
+        self._instance_id = str(uuid.uuid4())
+        # One background task refreshes every active operation; status reads only hit the store
+        self._poller_task: Optional[asyncio.Task] = None
+        self._stats = {
+            "status_reads": 0,  # status requests answered from cached state
+            "upstream_polls": 0,  # operations.get calls actually sent to Vertex
+            "upstream_poll_errors": 0,
+            "cleanups_skipped": 0,  # frames that came with a clean canvas layer
+            "jobs_shed": 0,  # jobs turned away while a model's circuit breaker was open
+            "jobs_deferred": 0,  # queued jobs put back until a model's circuit breaker lets calls through
+        }
+        # Push subscribers (SSE streams) in this process, keyed by job id
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def start(self):
+        """Start the job store and the background status poller (idempotent)"""
+        if self._poller_task is None or self._poller_task.done():
+            await self.store.start()
+            self._poller_task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._poller_task:
+            self._poller_task.cancel()
+            try:
+                await self._poller_task
+            except asyncio.CancelledError:
+                pass
+            self._poller_task = None
+        await self.store.stop()
+        if self.queue:
+            await self.queue.close()
 
     async def create_video_job(self, request: VideoJobRequest) -> str:
         """Create a video job and return job_id immediately, processing happens in background"""
         job_id = str(uuid.uuid4())
         
         pending_job = {
+            "job_id": job_id,
             "status": "pending",
             "job_start_time": datetime.now().isoformat()
         }
         # Store pending job BEFORE starting background task to avoid 404 race condition
-        self._pending_jobs[job_id] = pending_job
+        await self.store.put(job_id, pending_job, settings.JOB_ACTIVE_TTL_SECONDS)
+        await self._publish(pending_job)
         
-        # start background task
-        asyncio.create_task(self._process_video_job(job_id, request))
+        await self.start()
+        if self.queue:
+            # a worker process picks it up
+            await self.queue.enqueue(job_id, request)
+            request.release()
+        else:
+            # start background task
+            asyncio.create_task(self._process_video_job(job_id, request))
         
         return job_id
+
+    async def run_queue_worker(self):
+        """Consume queued jobs with JOB_WORKER_CONCURRENCY parallel consumers (worker.py)"""
+        if not self.queue:
+            raise ValueError("Queue worker needs JOB_EXECUTION_MODE=queue")
+        print(f"[WORKER] Consuming video jobs with concurrency {settings.JOB_WORKER_CONCURRENCY}")
+        await asyncio.gather(*(self._consume_queue() for _ in range(settings.JOB_WORKER_CONCURRENCY)))
+
+    async def _consume_queue(self):
+        visibility = settings.JOB_VISIBILITY_TIMEOUT_SECONDS
+        while True:
+            try:
+                claimed = await self.queue.claim(visibility)
+                if claimed is None:
+                    await asyncio.sleep(settings.JOB_QUEUE_POLL_INTERVAL)
+                    continue
+                job_id, attempts = claimed
+                await self._run_claimed_job(job_id, attempts)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ERROR] Queue consumer: {e}")
+                traceback.print_exc()
+                await asyncio.sleep(settings.JOB_QUEUE_POLL_INTERVAL)
+
+    async def _run_claimed_job(self, job_id: str, attempts: int):
+        job = await self.store.get(job_id)
+        if job is None or job["status"] != "pending":
+            # expired, or redelivered after it already got past the pipeline
+            await self.queue.ack(job_id)
+            return
+
+        request = await self.queue.load_request(job_id)
+        if request is None or attempts > settings.JOB_QUEUE_MAX_ATTEMPTS:
+            reason = "Job request expired" if request is None else f"Job failed after {attempts - 1} attempts"
+            await self._fail_job(job_id, reason)
+            await self.queue.ack(job_id)
+            return
+
+        try:
+            self.vertex_service.check_available(self._required_models(request))
+        except CircuitOpenError as e:
+            # Still queued, so wait for the breaker instead of failing the job
+            print(f"[WORKER] Deferring job {job_id} for {e.retry_after:.1f}s: {e}")
+            self._stats["jobs_deferred"] += 1
+            request.release()
+            await self.queue.defer(job_id, e.retry_after)
+            return
+
+        print(f"[WORKER] Processing job {job_id} (attempt {attempts})")
+        heartbeat = asyncio.create_task(self._extend_visibility(job_id))
+        try:
+            await self._process_video_job(job_id, request)
+        finally:
+            heartbeat.cancel()
+        # Only acked once the pipeline finished; a crash before this means redelivery
+        await self.queue.ack(job_id)
+
+    async def _extend_visibility(self, job_id: str):
+        visibility = settings.JOB_VISIBILITY_TIMEOUT_SECONDS
+        while True:
+            await asyncio.sleep(visibility / 3)
+            try:
+                await self.queue.extend(job_id, visibility)
+            except Exception as e:
+                print(f"[ERROR] Extending visibility of job {job_id}: {e}")
     
+    @staticmethod
+    def _required_models(request: VideoJobRequest) -> list:
+        models = [TEXT_MODEL, VIDEO_MODEL]
+        ending_needs_cleanup = request.has("ending_image") and not request.has("ending_base_layer")
+        if not request.has("base_layer") or ending_needs_cleanup:
+            models.append(IMAGE_MODEL)
+        return models
+
+    def check_upstreams(self, request: VideoJobRequest):
+        """
+        Raise CircuitOpenError if a model the job needs is rejecting calls, so doomed jobs are
+        turned away before any (billed) Gemini call instead of failing at generate_videos
+        """
+        try:
+            self.vertex_service.check_available(self._required_models(request))
+        except CircuitOpenError:
+            self._stats["jobs_shed"] += 1
+            raise
+
+    async def _load_objects(self, request: VideoJobRequest) -> VideoJobRequest:
+        """`request` with the image fields that were sent as storage objects filled in"""
+        if not request.objects:
+            return request
+        if self.storage_service is None:
+            raise ValueError("Object references need a storage service")
+        fields = list(request.objects)
+        contents = await asyncio.gather(*(self.storage_service.download_file(request.objects[name]) for name in fields))
+        return replace(request, objects=None, **{name: MediaHandle.from_bytes(data) for name, data in zip(fields, contents)})
+
     async def _process_video_job(self, job_id: str, request: VideoJobRequest):
         """Background task that processes the video generation"""
         try:
             print(f"[DEBUG] Starting video job processing for {job_id}")
-            
-            # for parallel tasks
-            tasks = [
-                self.vertex_service.analyze_image_content(
-                    prompt="Describe any animation annotations you see. Use this description to inform a video director. Be descriptive about location and purpose of the annotations.",
-                    image_data=request.starting_image
-                ),
-                self.vertex_service._generate_image_raw(
-                    prompt="Remove all text, captions, subtitles, annotations from this image. Generate a clean version of the image with no text. Keep everything else the exact same.",
-                    image=request.starting_image
+            # inline jobs accepted before the breaker opened; queued ones are deferred in _run_claimed_job
+            self.check_upstreams(request)
+            request = await self._load_objects(request)
+
+            # Canvas exports are often 4K PNGs; shrink them before they go anywhere.
+            # With canvas layers, the analysis sees the composite (what the user drew).
+            normalizer = self.image_normalizer
+
+            async def normalize(image: Optional[MediaHandle]) -> Optional[bytes]:
+                return await normalizer.normalize(image) if image is not None else None
+
+            if request.base_layer is not None and request.annotation_layer is not None:
+                annotated = normalizer.normalize(request.base_layer, overlay=request.annotation_layer)
+            else:
+                annotated = normalize(request.starting_image or request.base_layer)
+            try:
+                annotated_image, base_layer, ending_image, ending_base_layer = await asyncio.gather(
+                    annotated,
+                    normalize(request.base_layer),
+                    normalize(request.ending_image),
+                    normalize(request.ending_base_layer),
                 )
-            ]
+            finally:
+                # Only the normalized copies are sent on; don't keep the uploads for the rest of the job
+                request.release()
+
+            async def clean(image: Optional[bytes], clean_layer: Optional[bytes]) -> Optional[bytes]:
+                # The canvas' own clean layer makes the generative cleanup unnecessary
+                if clean_layer:
+                    self._stats["cleanups_skipped"] += 1
+                    return clean_layer
+                if not image:
+                    return None
+                return await self.vertex_service.clean_frame(prompt=FRAME_CLEANUP_PROMPT, image=image)
             
-            if request.ending_image:
-                tasks.append(
-                    self.vertex_service._generate_image_raw(
-                        prompt="Remove all text, captions, subtitles, annotations from this image. Generate a clean version of the image with no text. Keep the art/image style the exact same.",
-                        image=request.ending_image
+            async def describe_and_clean_start() -> tuple:
+                if base_layer is None and settings.VERTEX_COMBINED_FRAME_CALL:
+                    # one image-model call answers both (falls back to two calls by itself)
+                    return await self.vertex_service.analyze_and_clean_frame(
+                        ANNOTATION_PROMPT, FRAME_CLEANUP_PROMPT, annotated_image
                     )
+                return await asyncio.gather(
+                    self.vertex_service.analyze_image_content(
+                        prompt=ANNOTATION_PROMPT,
+                        image_data=annotated_image
+                    ),
+                    clean(annotated_image, base_layer),
                 )
             
+            # for parallel tasks
+            tasks = [
+                describe_and_clean_start(),
+                clean(ending_image, ending_base_layer),
+            ]
+            
             print(f"[DEBUG] Running {len(tasks)} parallel tasks...")
             results = await asyncio.gather(*tasks)
             print(f"[DEBUG] Parallel tasks completed")
             
-            annotation_description = results[0]
-            starting_frame = results[1]
-            ending_frame = results[2] if len(results) > 2 else None
+            (annotation_description, starting_frame), ending_frame = results
             
             print(f"[DEBUG] Annotation description: {annotation_description[:100] if annotation_description else 'None'}...")
             print(f"[DEBUG] Starting frame bytes: {len(starting_frame) if starting_frame else 0}")
@@ -89,81 +275,230 @@ class JobService:
                 "job_start_time": datetime.now().isoformat(),
                 "metadata": {
                     "annotation_description": annotation_description
-                }
+                },
+                # Cached operation state, refreshed by the background poller
+                "status": "waiting",
+                "video_url": None,
+                "job_end_time": None,
+                "next_poll_at": time.time() + self._next_poll_delay(0),
             }
             
             # Move from pending to active jobs
-            if job_id in self._pending_jobs:
-                del self._pending_jobs[job_id]
-            self._jobs[job_id] = job
+            await self.store.put(job_id, job, settings.JOB_ACTIVE_TTL_SECONDS)
+            await self._publish(job)
             print(f"[DEBUG] Job {job_id} moved to active jobs")
             
         except Exception as e:
             # debug stuff
             print(f"[ERROR] Error processing video job {job_id}: {e}")
             traceback.print_exc()
-            error_job = {
-                "status": "error",
-                "error": str(e),
-                "job_start_time": datetime.now().isoformat()
-            }
-            if job_id in self._pending_jobs:
-                del self._pending_jobs[job_id]
-            self._error_jobs[job_id] = error_job
+            request.release()
+            await self._fail_job(job_id, str(e))
+
+    async def _fail_job(self, job_id: str, error: str, job_start_time: Optional[str] = None):
+        error_job = {
+            "job_id": job_id,
+            "status": "error",
+            "error": error,
+            "job_start_time": job_start_time or datetime.now().isoformat(),
+            "finished_at": time.time()
+        }
+        await self.store.put(job_id, error_job, settings.JOB_RESULT_TTL_SECONDS)
+        await self._publish(error_job)
 
     async def get_video_job_status(self, job_id: str) -> JobStatus:
+        job = await self.store.get(job_id)
+
+        if job is None:  # if job not found
+            return None
+
         # Check if job is still pending
-        if job_id in self._pending_jobs:
-            pending_job = self._pending_jobs[job_id]
+        if job["status"] == "pending":
             return JobStatus(
                 status="waiting",
-                job_start_time=datetime.fromisoformat(pending_job["job_start_time"]),
+                job_start_time=datetime.fromisoformat(job["job_start_time"]),
                 job_end_time=None,
                 video_url=None,
             )
         
         # Check if job failed
-        if job_id in self._error_jobs:
-            error_job = self._error_jobs[job_id]
+        if job["status"] == "error":
             return JobStatus(
                 status="error",
-                job_start_time=datetime.fromisoformat(error_job["job_start_time"]),
+                job_start_time=datetime.fromisoformat(job["job_start_time"]),
                 job_end_time=None,
                 video_url=None,
-                error=error_job.get("error")
+                error=job.get("error")
             )
-        
-        # Retrieve actual job from memory
-        job = self._jobs.get(job_id)
-
-        if job is None:  # if job not found
-            return None
-
-        # Use operation_name instead of full operation object
-        result = await self.vertex_service.get_video_status_by_name(job["operation_name"])
-        
-        # Debug logging
-        print(f"[DEBUG] Job {job_id} status: {result.status}")
-        print(f"[DEBUG] Raw video URL from Vertex: {result.video_url}")
 
-        video_url = None
-        if result.video_url:
-            video_url = result.video_url.replace("gs://", "https://storage.googleapis.com/")
-            print(f"[DEBUG] Converted video URL: {video_url}")
-
-        ret = JobStatus(
-            status=result.status,
+        # Answered from the state cached by the background poller - no Vertex call here
+        self._stats["status_reads"] += 1
+        return JobStatus(
+            status=job["status"],
             job_start_time=datetime.fromisoformat(job["job_start_time"]),
-            job_end_time=datetime.now() if result.status == "done" else None,
-            video_url=video_url,
+            job_end_time=datetime.fromisoformat(job["job_end_time"]) if job.get("job_end_time") else None,
+            video_url=job.get("video_url"),
             metadata=job.get("metadata")
         )
 
+    def _next_poll_delay(self, age: float) -> float:
+        """
+        Seconds until an operation of the given age (seconds) should be polled again.
+        Young jobs are checked rarely, polling tightens as the expected Veo finish time
+        approaches, and jobs that are long overdue back off again.
+        """
+        expected = settings.VEO_EXPECTED_SECONDS
+        if age > 3 * expected:
+            return settings.JOB_POLL_MAX_INTERVAL
+        remaining = expected - age
+        return min(settings.JOB_POLL_MAX_INTERVAL, max(settings.JOB_POLL_MIN_INTERVAL, remaining / 2))
+
+    async def _poll_loop(self):
+        """Refresh every due operation. Only the worker holding the poller lease polls."""
+        while True:
+            try:
+                lease_ttl = max(5.0, settings.JOB_POLL_TICK * 10)
+                if await self.store.try_acquire_lock(POLLER_LEASE, self._instance_id, lease_ttl):
+                    now = time.time()
+                    jobs = await self.store.get_many(await self.store.active_job_ids())
+                    due = [
+                        job for job in jobs.values()
+                        if job["status"] == "waiting" and job["next_poll_at"] <= now
+                    ]
+                    if due:
+                        # A round can outlast the lease (Vertex deadlines and retries, video uploads),
+                        # so it is renewed meanwhile - otherwise another worker polls the same jobs
+                        renewer = asyncio.create_task(self._renew_poller_lease(lease_ttl))
+                        try:
+                            await asyncio.gather(*(self._refresh_job(job) for job in due))
+                        finally:
+                            renewer.cancel()
+            except Exception as e:
+                print(f"[ERROR] Job status poller: {e}")
+                traceback.print_exc()
+            await asyncio.sleep(settings.JOB_POLL_TICK)
+
+    async def _renew_poller_lease(self, ttl: float):
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                if not await self.store.try_acquire_lock(POLLER_LEASE, self._instance_id, ttl):
+                    print("[ERROR] Job status poller lost its lease during a refresh round")
+                    return
+            except Exception as e:
+                print(f"[ERROR] Renewing job status poller lease: {e}")
+
+    async def _refresh_job(self, job: dict):
+        job_id = job["job_id"]
+        self._stats["upstream_polls"] += 1
+        try:
+            result = await self.vertex_service.get_video_status_by_name(job["operation_name"])
+        except Exception as e:
+            self._stats["upstream_poll_errors"] += 1
+            print(f"[ERROR] Polling operation for job {job_id}: {e}")
+            await self.store.update(job_id, {"next_poll_at": time.time() + settings.JOB_POLL_MIN_INTERVAL})
+            return
+
+        print(f"[DEBUG] Job {job_id} status: {result.status}")
+
+        if result.status == "error":
+            # A finished operation without a video (failed, or filtered) - polling it again won't help
+            print(f"[ERROR] Video generation for job {job_id} failed: {result.error}")
+            await self._fail_job(job_id, result.error, job["job_start_time"])
+            return
+
         if result.status == "done":
-            del self._jobs[job_id]  # clean from memory
+            video_url = None
+            if result.video_url:
+                video_url = result.video_url.replace("gs://", "https://storage.googleapis.com/")
+                print(f"[DEBUG] Converted video URL: {video_url}")
+            elif result.video_bytes and self.storage_service is not None:
+                try:
+                    video_url = await self.storage_service.upload_file(f"videos/{job_id}.mp4", result.video_bytes, "video/mp4")
+                except Exception as e:
+                    print(f"[ERROR] Storing video of job {job_id}: {e}")
+                    await self.store.update(job_id, {"next_poll_at": time.time() + settings.JOB_POLL_MIN_INTERVAL})
+                    return
+                print(f"[DEBUG] Stored inline video at {video_url}")
+            job.update({
+                "status": "done",
+                "video_url": video_url,
+                "job_end_time": datetime.now().isoformat(),
+                "finished_at": time.time(),
+            })
+            await self.store.put(job_id, job, settings.JOB_RESULT_TTL_SECONDS)
+            await self._publish(job)
+            return
+
+        age = (datetime.now() - datetime.fromisoformat(job["job_start_time"])).total_seconds()
+        await self.store.update(job_id, {"next_poll_at": time.time() + self._next_poll_delay(age)})
+
+    @staticmethod
+    def _job_event(job: dict) -> dict:
+        """
+        A job record as a push event:
+        pending (cleaning frames) -> generating (Veo running) -> done / error
+        """
+        job_id = job["job_id"]
+        if job["status"] == "pending":
+            return {"job_id": job_id, "status": "pending"}
+        if job["status"] == "error":
+            return {"job_id": job_id, "status": "error", "error_message": job.get("error")}
+        if job["status"] == "done":
+            return {
+                "job_id": job_id,
+                "status": "done",
+                "job_start_time": job["job_start_time"],
+                "job_end_time": job.get("job_end_time"),
+                "video_url": job.get("video_url"),
+                "metadata": job.get("metadata"),
+            }
+        return {"job_id": job_id, "status": "generating", "job_start_time": job["job_start_time"]}
 
-        return ret
+    async def get_job_event(self, job_id: str) -> Optional[dict]:
+        """Current state of a job as a push event, None if the job does not exist"""
+        job = await self.store.get(job_id)
+        return self._job_event(job) if job is not None else None
+
+    def subscribe(self, job_ids: Iterable[str]) -> asyncio.Queue:
+        """Register a queue that receives every state transition of the given jobs"""
+        queue = asyncio.Queue()
+        for job_id in job_ids:
+            self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_ids: Iterable[str], queue: asyncio.Queue):
+        for job_id in job_ids:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    async def _publish(self, job: dict):
+        """Send a transition through the store so subscribers on every worker receive it"""
+        try:
+            await self.store.publish(self._job_event(job))
+        except Exception as e:
+            print(f"[ERROR] Publishing event for job {job['job_id']}: {e}")
+
+    async def _dispatch_event(self, event: dict):
+        for queue in self._subscribers.get(event["job_id"], ()):
+            queue.put_nowait(event)
+
+    async def get_stats(self) -> dict:
+        """Counters for the background status poller in this process, plus queue depth"""
+        stats = {
+            "subscribed_jobs": len(self._subscribers),
+            **self._stats,
+            # every cached status read used to cost one operations.get
+            "polls_saved": max(0, self._stats["status_reads"] - self._stats["upstream_polls"]),
+        }
+        if self.queue:
+            stats["queue"] = await self.queue.get_stats()
+        return stats
 
     async def redis_health_check(self) -> bool:
-        """For MVP, always return True since we're using in-memory storage"""
-        return True
\ No newline at end of file
+        """True when the job store is reachable (always True for the in-memory store)"""
+        return await self.store.ping()
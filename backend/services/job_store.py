@@ -0,0 +1,304 @@
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Iterable, Callable, Awaitable
+from utils.env import settings
+import asyncio
+import json
+import time
+import traceback
+
+# Job records are flat dicts. "status" says which stage a job is in:
+#   pending  - frames are being cleaned/analyzed, no Veo operation yet
+#   waiting  - Veo operation running (operation_name is set)
+#   done     - video_url is set
+#   error    - error is set
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class JobStore(ABC):
+    """
+    Storage for video job records, shared by every worker that points at the same backend.
+    Also carries job events between processes so push subscribers see transitions no matter
+    which worker produced them.
+    """
+
+    def __init__(self):
+        self._event_handler: Optional[EventHandler] = None
+
+    def set_event_handler(self, handler: EventHandler):
+        """Called with every event published through this store"""
+        self._event_handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def get_many(self, job_ids: Iterable[str]) -> Dict[str, dict]:
+        """Records for the ids that exist; missing or expired ids are left out"""
+        ...
+
+    @abstractmethod
+    async def put(self, job_id: str, job: dict, ttl: int):
+        """Replace the whole record and reset its time to live (seconds)"""
+        ...
+
+    @abstractmethod
+    async def update(self, job_id: str, fields: dict):
+        """Change some fields of an existing record, keeping its time to live"""
+        ...
+
+    @abstractmethod
+    async def active_job_ids(self) -> list[str]:
+        """Ids of jobs whose Veo operation is still running"""
+        ...
+
+    @abstractmethod
+    async def try_acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or renew a named lease; True while `owner` holds it"""
+        ...
+
+    @abstractmethod
+    async def publish(self, event: dict):
+        ...
+
+    @abstractmethod
+    async def ping(self) -> bool:
+        ...
+
+
+class InMemoryJobStore(JobStore):
+    """Process-local store. Only correct with a single worker."""
+
+    def __init__(self):
+        super().__init__()
+        self._jobs: Dict[str, dict] = {}
+        self._expires_at: Dict[str, float] = {}
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [job_id for job_id, expires_at in self._expires_at.items() if expires_at <= now]
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
+            del self._expires_at[job_id]
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        if self._expires_at.get(job_id, float("inf")) <= time.time():
+            self._purge_expired()
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def get_many(self, job_ids: Iterable[str]) -> Dict[str, dict]:
+        self._purge_expired()
+        return {job_id: dict(self._jobs[job_id]) for job_id in job_ids if job_id in self._jobs}
+
+    async def put(self, job_id: str, job: dict, ttl: int):
+        self._jobs[job_id] = dict(job)
+        self._expires_at[job_id] = time.time() + ttl
+
+    async def update(self, job_id: str, fields: dict):
+        if job_id in self._jobs:
+            self._jobs[job_id].update(fields)
+
+    async def active_job_ids(self) -> list[str]:
+        self._purge_expired()
+        return [job_id for job_id, job in self._jobs.items() if job["status"] == "waiting"]
+
+    async def try_acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        return True
+
+    async def publish(self, event: dict):
+        if self._event_handler:
+            await self._event_handler(event)
+
+    async def ping(self) -> bool:
+        return True
+
+
+class RedisJobStore(JobStore):
+    """
+    Redis-backed store so every uvicorn worker and Cloud Run instance sees the same jobs.
+
+    Each job is one hash (job:<id>) with a TTL; None fields are left out and small values
+    keep the hash in Redis' compact listpack encoding. Jobs with a running Veo operation are
+    also tracked in a set so the status poller can find them without scanning.
+    Events go over pub/sub.
+    """
+
+    KEY_PREFIX = "job:"
+    ACTIVE_KEY = "jobs:active"
+    EVENTS_CHANNEL = "jobs:events"
+    LOCK_PREFIX = "jobs:lock:"
+
+    # Take the lease if it is free, or extend it if we already hold it
+    _LOCK_SCRIPT = """
+    local current = redis.call('GET', KEYS[1])
+    if current == ARGV[1] then
+        redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        return 1
+    end
+    if not current then
+        redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+        return 1
+    end
+    return 0
+    """
+
+    # HSET that never recreates a hash which has already expired (it would lose its TTL)
+    _UPDATE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        redis.call('HSET', KEYS[1], unpack(ARGV))
+        return 1
+    end
+    return 0
+    """
+
+    # Record fields that are stored as JSON / floats instead of plain strings
+    _JSON_FIELDS = ("metadata",)
+    _FLOAT_FIELDS = ("next_poll_at", "finished_at")
+
+    def __init__(self, url: Optional[str] = None, client=None):
+        super().__init__()
+        if client is None:
+            # Optional dependency - only needed when REDIS_URL is set
+            import redis.asyncio as redis
+            client = redis.from_url(url, decode_responses=True)
+        # A pre-built client can be injected, e.g. fakeredis.aioredis.FakeRedis(decode_responses=True)
+        self.redis = client
+        self._listener_task: Optional[asyncio.Task] = None
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.KEY_PREFIX}{job_id}"
+
+    def _encode(self, job: dict) -> dict:
+        encoded = {}
+        for field, value in job.items():
+            if value is None:
+                continue
+            if field in self._JSON_FIELDS:
+                value = json.dumps(value)
+            encoded[field] = str(value)
+        return encoded
+
+    def _decode(self, raw: dict) -> Optional[dict]:
+        if not raw:
+            return None
+        job = dict(raw)
+        for field in self._JSON_FIELDS:
+            if field in job:
+                job[field] = json.loads(job[field])
+        for field in self._FLOAT_FIELDS:
+            if field in job:
+                job[field] = float(job[field])
+        return job
+
+    async def start(self):
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        await self.redis.aclose()
+
+    async def _listen(self):
+        """Relay events published by any worker to this process' subscribers"""
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.EVENTS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message" or not self._event_handler:
+                        continue
+                    await self._event_handler(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ERROR] Redis job event listener: {e}")
+                traceback.print_exc()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return self._decode(await self.redis.hgetall(self._key(job_id)))
+
+    async def get_many(self, job_ids: Iterable[str]) -> Dict[str, dict]:
+        job_ids = list(job_ids)
+        if not job_ids:
+            return {}
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.hgetall(self._key(job_id))
+            results = await pipe.execute()
+        jobs = {}
+        for job_id, raw in zip(job_ids, results):
+            job = self._decode(raw)
+            if job is not None:
+                jobs[job_id] = job
+        return jobs
+
+    async def put(self, job_id: str, job: dict, ttl: int):
+        key = self._key(job_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping=self._encode(job))
+            pipe.expire(key, ttl)
+            if job["status"] == "waiting":
+                pipe.sadd(self.ACTIVE_KEY, job_id)
+            else:
+                pipe.srem(self.ACTIVE_KEY, job_id)
+            await pipe.execute()
+
+    async def update(self, job_id: str, fields: dict):
+        encoded = self._encode(fields)
+        if encoded:
+            args = [item for pair in encoded.items() for item in pair]
+            await self.redis.eval(self._UPDATE_SCRIPT, 1, self._key(job_id), *args)
+
+    async def active_job_ids(self) -> list[str]:
+        job_ids = list(await self.redis.smembers(self.ACTIVE_KEY))
+        if not job_ids:
+            return []
+        # Drop ids whose hash has expired
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.exists(self._key(job_id))
+            exists = await pipe.execute()
+        expired = [job_id for job_id, found in zip(job_ids, exists) if not found]
+        if expired:
+            await self.redis.srem(self.ACTIVE_KEY, *expired)
+        return [job_id for job_id, found in zip(job_ids, exists) if found]
+
+    async def try_acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        acquired = await self.redis.eval(self._LOCK_SCRIPT, 1, f"{self.LOCK_PREFIX}{name}", owner, int(ttl * 1000))
+        return bool(acquired)
+
+    async def publish(self, event: dict):
+        await self.redis.publish(self.EVENTS_CHANNEL, json.dumps(event))
+
+    async def ping(self) -> bool:
+        try:
+            return bool(await self.redis.ping())
+        except Exception as e:
+            print(f"[ERROR] Redis health check failed: {e}")
+            return False
+
+
+def create_job_store() -> JobStore:
+    """Redis when REDIS_URL is configured, otherwise process-local memory"""
+    if settings.REDIS_URL:
+        print("Using Redis job store")
+        return RedisJobStore(settings.REDIS_URL)
+    print("Warning: REDIS_URL not set, jobs are kept in process memory (single worker only)")
+    return InMemoryJobStore()
@@ -0,0 +1,78 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from utils.stats import percentile
+import asyncio
+import math
+import time
+
+
+class MergeQueueFullError(Exception):
+    """Every ffmpeg slot is busy and the wait queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many merges in progress, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class MergeScheduler:
+    """
+    Admission control for merges: at most `max_concurrency` ffmpeg runs at once and at most
+    `max_queue` requests wait for a slot. Anything beyond that is rejected immediately with
+    a Retry-After estimate instead of piling up until the instance runs out of memory.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        # recent samples, seconds
+        self._wait_times: deque = deque(maxlen=200)
+        self._run_times: deque = deque(maxlen=200)
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queued request would get a slot"""
+        average_run = sum(self._run_times) / len(self._run_times) if self._run_times else 30.0
+        return max(1, math.ceil(average_run * (self.waiting + 1) / self.max_concurrency))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise MergeQueueFullError(self.retry_after())
+
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started_at = time.monotonic()
+        self._wait_times.append(started_at - queued_at)
+        self.admitted += 1
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._run_times.append(time.monotonic() - started_at)
+            self._semaphore.release()
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_p50_s": round(percentile(self._wait_times, 50), 3),
+            "wait_p95_s": round(percentile(self._wait_times, 95), 3),
+            "run_p50_s": round(percentile(self._run_times, 50), 3),
+            "run_p95_s": round(percentile(self._run_times, 95), 3),
+        }
@@ -0,0 +1,340 @@
+from collections import deque
+from contextlib import nullcontext
+from typing import AsyncContextManager, Awaitable, Callable, Dict, Iterable, Optional, TypeVar
+from utils.env import settings
+from utils.stats import percentile
+import asyncio
+import math
+import random
+import time
+
+T = TypeVar("T")
+
+# Status codes worth another attempt: rate limited, or the backend had a transient problem
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+# For calls that must not run twice (e.g. starting a Veo operation): only codes that mean the
+# request was rejected before any work was done
+REJECTED_CODES = {429, 503}
+# Hedging needs this many latency samples before the percentile means anything
+HEDGE_MIN_SAMPLES = 20
+# Retry-After while a half-open breaker waits for its probe's answer
+PROBE_RETRY_AFTER = 5.0
+
+
+class DeadlineExceededError(Exception):
+    """An attempt took longer than its deadline"""
+
+
+class CircuitOpenError(Exception):
+    """A circuit breaker is rejecting calls to an upstream that keeps failing"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable after repeated errors, retry in {math.ceil(retry_after)}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def error_code(error: BaseException) -> Optional[int]:
+    """HTTP status of an upstream error, None if it has none"""
+    # Imported here so importing this module doesn't load the SDKs (slow imports, startup time)
+    from google.genai import errors as genai_errors
+    import httpx
+
+    if isinstance(error, genai_errors.APIError):
+        return error.code
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    return None
+
+
+def is_retryable(error: BaseException, idempotent: bool = True) -> bool:
+    code = error_code(error)
+    if not idempotent:
+        return code in REJECTED_CODES
+    if code is not None:
+        return code in RETRYABLE_CODES
+    # deadlines and dropped connections; anything else is a bug or a bad request
+    import httpx
+
+    return isinstance(error, (DeadlineExceededError, httpx.TransportError))
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
+        self.deadlines_exceeded = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.errors: Dict[str, int] = {}
+        # recent successful attempt latencies, seconds
+        self.latencies: deque = deque(maxlen=500)
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "failures": self.failures,
+            "deadlines_exceeded": self.deadlines_exceeded,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "errors": dict(self.errors),
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 1),
+        }
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream that keeps failing with quota / server errors (anything
+    is_retryable), instead of sending it every request only to fail after the retries.
+
+    - closed: calls go through; `failure_threshold` failures in a row open it.
+    - open: calls fail immediately with CircuitOpenError for `open_seconds`.
+    - half_open: one probe call at a time goes through; success closes the breaker,
+      failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, open_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.trips = 0
+        self.rejected = 0
+
+    def retry_after(self) -> float:
+        """Seconds until a call would be let through, 0 if it would be now"""
+        if self.state == "open":
+            remaining = self._opened_at + self.open_seconds - self._clock()
+            if remaining > 0:
+                return remaining
+            self.state = "half_open"
+        if self.state == "half_open" and self._probing:
+            return PROBE_RETRY_AFTER
+        return 0.0
+
+    def acquire(self) -> bool:
+        """Admit a call or raise CircuitOpenError; True if the call is the half-open probe"""
+        retry_after = self.retry_after()
+        if retry_after:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, retry_after)
+        if self.state == "half_open":
+            self._probing = True
+            return True
+        return False
+
+    def record(self, probe: bool, failed: Optional[bool]):
+        """Outcome of an admitted call; `failed` is None if it was cancelled before it had one"""
+        if probe:
+            self._probing = False
+            if failed:
+                self._open()
+            elif failed is not None:
+                print(f"[CIRCUIT] {self.name} recovered, closing")
+                self.state = "closed"
+                self.consecutive_failures = 0
+            return
+        if failed is None:
+            return
+        if not failed:
+            self.consecutive_failures = 0
+            return
+        self.consecutive_failures += 1
+        if self.state == "closed" and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = self._clock()
+        self.trips += 1
+        print(f"[CIRCUIT] {self.name} failing, rejecting calls for {self.open_seconds:.0f}s")
+
+    def get_stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(), 1),
+        }
+
+
+class Resilience:
+    """
+    Retries, deadlines and hedging for upstream calls, with per-operation counters.
+
+    - Every attempt has a deadline; hitting it counts as a retryable failure.
+    - Retryable errors (429, 5xx, timeouts, dropped connections) are retried up to
+      VERTEX_RETRY_ATTEMPTS times with exponential backoff and full jitter, so a burst of
+      rate-limited callers doesn't retry in lockstep.
+    - Hedged operations send a duplicate when the first attempt is slower than the
+      VERTEX_HEDGE_PERCENTILE of recent latencies (timed from when it holds the limiter);
+      whichever answers first wins. Hedges are capped at VERTEX_HEDGE_MAX_RATIO of calls so a
+      slow backend doesn't get twice the load, and none are sent while the limiter is full.
+    - Calls naming a `circuit` go through that circuit's breaker (see CircuitBreaker); a
+      rejected call is not retried.
+    """
+
+    def __init__(self, limiter: Optional[AsyncContextManager] = None, sleep: Callable[[float], Awaitable[None]] = asyncio.sleep):
+        self.attempts = settings.VERTEX_RETRY_ATTEMPTS
+        self.base_delay = settings.VERTEX_RETRY_BASE_DELAY
+        self.max_delay = settings.VERTEX_RETRY_MAX_DELAY
+        # Held for each attempt (e.g. a concurrency semaphore) - not while backing off,
+        # and waiting for it doesn't count against the deadline
+        self._limiter = limiter if limiter is not None else nullcontext()
+        self._sleep = sleep
+        self._stats: Dict[str, OperationStats] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def stats(self, operation: str) -> OperationStats:
+        if operation not in self._stats:
+            self._stats[operation] = OperationStats()
+        return self._stats[operation]
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(
+                name, settings.VERTEX_CIRCUIT_FAILURES, settings.VERTEX_CIRCUIT_OPEN_SECONDS
+            )
+        return self.breakers[name]
+
+    def check(self, circuits: Iterable[str]):
+        """Raise CircuitOpenError (for the longest wait) unless all of `circuits` let calls through now"""
+        waits = [(self.breaker(name).retry_after(), name) for name in circuits]
+        retry_after, name = max(waits, default=(0.0, ""))
+        if retry_after:
+            raise CircuitOpenError(name, retry_after)
+
+    def backoff(self, retry: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, base_delay * 2^retry)]"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    async def call(self, operation: str, fn: Callable[[], Awaitable[T]], deadline: float,
+                   idempotent: bool = True, hedge: bool = False, attempts: Optional[int] = None,
+                   circuit: Optional[str] = None) -> T:
+        """
+        Run `fn` (a fresh call each time it is invoked) until it succeeds, fails with a
+        non-retryable error or runs out of attempts; the last error is re-raised.
+        """
+        attempts = attempts or self.attempts
+        stats = self.stats(operation)
+        stats.calls += 1
+        breaker = self.breaker(circuit) if circuit else None
+        for retry in range(attempts):
+            try:
+                if hedge and idempotent:
+                    return await self._hedged(stats, fn, deadline, breaker)
+                return await self._attempt(stats, fn, deadline, breaker)
+            except CircuitOpenError:
+                stats.failures += 1
+                raise
+            except Exception as e:
+                label = str(error_code(e) or type(e).__name__)
+                stats.errors[label] = stats.errors.get(label, 0) + 1
+                if retry + 1 >= attempts or not is_retryable(e, idempotent):
+                    stats.failures += 1
+                    raise
+                delay = self.backoff(retry)
+                stats.retries += 1
+                print(f"[RETRY] {operation} failed ({label}), attempt {retry + 2}/{attempts} in {delay:.2f}s")
+                await self._sleep(delay)
+
+    async def _attempt(self, stats: OperationStats, fn: Callable[[], Awaitable[T]], deadline: float,
+                       breaker: Optional[CircuitBreaker] = None, started: Optional[asyncio.Event] = None) -> T:
+        # checked before queueing for the limiter, so rejections are immediate
+        probe = breaker.acquire() if breaker else False
+        failed = None
+        try:
+            async with self._limiter:
+                if started is not None:
+                    started.set()
+                stats.attempts += 1
+                start = time.monotonic()
+                try:
+                    result = await asyncio.wait_for(fn(), deadline)
+                except asyncio.TimeoutError:
+                    stats.deadlines_exceeded += 1
+                    raise DeadlineExceededError(f"no response within {deadline:.0f}s")
+            failed = False
+        except Exception as e:
+            # only errors that say the upstream is struggling count against it
+            failed = is_retryable(e)
+            raise
+        finally:
+            if breaker:
+                breaker.record(probe, failed)
+        stats.latencies.append(time.monotonic() - start)
+        return result
+
+    def _hedge_delay(self, stats: OperationStats) -> Optional[float]:
+        if len(stats.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        if not self._hedge_allowed(stats):
+            return None
+        return percentile(stats.latencies, settings.VERTEX_HEDGE_PERCENTILE)
+
+    def _hedge_allowed(self, stats: OperationStats) -> bool:
+        # A duplicate would only queue behind the same limiter, so don't hedge while it's full
+        locked = getattr(self._limiter, "locked", None)
+        if locked is not None and locked():
+            return False
+        return stats.hedges < settings.VERTEX_HEDGE_MAX_RATIO * stats.calls
+
+    async def _hedged(self, stats: OperationStats, fn: Callable[[], Awaitable[T]], deadline: float,
+                      breaker: Optional[CircuitBreaker] = None) -> T:
+        hedge_delay = self._hedge_delay(stats)
+        if hedge_delay is None:
+            return await self._attempt(stats, fn, deadline, breaker)
+
+        started = asyncio.Event()
+        primary = asyncio.ensure_future(self._attempt(stats, fn, deadline, breaker, started))
+        pending = {primary}
+        try:
+            # The latencies are measured from when an attempt holds the limiter, so time
+            # the primary from there too - not from when it started queueing for it
+            waiting = asyncio.ensure_future(started.wait())
+            try:
+                await asyncio.wait({primary, waiting}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiting.cancel()
+            if not primary.done():
+                await asyncio.wait(pending, timeout=hedge_delay)
+            if primary.done():
+                return primary.result()
+            # Other calls may have used up the budget or filled the limiter in the meantime
+            if not self._hedge_allowed(stats):
+                return await primary
+
+            # Slower than usual: race a duplicate against it
+            stats.hedges += 1
+            hedge = asyncio.ensure_future(self._attempt(stats, fn, deadline, breaker))
+            pending.add(hedge)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            stats.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def get_stats(self) -> dict:
+        return {operation: stats.as_dict() for operation, stats in self._stats.items()}
+
+    def get_circuit_stats(self) -> dict:
+        return {name: breaker.get_stats() for name, breaker in self.breakers.items()}
@@ -1,63 +1,711 @@
-from google.cloud import storage
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from typing import AsyncIterator, Callable, Optional, Tuple, TypeVar
+from urllib.parse import quote, unquote, urlsplit
 from utils.env import settings
+import asyncio
+import hashlib
+import hmac
+import json
+import math
 import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+T = TypeVar("T")
+
+PUBLIC_BASE_URL = "https://storage.googleapis.com"
+# Resumable upload chunks (and composite parts) must be multiples of this
+CHUNK_ALIGNMENT = 256 * 1024
+# GCS composes at most this many objects in one request
+MAX_COMPOSE_SOURCES = 32
+
+# Direct uploads from the browser: accepted types, and the object names handed out for them.
+# Only names of this shape are accepted back as object references, so a client can't make
+# the API read arbitrary objects from the bucket.
+UPLOAD_PREFIX = "uploads/"
+UPLOAD_CONTENT_TYPES = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "video/mp4": "mp4",
+    "video/webm": "webm",
+    "video/quicktime": "mov",
+}
+UPLOAD_OBJECT_PATTERN = re.compile(rf"{UPLOAD_PREFIX}[0-9a-f]{{32}}\.({'|'.join(UPLOAD_CONTENT_TYPES.values())})")
+
+# Route the API serves LocalStorageService objects from
+FILES_ROUTE = "/files"
+
+
+def storage_backend() -> str:
+    """STORAGE_BACKEND, or "gcs" when a bucket is configured and "local" otherwise"""
+    if settings.STORAGE_BACKEND:
+        return settings.STORAGE_BACKEND
+    return "gcs" if settings.GOOGLE_CLOUD_BUCKET_NAME else "local"
+
+
+class StorageService(ABC):
+    """
+    Object storage for media: generated and merged videos, direct uploads.
+    Objects are addressed by name (e.g. videos/merged/<key>.mp4) and published at a URL
+    anyone can GET. See create_storage_service for the implementations.
+    """
 
-class StorageService:
     def __init__(self):
+        self._stats = {
+            "uploads": 0,
+            "bytes_uploaded": 0,
+            "signed_uploads": 0,  # upload URLs handed out for direct browser uploads
+            "downloads": 0,
+            "bytes_downloaded": 0,
+        }
+
+    async def start(self):
+        pass
+
+    @abstractmethod
+    async def upload_file(self, item_name: str, file_data: bytes, content_type: Optional[str] = None, cache_control: Optional[str] = None) -> str:
+        """Store bytes and return the object's public URL"""
+        ...
+
+    @abstractmethod
+    async def upload_path(self, item_name: str, path: str, content_type: Optional[str] = None, cache_control: Optional[str] = None) -> str:
+        """Store a local file without reading it into memory and return the object's public URL"""
+        ...
+
+    @abstractmethod
+    async def upload_stream(self, item_name: str, chunks: AsyncIterator[bytes], content_type: str = "application/octet-stream") -> str:
+        """Store what an async iterator yields; the object only appears if the iterator finishes"""
+        ...
+
+    @abstractmethod
+    async def create_upload(self, content_type: str) -> dict:
+        """
+        A new object under uploads/ and URLs to PUT it directly from the browser and to GET it
+        back: {object, upload_url, upload_headers, download_url, expires_in}. Clients then pass
+        the object name instead of the file (see validate_upload_object).
+        """
+        ...
+
+    @abstractmethod
+    async def download_file(self, item_name: str) -> bytes:
+        """Contents of an object; FileNotFoundError if it doesn't exist"""
+        ...
+
+    @abstractmethod
+    async def download_to_path(self, item_name: str, path: str):
+        """Copy an object to a local file without holding it in memory; FileNotFoundError if it doesn't exist"""
+        ...
+
+    @abstractmethod
+    async def delete_file(self, item_name: str):
+        """Delete an object if it exists"""
+        ...
+
+    @abstractmethod
+    async def find_public_url(self, item_name: str) -> Optional[str]:
+        """Public URL of an existing object, None if it doesn't exist"""
+        ...
+
+    def gs_uri(self, item_name: str) -> Optional[str]:
+        """gs:// URI Vertex AI can read the object from itself, None if it can't"""
+        return None
+
+    def local_path(self, item_name: str) -> Optional[str]:
+        """Path of an existing object on this machine's disk, None if it isn't on it"""
+        return None
+
+    def local_path_for_url(self, url: str) -> Optional[str]:
+        """local_path of the object behind a public URL"""
+        return None
+
+    @staticmethod
+    def validate_upload_object(item_name: str, kind: Optional[str] = None) -> str:
+        """
+        `item_name` if it is an object handed out by create_upload (and, with `kind` "image" or
+        "video", was uploaded as that kind of media), ValueError otherwise
+        """
+        if not UPLOAD_OBJECT_PATTERN.fullmatch(item_name or ""):
+            raise ValueError(f"Not an upload object: {item_name!r}")
+        content_type = StorageService.upload_content_type(item_name)
+        if kind is not None and not content_type.startswith(f"{kind}/"):
+            raise ValueError(f"Expected {kind} upload, got {content_type}: {item_name!r}")
+        return item_name
+
+    @staticmethod
+    def upload_content_type(item_name: str) -> str:
+        extension = item_name.rsplit(".", 1)[-1]
+        return next(content_type for content_type, ext in UPLOAD_CONTENT_TYPES.items() if ext == extension)
+
+    def get_stats(self) -> dict:
+        return {"backend": storage_backend(), **self._stats}
+
+
+class GCSStorageService(StorageService):
+    """
+    Google Cloud Storage access. The SDK is blocking, so every call runs on a dedicated
+    thread pool whose threads share one keep-alive connection pool.
+
+    Objects are made public with a predefined ACL on upload, or not at all on buckets with
+    uniform bucket-level access (where per-object ACLs always fail). The mode is read once
+    in start(), or learned from the first upload if the bucket metadata isn't readable.
+    The client is created by start() or on first use, not on construction.
+    With STORAGE_EMULATOR_HOST set, talks to a local fake-GCS server instead.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._executor = ThreadPoolExecutor(max_workers=settings.STORAGE_IO_WORKERS, thread_name_prefix="storage")
+        # None until known
+        self.uniform_access: Optional[bool] = None
+        self.public_base_url = (settings.STORAGE_EMULATOR_HOST or PUBLIC_BASE_URL).rstrip("/")
+        self._stats.update({
+            "resumable_uploads": 0,  # sent in STORAGE_UPLOAD_CHUNK_BYTES chunks
+            "composite_uploads": 0,  # sent as parallel parts and composed
+            "acl_calls": 0,  # separate make_public requests
+        })
+        # Created on first use (see bucket) so importing and constructing this stays cheap
+        self._client = None
+        self._bucket = None
+        self._connected = False
+        self._connect_lock = threading.Lock()
+
+    @property
+    def client(self):
+        self._connect()
+        return self._client
+
+    @property
+    def bucket(self):
+        """The bucket, None if Cloud Storage isn't configured. The client is created on first access."""
+        self._connect()
+        return self._bucket
+
+    def _connect(self):
+        if self._connected:
+            return
+        with self._connect_lock:
+            if self._connected:
+                return
+            self._create_client()
+            self._connected = True
+
+    def _create_client(self):
         # Only initialize if bucket name is configured
         if settings.GOOGLE_CLOUD_BUCKET_NAME:
             try:
+                from google.cloud import storage
                 from google.oauth2 import service_account
-                
+            
                 # Try to use service account key if provided
                 credentials = None
                 service_account_path = (
                     getattr(settings, 'GOOGLE_APPLICATION_CREDENTIALS', None) or
                     os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
                 )
-                
+            
                 if service_account_path and os.path.exists(service_account_path):
                     credentials = service_account.Credentials.from_service_account_file(
                         service_account_path
                     )
-                
+            
                 # Initialize client with credentials (or use default)
                 # Always pass project ID explicitly
-                if credentials:
-                    self.client = storage.Client(
+                if settings.STORAGE_EMULATOR_HOST:
+                    from google.auth.credentials import AnonymousCredentials
+
+                    self._client = storage.Client(
+                        project=settings.GOOGLE_CLOUD_PROJECT,
+                        credentials=AnonymousCredentials(),
+                        client_options={"api_endpoint": settings.STORAGE_EMULATOR_HOST}
+                    )
+                elif credentials:
+                    self._client = storage.Client(
                         project=settings.GOOGLE_CLOUD_PROJECT,
                         credentials=credentials
                     )
                 else:
-                    self.client = storage.Client(project=settings.GOOGLE_CLOUD_PROJECT)
-                
-                self.bucket = self.client.bucket(settings.GOOGLE_CLOUD_BUCKET_NAME)
+                    self._client = storage.Client(project=settings.GOOGLE_CLOUD_PROJECT)
+            
+                self._pool_connections()
+                self._bucket = self._client.bucket(settings.GOOGLE_CLOUD_BUCKET_NAME)
                 print(f"Successfully initialized Google Cloud Storage with bucket: {settings.GOOGLE_CLOUD_BUCKET_NAME}")
             except Exception as e:
                 import traceback
                 print(f"Warning: Could not initialize Google Cloud Storage: {e}")
                 traceback.print_exc()
-                self.client = None
-                self.bucket = None
+                self._client = None
+                self._bucket = None
         else:
             print("Warning: GOOGLE_CLOUD_BUCKET_NAME not set in environment")
-            self.client = None
-            self.bucket = None
+            self._client = None
+            self._bucket = None
 
-    async def upload_file(self, item_name: str, file_data: bytes):
+    def _pool_connections(self):
+        """Size the session's connection pool so each storage thread keeps its own connection alive"""
+        from requests.adapters import HTTPAdapter
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.STORAGE_IO_WORKERS)
+        session = self._client._http
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    async def _run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def start(self):
+        """Create the client (off the event loop) and read the bucket's ACL mode once, instead of finding out on every upload"""
+        bucket = await self._run(lambda: self.bucket)
+        if not bucket or self.uniform_access is not None:
+            return
+        try:
+            await self._run(self.bucket.reload)
+        except Exception as e:
+            # e.g. no storage.buckets.get permission - the first upload will tell
+            print(f"Warning: Could not read bucket metadata, detecting ACL mode on first upload: {e}")
+            return
+        self.uniform_access = bool(self.bucket.iam_configuration.uniform_bucket_level_access_enabled)
+        print(f"   Storage: uniform bucket-level access {'on' if self.uniform_access else 'off'}")
+
+    def _predefined_acl(self) -> Optional[str]:
+        return "publicRead" if self.uniform_access is False else None
+
+    async def upload_file(self, item_name: str, file_data: bytes, content_type: Optional[str] = None, cache_control: Optional[str] = None):
+        """
+        Upload bytes and return the object's public URL. Small objects go in one request,
+        larger ones as a chunked resumable upload, and ones of STORAGE_COMPOSITE_THRESHOLD_BYTES
+        or more as parallel parts composed into the object.
+        """
         if not self.bucket:
             raise ValueError("Google Cloud Storage not configured. Set GOOGLE_CLOUD_BUCKET_NAME in .env")
         
+        size = len(file_data)
+        chunked = size > settings.STORAGE_UPLOAD_CHUNK_BYTES
+        blob = self.bucket.blob(item_name, chunk_size=settings.STORAGE_UPLOAD_CHUNK_BYTES if chunked else None)
+        if cache_control:
+            blob.cache_control = cache_control
+        if content_type:
+            blob.content_type = content_type
+        acl_applied = False
+        if size >= settings.STORAGE_COMPOSITE_THRESHOLD_BYTES:
+            await self._upload_composite(blob, file_data, content_type)
+            self._stats["composite_uploads"] += 1
+        else:
+            predefined_acl = self._predefined_acl()
+            await self._run(blob.upload_from_string, file_data, content_type=content_type, predefined_acl=predefined_acl)
+            acl_applied = predefined_acl is not None
+            if chunked:
+                self._stats["resumable_uploads"] += 1
+        self._stats["uploads"] += 1
+        self._stats["bytes_uploaded"] += size
+        if not acl_applied:
+            await self._make_public(blob)
+        return self._public_url(blob)
+
+    async def upload_path(self, item_name: str, path: str, content_type: Optional[str] = None, cache_control: Optional[str] = None) -> str:
+        """Upload a local file (streamed from disk, chunked resumable when it's big) and return its public URL"""
+        if not self.bucket:
+            raise ValueError("Google Cloud Storage not configured. Set GOOGLE_CLOUD_BUCKET_NAME in .env")
+
+        size = os.path.getsize(path)
+        chunked = size > settings.STORAGE_UPLOAD_CHUNK_BYTES
+        blob = self.bucket.blob(item_name, chunk_size=settings.STORAGE_UPLOAD_CHUNK_BYTES if chunked else None)
+        if cache_control:
+            blob.cache_control = cache_control
+        predefined_acl = self._predefined_acl()
+        await self._run(blob.upload_from_filename, path, content_type=content_type, predefined_acl=predefined_acl)
+        self._stats["uploads"] += 1
+        self._stats["bytes_uploaded"] += size
+        if chunked:
+            self._stats["resumable_uploads"] += 1
+        if predefined_acl is None:
+            await self._make_public(blob)
+        return self._public_url(blob)
+
+    async def _upload_composite(self, blob, data: bytes, content_type: Optional[str]):
+        """Upload `data` as STORAGE_COMPOSITE_PARTS objects in parallel, compose them into `blob`, drop the parts"""
+        parts_count = min(settings.STORAGE_COMPOSITE_PARTS, MAX_COMPOSE_SOURCES)
+        part_size = math.ceil(len(data) / parts_count / CHUNK_ALIGNMENT) * CHUNK_ALIGNMENT
+        prefix = f"{blob.name}.part-{uuid.uuid4().hex[:8]}"
+        parts = [
+            self.bucket.blob(f"{prefix}-{i}")
+            for i in range(math.ceil(len(data) / part_size))
+        ]
+        try:
+            await asyncio.gather(*(
+                self._run(part.upload_from_string, data[i * part_size:(i + 1) * part_size], content_type=content_type)
+                for i, part in enumerate(parts)
+            ))
+            # the destination's content type / cache control come from `blob`'s properties
+            await self._run(blob.compose, parts)
+        finally:
+            await asyncio.gather(*(self.delete_file(part.name) for part in parts), return_exceptions=True)
+
+    async def _make_public(self, blob):
+        """Grant public read with a separate request - skipped for uniform-access buckets"""
+        if self.uniform_access:
+            return
+        self._stats["acl_calls"] += 1
+        try:
+            await self._run(blob.make_public)
+            if self.uniform_access is None:
+                self.uniform_access = False
+        except Exception as e:
+            if self.uniform_access is None:
+                # Uniform bucket-level access: objects are public through the bucket's IAM policy
+                print(f"   Storage: per-object ACLs rejected ({e}), assuming uniform bucket-level access")
+                self.uniform_access = True
+
+    async def create_upload(self, content_type: str) -> dict:
+        """
+        A new object under uploads/ and V4 signed URLs to PUT it directly from the browser and
+        to GET it back, so media bytes never pass through the API. The PUT must send the
+        returned headers; GCS rejects bodies over STORAGE_UPLOAD_MAX_BYTES.
+        Clients then pass the object name instead of the file (see validate_upload_object).
+        """
+        if not self.bucket:
+            raise ValueError("Google Cloud Storage not configured. Set GOOGLE_CLOUD_BUCKET_NAME in .env")
+        extension = UPLOAD_CONTENT_TYPES.get(content_type)
+        if extension is None:
+            raise ValueError(f"content_type must be one of: {', '.join(UPLOAD_CONTENT_TYPES)}")
+
+        item_name = f"{UPLOAD_PREFIX}{uuid.uuid4().hex}.{extension}"
+        size_header = {"x-goog-content-length-range": f"0,{settings.STORAGE_UPLOAD_MAX_BYTES}"}
+        upload_url = await self._run(self._signed_url, item_name, "PUT", content_type, size_header)
+        download_url = await self._run(self._signed_url, item_name, "GET")
+        self._stats["signed_uploads"] += 1
+        return {
+            "object": item_name,
+            "upload_url": upload_url,
+            "upload_headers": {"Content-Type": content_type, **size_header},
+            "download_url": download_url,
+            "expires_in": settings.STORAGE_SIGNED_URL_TTL_SECONDS,
+        }
+
+    def _signed_url(self, item_name: str, method: str, content_type: Optional[str] = None, headers: Optional[dict] = None) -> str:
         blob = self.bucket.blob(item_name)
-        blob.upload_from_string(file_data)
-        
-        # Try to make the blob publicly readable
-        # If uniform bucket-level access is enabled, this will fail
-        try:
-            blob.make_public()
-            return blob.public_url
-        except Exception:
-            # If uniform bucket-level access is enabled, return the public URL format
-            # Format: https://storage.googleapis.com/{bucket_name}/{object_name}
-            bucket_name = self.bucket.name
-            return f"https://storage.googleapis.com/{bucket_name}/{item_name}"
+        if settings.STORAGE_EMULATOR_HOST:
+            # The emulator takes unsigned path-style requests - the same URL shape, minus the signature
+            return self._public_url(blob)
+        return blob.generate_signed_url(
+            version="v4",
+            expiration=timedelta(seconds=settings.STORAGE_SIGNED_URL_TTL_SECONDS),
+            method=method,
+            content_type=content_type,
+            headers=headers,
+            **self._signing_credentials()
+        )
+
+    def _signing_credentials(self) -> dict:
+        """Credentials without a private key (e.g. Cloud Run's metadata server) sign through IAM signBlob"""
+        from google.auth.credentials import Signing
+        from google.auth.transport.requests import Request
+
+        credentials = self.client._credentials
+        if isinstance(credentials, Signing):
+            return {}
+        if not credentials.valid:
+            credentials.refresh(Request())
+        return {"service_account_email": credentials.service_account_email, "access_token": credentials.token}
+
+    def gs_uri(self, item_name: str) -> Optional[str]:
+        if settings.STORAGE_EMULATOR_HOST:
+            # Vertex AI can't reach the emulator
+            return None
+        return f"gs://{self.bucket.name}/{item_name}"
+
+    async def download_file(self, item_name: str) -> bytes:
+        if not self.bucket:
+            raise ValueError("Google Cloud Storage not configured. Set GOOGLE_CLOUD_BUCKET_NAME in .env")
+        from google.api_core.exceptions import NotFound
+
+        blob = self.bucket.blob(item_name)
+        try:
+            data = await self._run(blob.download_as_bytes)
+        except NotFound:
+            raise FileNotFoundError(f"Object not found: {item_name}")
+        self._stats["downloads"] += 1
+        self._stats["bytes_downloaded"] += len(data)
+        return data
+
+    async def download_to_path(self, item_name: str, path: str):
+        """Download an object straight to a local file, without holding it in memory"""
+        if not self.bucket:
+            raise ValueError("Google Cloud Storage not configured. Set GOOGLE_CLOUD_BUCKET_NAME in .env")
+        from google.api_core.exceptions import NotFound
+
+        blob = self.bucket.blob(item_name)
+        try:
+            await self._run(blob.download_to_filename, path)
+        except NotFound:
+            raise FileNotFoundError(f"Object not found: {item_name}")
+        self._stats["downloads"] += 1
+        self._stats["bytes_downloaded"] += os.path.getsize(path)
+
+    async def delete_file(self, item_name: str):
+        """Delete an object if it exists"""
+        if not self.bucket:
+            return
+        from google.api_core.exceptions import NotFound
+
+        blob = self.bucket.blob(item_name)
+        try:
+            await self._run(blob.delete)
+        except NotFound:
+            pass
+
+    async def upload_stream(self, item_name: str, chunks: AsyncIterator[bytes], content_type: str = "application/octet-stream") -> str:
+        """
+        Resumable upload fed by an async iterator, without ever holding the whole object.
+        A reader task keeps pulling from `chunks` into a small bounded queue while earlier data
+        is being uploaded, so producing (e.g. ffmpeg) and uploading overlap. Peak memory is
+        about STORAGE_UPLOAD_CHUNK_BYTES plus STORAGE_STREAM_QUEUE_CHUNKS read chunks.
+        The object is only created if the iterator finishes without raising.
+        """
+        if not self.bucket:
+            raise ValueError("Google Cloud Storage not configured. Set GOOGLE_CLOUD_BUCKET_NAME in .env")
+
+        blob = self.bucket.blob(item_name, chunk_size=settings.STORAGE_UPLOAD_CHUNK_BYTES)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.STORAGE_STREAM_QUEUE_CHUNKS)
+        done = object()
+
+        async def read_chunks():
+            async for chunk in chunks:
+                await queue.put(chunk)
+            await queue.put(done)
+
+        reader = asyncio.create_task(read_chunks())
+        try:
+            predefined_acl = self._predefined_acl()
+            writer = await self._run(blob.open, "wb", content_type=content_type, predefined_acl=predefined_acl)
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                # fail fast if the producer raised instead of waiting on an empty queue
+                waiters = {get} if reader.done() else {get, reader}
+                await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+                if not get.done():
+                    get.cancel()
+                    reader.result()  # re-raises the producer's error
+                    continue
+                chunk = get.result()
+                if chunk is done:
+                    break
+                await self._run(writer.write, chunk)
+            # finalizes the resumable session - only reached when every chunk arrived
+            await self._run(writer.close)
+        finally:
+            if not reader.done():
+                reader.cancel()
+            try:
+                await reader
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._stats["uploads"] += 1
+        self._stats["resumable_uploads"] += 1
+        if predefined_acl is None:
+            await self._make_public(blob)
+        return self._public_url(blob)
+
+    async def find_public_url(self, item_name: str) -> Optional[str]:
+        """Public URL of an existing object, None if it doesn't exist"""
+        if not self.bucket:
+            return None
+        blob = self.bucket.blob(item_name)
+        if not await self._run(blob.exists):
+            return None
+        return self._public_url(blob)
+
+    def _public_url(self, blob) -> str:
+        # Format: https://storage.googleapis.com/{bucket_name}/{object_name}
+        return f"{self.public_base_url}/{self.bucket.name}/{quote(blob.name, safe='/~')}"
+
+    def get_stats(self) -> dict:
+        return {
+            **super().get_stats(),
+            "uniform_access": self.uniform_access,
+        }
+
+
+class LocalStorageService(StorageService):
+    """
+    Objects as files under LOCAL_STORAGE_DIR, served by the API itself at /files/<name> -
+    development, benchmarks and single-box deployments without a cloud account.
+
+    Writes go to a temp file that atomically replaces the object, so readers (and an ffmpeg
+    reading an object in place) never see a partial file. Content type and cache control
+    live next to the objects in .meta/. Local files are copied with copy_file_range /
+    sendfile, and merges read objects in place (see local_path_for_url). Upload URLs are
+    signed with an HMAC of LOCAL_STORAGE_SIGNING_KEY (random per process when unset - set
+    it for several workers).
+    """
+
+    META_DIR = ".meta"
+
+    def __init__(self):
+        super().__init__()
+        self.root = os.path.abspath(settings.LOCAL_STORAGE_DIR)
+        os.makedirs(self.root, exist_ok=True)
+        self.public_base_url = f"{settings.LOCAL_STORAGE_BASE_URL.rstrip('/')}{FILES_ROUTE}"
+        self._signing_key = settings.LOCAL_STORAGE_SIGNING_KEY.encode() if settings.LOCAL_STORAGE_SIGNING_KEY else os.urandom(32)
+        print(f"Using local storage in {self.root}, served at {self.public_base_url}")
+
+    def _path(self, item_name: str) -> str:
+        """Filesystem path of an object; ValueError for names that would leave the root or hit internals"""
+        parts = item_name.split("/")
+        if not item_name or any(part in ("", ".", "..") or part.startswith(".") for part in parts):
+            raise ValueError(f"Invalid object name: {item_name!r}")
+        return os.path.join(self.root, *parts)
+
+    def _meta_path(self, item_name: str) -> str:
+        return os.path.join(self.root, self.META_DIR, *item_name.split("/")) + ".json"
+
+    def _public_url(self, item_name: str) -> str:
+        return f"{self.public_base_url}/{quote(item_name, safe='/~')}"
+
+    def _commit(self, item_name: str, write: Callable[[str], None], content_type: Optional[str], cache_control: Optional[str]):
+        """Produce the object with `write(temp_path)`, then atomically move it (and its metadata) in place"""
+        path = self._path(item_name)
+        meta_path = self._meta_path(item_name)
+        for directory in (os.path.dirname(path), os.path.dirname(meta_path)):
+            os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump({"content_type": content_type, "cache_control": cache_control}, f)
+            os.replace(meta_path + ".tmp", meta_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._stats["uploads"] += 1
+        self._stats["bytes_uploaded"] += os.path.getsize(path)
+
+    async def upload_file(self, item_name: str, file_data: bytes, content_type: Optional[str] = None, cache_control: Optional[str] = None) -> str:
+        def write(tmp_path: str):
+            with open(tmp_path, "wb") as f:
+                f.write(file_data)
+
+        await asyncio.to_thread(self._commit, item_name, write, content_type, cache_control)
+        return self._public_url(item_name)
+
+    async def upload_path(self, item_name: str, path: str, content_type: Optional[str] = None, cache_control: Optional[str] = None) -> str:
+        # copyfile copies in the kernel (copy_file_range / sendfile) on Linux
+        await asyncio.to_thread(self._commit, item_name, partial(shutil.copyfile, path), content_type, cache_control)
+        return self._public_url(item_name)
+
+    async def upload_stream(self, item_name: str, chunks: AsyncIterator[bytes], content_type: str = "application/octet-stream") -> str:
+        path = self._path(item_name)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+        fd, spool_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    await asyncio.to_thread(f.write, chunk)
+            await asyncio.to_thread(self._commit, item_name, partial(os.replace, spool_path), content_type, None)
+        finally:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+        return self._public_url(item_name)
+
+    def _signature(self, item_name: str, expires: int) -> str:
+        return hmac.new(self._signing_key, f"PUT\n{item_name}\n{expires}".encode(), hashlib.sha256).hexdigest()
+
+    def verify_upload(self, item_name: str, expires: int, signature: str) -> bool:
+        """Whether a PUT to /files/<item_name> carries a valid, unexpired signature from create_upload"""
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(item_name, expires), signature)
+
+    async def create_upload(self, content_type: str) -> dict:
+        extension = UPLOAD_CONTENT_TYPES.get(content_type)
+        if extension is None:
+            raise ValueError(f"content_type must be one of: {', '.join(UPLOAD_CONTENT_TYPES)}")
+        item_name = f"{UPLOAD_PREFIX}{uuid.uuid4().hex}.{extension}"
+        expires = int(time.time()) + settings.STORAGE_SIGNED_URL_TTL_SECONDS
+        self._stats["signed_uploads"] += 1
+        return {
+            "object": item_name,
+            "upload_url": f"{self._public_url(item_name)}?expires={expires}&signature={self._signature(item_name, expires)}",
+            "upload_headers": {"Content-Type": content_type},
+            "download_url": self._public_url(item_name),
+            "expires_in": settings.STORAGE_SIGNED_URL_TTL_SECONDS,
+        }
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def download_file(self, item_name: str) -> bytes:
+        path = self.local_path(item_name)
+        if path is None:
+            raise FileNotFoundError(f"Object not found: {item_name}")
+        data = await asyncio.to_thread(self._read, path)
+        self._stats["downloads"] += 1
+        self._stats["bytes_downloaded"] += len(data)
+        return data
+
+    async def download_to_path(self, item_name: str, path: str):
+        source = self.local_path(item_name)
+        if source is None:
+            raise FileNotFoundError(f"Object not found: {item_name}")
+        await asyncio.to_thread(shutil.copyfile, source, path)
+        self._stats["downloads"] += 1
+        self._stats["bytes_downloaded"] += os.path.getsize(path)
+
+    async def delete_file(self, item_name: str):
+        for path in (self._path(item_name), self._meta_path(item_name)):
+            try:
+                await asyncio.to_thread(os.remove, path)
+            except FileNotFoundError:
+                pass
+
+    async def find_public_url(self, item_name: str) -> Optional[str]:
+        return self._public_url(item_name) if self.local_path(item_name) else None
+
+    def local_path(self, item_name: str) -> Optional[str]:
+        try:
+            path = self._path(item_name)
+        except ValueError:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def local_path_for_url(self, url: str) -> Optional[str]:
+        prefix = f"{self.public_base_url}/"
+        if not url.startswith(prefix):
+            return None
+        return self.local_path(unquote(urlsplit(url).path[len(urlsplit(prefix).path):]))
+
+    def file_info(self, item_name: str) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """(path, content type, cache control) of an existing object, for serving it"""
+        path = self.local_path(item_name)
+        if path is None:
+            return None
+        try:
+            with open(self._meta_path(item_name)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        return path, meta.get("content_type"), meta.get("cache_control")
+
+    def get_stats(self) -> dict:
+        return {**super().get_stats(), "root": self.root}
+
+
+def create_storage_service() -> StorageService:
+    """Cloud Storage when a bucket is configured (or STORAGE_BACKEND=gcs), otherwise local disk"""
+    if storage_backend() == "gcs":
+        return GCSStorageService()
+    if not settings.STORAGE_BACKEND:
+        print("Warning: GOOGLE_CLOUD_BUCKET_NAME not set, storing media on local disk")
+    return LocalStorageService()
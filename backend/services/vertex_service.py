@@ -1,59 +1,161 @@
+import asyncio
+import hashlib
 import os
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Iterable
 
-from google import genai
-from google.genai.types import GenerateVideosConfig, GenerateVideosOperation, Image, GenerateContentConfig, ImageConfig, Part, VideoGenerationReferenceImage
 from models.job import JobStatus
+from services.frame_cache import FrameCache
+from services.resilience import Resilience
+from services.storage_service import storage_backend
+from utils.cache import LRUCache
 from utils.env import settings
+from utils.image import sniff_mime_type
+from utils.stats import percentile
+
+# google-genai takes a good part of a second to import, so it is loaded on first use
+# (see VertexService.client and the imports inside the methods) instead of at startup
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai.types import GenerateContentConfig, GenerateVideosOperation
 
 # Set Google Application Credentials BEFORE creating any Google clients
 # This is required for Vertex AI authentication to work
 if settings.GOOGLE_APPLICATION_CREDENTIALS:
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = settings.GOOGLE_APPLICATION_CREDENTIALS
 
+IMAGE_MODEL = "gemini-2.5-flash-image"
+TEXT_MODEL = "gemini-2.0-flash"
+VIDEO_MODEL = "veo-3.1-fast-generate-001"
+
 class VertexService:
-    def __init__(self):
-        self.client = genai.Client(
-            vertexai=settings.GOOGLE_GENAI_USE_VERTEXAI,
-            project=settings.GOOGLE_CLOUD_PROJECT,
-            location=settings.GOOGLE_CLOUD_LOCATION
-        )
+    def __init__(self, client: "genai.Client" = None):
+        # A pre-built client can be injected (e.g. a fake with fixed latency for benchmarks);
+        # otherwise it is created on first use
+        self._client = client
         self.bucket_name = settings.GOOGLE_CLOUD_BUCKET_NAME
+        # All calls go through the SDK's async surface (client.aio) so they never block the
+        # event loop; the semaphore caps how many are in flight at once per process.
+        self._semaphore = asyncio.Semaphore(settings.VERTEX_MAX_CONCURRENCY)
+        # Deadlines, retries with backoff and hedging; holds the semaphore per attempt
+        self.resilience = Resilience(limiter=self._semaphore)
+        self.frame_cache = FrameCache()
+        # Annotation descriptions depend only on the image and a constant prompt
+        self.analysis_cache = LRUCache(
+            settings.ANALYSIS_CACHE_MAX_BYTES,
+            sizeof=lambda text: len(text.encode()),
+            ttl=settings.ANALYSIS_CACHE_TTL_SECONDS
+        )
+        # generate_content calls per model: recent latencies (seconds) and inline bytes sent
+        self._latencies = {IMAGE_MODEL: deque(maxlen=200), TEXT_MODEL: deque(maxlen=200)}
+        self._bytes_sent = {IMAGE_MODEL: 0, TEXT_MODEL: 0}
+        # analyze_and_clean_frame: single calls that returned both parts, and fallbacks to two calls
+        self.combined_stats = {"calls": 0, "fallbacks": 0}
+
+    @property
+    def client(self) -> "genai.Client":
+        if self._client is None:
+            from google import genai
+
+            self._client = genai.Client(
+                vertexai=settings.GOOGLE_GENAI_USE_VERTEXAI,
+                project=settings.GOOGLE_CLOUD_PROJECT,
+                location=settings.GOOGLE_CLOUD_LOCATION
+            )
+        return self._client
+
+    async def warm_up(self):
+        """Import the SDK and create the client ahead of the first request"""
+        await asyncio.to_thread(lambda: self.client)
+
+    async def _generate_content(self, model: str, contents: list, config: "GenerateContentConfig" = None):
+        """
+        client.aio.models.generate_content under the concurrency limit, with retries and
+        latency/size metrics. Image-only answers (frame cleanup) may be hedged.
+        """
+        from google.genai.types import Part
+
+        sent = sum(len(part.inline_data.data) for part in contents if isinstance(part, Part) and part.inline_data)
+        returns_image = config is not None and "IMAGE" in (config.response_modalities or [])
+        start = time.perf_counter()
+        response = await self.resilience.call(
+            model,
+            lambda: self.client.aio.models.generate_content(model=model, contents=contents, config=config),
+            deadline=settings.VERTEX_IMAGE_DEADLINE if returns_image else settings.VERTEX_TEXT_DEADLINE,
+            hedge=settings.VERTEX_HEDGE_IMAGE_CALLS and config is not None and config.response_modalities == ["IMAGE"],
+            circuit=model,
+        )
+        self._latencies.setdefault(model, deque(maxlen=200)).append(time.perf_counter() - start)
+        self._bytes_sent[model] = self._bytes_sent.get(model, 0) + sent
+        return response
+
+    def get_stats(self) -> dict:
+        stats = {
+            model: {
+                "calls": len(latencies),
+                "bytes_sent": self._bytes_sent.get(model, 0),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            }
+            for model, latencies in self._latencies.items()
+        }
+        stats["combined_frame_calls"] = dict(self.combined_stats)
+        stats["resilience"] = self.resilience.get_stats()
+        stats["circuits"] = self.resilience.get_circuit_stats()
+        return stats
+
+    def check_available(self, models: Iterable[str]):
+        """Raise CircuitOpenError if the circuit breaker of any of `models` is rejecting calls"""
+        self.resilience.check(models)
+
+    async def generate_video_content(self, prompt: str, image_data: bytes = None, ending_image_data: bytes = None, duration_seconds: int = 6) -> "GenerateVideosOperation":
+        from google.genai.types import GenerateVideosConfig, Image
 
-    async def generate_video_content(self, prompt: str, image_data: bytes = None, ending_image_data: bytes = None, duration_seconds: int = 6) -> GenerateVideosOperation:
         ending_frame = None
         if ending_image_data:
             ending_frame = Image(
                 image_bytes=ending_image_data,
-                mime_type="image/png",
+                mime_type=sniff_mime_type(ending_image_data),
             )
 
         # gen vid
-        operation = self.client.models.generate_videos(
-            model="veo-3.1-fast-generate-001",
-            prompt=prompt,
-            image=Image(
-                image_bytes=image_data,
-                mime_type="image/png",
-            ),
-            config=GenerateVideosConfig(
-                aspect_ratio="16:9",
-                duration_seconds=duration_seconds,
-                output_gcs_uri=f"gs://{self.bucket_name}/videos/",
-                negative_prompt="text, captions, subtitles, annotations, low quality, static, ugly, weird physics",
-                last_frame=ending_frame,
+        # Not idempotent (each success starts a billed operation): only retried when rejected outright
+        operation = await self.resilience.call(
+            "veo.generate_videos",
+            lambda: self.client.aio.models.generate_videos(
+                model=VIDEO_MODEL,
+                prompt=prompt,
+                image=Image(
+                    image_bytes=image_data,
+                    mime_type=sniff_mime_type(image_data),
+                ),
+                config=GenerateVideosConfig(
+                    aspect_ratio="16:9",
+                    duration_seconds=duration_seconds,
+                    # Without a bucket Veo returns the video inline (see JobService._refresh_job)
+                    output_gcs_uri=f"gs://{self.bucket_name}/videos/" if storage_backend() == "gcs" else None,
+                    negative_prompt="text, captions, subtitles, annotations, low quality, static, ugly, weird physics",
+                    last_frame=ending_frame,
+                ),
             ),
+            deadline=settings.VERTEX_VIDEO_DEADLINE,
+            idempotent=False,
+            circuit=VIDEO_MODEL,
         )
 
         return operation
     
     async def _generate_image_raw(self, prompt: str, image: bytes) -> bytes:
         """Generate image and return raw bytes (for internal use like video generation)"""
-        response = self.client.models.generate_content(
-            model="gemini-2.5-flash-image",
+        from google.genai.types import GenerateContentConfig, ImageConfig, Part
+
+        response = await self._generate_content(
+            model=IMAGE_MODEL,
             contents=[
                 Part.from_bytes(
                     data=image,
-                    mime_type="image/png",
+                    mime_type=sniff_mime_type(image),
                 ),
                 prompt,
             ],
@@ -70,55 +172,179 @@ class VertexService:
         
         return response.candidates[0].content.parts[0].inline_data.data
     
+    async def clean_frame(self, prompt: str, image: bytes) -> bytes:
+        """_generate_image_raw for deterministic frame cleanup, cached by image content"""
+        key = FrameCache.key(image, prompt, IMAGE_MODEL)
+        return await self.frame_cache.get_or_create(key, lambda: self._generate_image_raw(prompt, image))
+
     async def generate_image_content(self, prompt: str, image: bytes) -> str:
         """Generate image and return base64-encoded string (for API responses)"""
         import base64
         image_bytes = await self._generate_image_raw(prompt, image)
         return base64.b64encode(image_bytes).decode('utf-8')
     
-    async def get_video_status(self, operation: GenerateVideosOperation) -> JobStatus:
-        operation = self.client.operations.get(operation)
+    async def _get_operation(self, operation: "GenerateVideosOperation") -> "GenerateVideosOperation":
+        # A single attempt: the status poller simply tries again on its next round
+        return await self.resilience.call(
+            "veo.operations_get",
+            lambda: self.client.aio.operations.get(operation),
+            deadline=settings.VERTEX_VIDEO_DEADLINE,
+            attempts=1,
+        )
+
+    @staticmethod
+    def _video_status(operation: "GenerateVideosOperation") -> JobStatus:
         if operation.done and operation.result and operation.result.generated_videos:
-            return JobStatus(status="done", job_start_time=None, video_url=operation.result.generated_videos[0].video.uri)
+            video = operation.result.generated_videos[0].video
+            return JobStatus(status="done", job_start_time=None, video_url=video.uri,
+                             video_bytes=None if video.uri else video.video_bytes)
+        if operation.done:
+            # Finished without a video: the operation failed or every video was filtered out
+            return JobStatus(status="error", job_start_time=None, video_url=None,
+                             error=VertexService._video_error(operation))
         return JobStatus(status="waiting", job_start_time=None, video_url=None)
+
+    @staticmethod
+    def _video_error(operation: "GenerateVideosOperation") -> str:
+        if operation.error:
+            return operation.error.get("message") or f"Video generation failed: {operation.error}"
+        reasons = operation.result.rai_media_filtered_reasons if operation.result else None
+        if reasons:
+            return f"Video was blocked by safety filters: {' '.join(reasons)}"
+        return "Video generation finished without a video"
+
+    async def get_video_status(self, operation: "GenerateVideosOperation") -> JobStatus:
+        return self._video_status(await self._get_operation(operation))
     
     async def get_video_status_by_name(self, operation_name: str) -> JobStatus:
         """Get video status by operation name (avoids serialization)"""
         # Create a minimal operation object with just the name since get() expects an operation object
+        from google.genai.types import GenerateVideosOperation
+
         operation = GenerateVideosOperation(name=operation_name)
-        operation = self.client.operations.get(operation)
-        if operation.done and operation.result and operation.result.generated_videos:
-            return JobStatus(status="done", job_start_time=None, video_url=operation.result.generated_videos[0].video.uri)
-        return JobStatus(status="waiting", job_start_time=None, video_url=None)
+        return self._video_status(await self._get_operation(operation))
     
-    def analyze_video_content(self, prompt: str, video_data: bytes) -> dict:
-        return self.client.models.generate_content(
-            model="gemini-2.0-flash",
+    async def analyze_video_content(self, prompt: str, video_data: bytes = None, video_uri: str = None, mime_type: str = "video/mp4") -> str:
+        """Answer a prompt about a whole video, sent inline or as a gs:// URI Gemini reads itself"""
+        from google.genai.types import Part
+
+        if video_uri:
+            video = Part.from_uri(file_uri=video_uri, mime_type=mime_type)
+        else:
+            video = Part.from_bytes(data=video_data, mime_type=mime_type)
+        response = await self._generate_content(
+            model=TEXT_MODEL,
             contents=[
-                Part.from_bytes(
-                    data=video_data.data,
-                    mime_type="video/mp4",
-                ),
+                video,
+                prompt
+                ]
+        )
+        return response.text or response.candidates[0].content.parts[0].text
+
+    async def analyze_video_keyframes(self, prompt: str, frames: list[bytes]) -> str:
+        """Answer a prompt about a video from a few JPEG keyframes, in chronological order"""
+        from google.genai.types import Part
+
+        response = await self._generate_content(
+            model=TEXT_MODEL,
+            contents=[
+                *(Part.from_bytes(data=frame, mime_type="image/jpeg") for frame in frames),
                 prompt
                 ]
         )
+        return response.text or response.candidates[0].content.parts[0].text
     
-    async def analyze_image_content(self, prompt: str, image_data: bytes) -> dict:
-        return self.client.models.generate_content(
-            model="gemini-2.0-flash",
+    @staticmethod
+    def _analysis_key(image_data: bytes, prompt: str) -> tuple:
+        return (hashlib.sha256(image_data).hexdigest(), prompt, TEXT_MODEL)
+
+    async def analyze_image_content(self, prompt: str, image_data: bytes) -> str:
+        """Describe an image; memoized by image digest so retries of the same frame are free"""
+        cache_key = self._analysis_key(image_data, prompt)
+        description = self.analysis_cache.get(cache_key)
+        if description is not None:
+            return description
+
+        from google.genai.types import Part
+
+        response = await self._generate_content(
+            model=TEXT_MODEL,
             contents=[
                 Part.from_bytes(
                     data=image_data,
-                    mime_type="image/png",
+                    mime_type=sniff_mime_type(image_data),
                 ),
                 prompt
                 ]
-        ).candidates[0].content.parts[0].text.strip()
-    
+        )
+        description = response.candidates[0].content.parts[0].text.strip()
+        self.analysis_cache.set(cache_key, description)
+        return description
 
-    async def test_service(self):
-        return self.client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents="Hi there, does u work?",
+
+    async def analyze_and_clean_frame(self, analysis_prompt: str, cleanup_prompt: str, image: bytes) -> tuple[str, bytes]:
+        """
+        analyze_image_content and clean_frame for the same image, as one image-model call that
+        answers with a text part and an image part. Uploads the image once and saves a call.
+        Falls back to the two separate calls if that call fails or is missing either part.
+        Results land in the same caches as the separate calls.
+        """
+        analysis_key = self._analysis_key(image, analysis_prompt)
+        frame_key = FrameCache.key(image, cleanup_prompt, IMAGE_MODEL)
+        if self.analysis_cache.get(analysis_key) is None and await self.frame_cache.get(frame_key) is None:
+            try:
+                description, cleaned = await self._generate_text_and_image(
+                    f"Answer with text and an image.\nText: {analysis_prompt}\nImage: {cleanup_prompt}",
+                    image
+                )
+                self.combined_stats["calls"] += 1
+                # the description stands in for TEXT_MODEL's, so later separate calls reuse it
+                self.analysis_cache.set(analysis_key, description)
+                await self.frame_cache.set(frame_key, cleaned)
+                return description, cleaned
+            except Exception as e:
+                self.combined_stats["fallbacks"] += 1
+                print(f"[ERROR] Combined analysis + cleanup call failed, using two calls: {e}")
+
+        description, cleaned = await asyncio.gather(
+            self.analyze_image_content(analysis_prompt, image),
+            self.clean_frame(cleanup_prompt, image)
         )
+        return description, cleaned
+
+    async def _generate_text_and_image(self, prompt: str, image: bytes) -> tuple[str, bytes]:
+        from google.genai.types import GenerateContentConfig, ImageConfig, Part
+
+        response = await self._generate_content(
+            model=IMAGE_MODEL,
+            contents=[
+                Part.from_bytes(
+                    data=image,
+                    mime_type=sniff_mime_type(image),
+                ),
+                prompt,
+            ],
+            config=GenerateContentConfig(
+                response_modalities=["TEXT", "IMAGE"],
+                image_config=ImageConfig(
+                    aspect_ratio="16:9",
+                ),
+                candidate_count=1,
+            ),
+        )
+        candidate = response.candidates[0] if response.candidates else None
+        parts = candidate.content.parts if candidate and candidate.content and candidate.content.parts else []
+        text = "".join(part.text for part in parts if part.text and not part.thought).strip()
+        image_data = next((part.inline_data.data for part in parts if part.inline_data), None)
+        if not text or not image_data:
+            kinds = [("text" if part.text else "image" if part.inline_data else "other") for part in parts]
+            raise ValueError(f"Expected a text and an image part, got: {kinds or 'no parts'}")
+        return text, image_data
+
+    async def test_service(self):
+        async with self._semaphore:
+            return await self.client.aio.models.generate_content(
+                model=TEXT_MODEL,
+                contents="Hi there, does u work?",
+            )
 
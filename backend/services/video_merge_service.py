@@ -1,34 +1,96 @@
 import asyncio
+import hashlib
+import os
+import tempfile
 import time
+import traceback
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 from services.storage_service import StorageService
+from services.clip_cache import ClipCache
+from services.merge_scheduler import MergeScheduler
+from utils import ffmpeg
+from utils.cache import LRUCache, SingleFlight
+from utils.env import settings
+from utils.ffmpeg import FFmpegError, read_stderr_tail
 import uuid
 import shutil
 
+# ffmpeg stdout read size; the upload buffers up to STORAGE_UPLOAD_CHUNK_BYTES on top
+READ_CHUNK_BYTES = 1024 * 1024
+# How often the HLS output directory is checked for finished segments
+HLS_POLL_INTERVAL = 0.5
+HLS_PLAYLIST = "index.m3u8"
+# Segments never change once written; the playlist grows until #EXT-X-ENDLIST
+HLS_SEGMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+HLS_PLAYLIST_CACHE_CONTROL = "no-cache"
+OUTPUT_FORMATS = ("mp4", "hls")
+
 class VideoMergeService:
     def __init__(self, storage_service: StorageService):
         self.storage_service = storage_service
-        # Check if ffmpeg is available
-        self._check_ffmpeg()
+        self.clip_cache = ClipCache(resolve_local=storage_service.local_path_for_url)
+        self.scheduler = MergeScheduler(settings.MERGE_MAX_CONCURRENCY, settings.MERGE_MAX_QUEUE)
+        # output path -> public URL of the merged output (the bucket is the source of truth)
+        self._merged_urls = LRUCache(1024 * 1024, sizeof=len)
+        self._in_flight_merges = SingleFlight()
+        # HLS merges that keep uploading segments after the playlist URL was returned
+        self._background_merges: set[asyncio.Task] = set()
+        self.merge_stats = {"merges": 0, "cache_hits": 0, "prefix_reuses": 0, "clips_skipped": 0, "clips_reencoded": 0}
+        # Whether ffmpeg / ffprobe are installed, looked up on first use (or by warm_up)
+        self._ffmpeg_available: Optional[bool] = None
+        self._ffprobe_available: Optional[bool] = None
+
+    @property
+    def ffmpeg_available(self) -> bool:
+        if self._ffmpeg_available is None:
+            self._check_ffmpeg()
+        return self._ffmpeg_available
+
+    @ffmpeg_available.setter
+    def ffmpeg_available(self, available: bool):
+        self._ffmpeg_available = available
+
+    @property
+    def ffprobe_available(self) -> bool:
+        if self._ffprobe_available is None:
+            self._check_ffmpeg()
+        return self._ffprobe_available
 
     def _check_ffmpeg(self):
         """Check if ffmpeg is available in the system."""
-        self.ffmpeg_available = shutil.which("ffmpeg") is not None
-        if not self.ffmpeg_available:
+        if self._ffmpeg_available is None:
+            self._ffmpeg_available = shutil.which("ffmpeg") is not None
+        if not self._ffmpeg_available:
             print("⚠️ FFmpeg not installed. Video merging will not be available.")
         else:
             print("✅ FFmpeg found. Video merging enabled.")
+        self._ffprobe_available = shutil.which("ffprobe") is not None
+        if self._ffmpeg_available and not self._ffprobe_available:
+            print("⚠️ FFprobe not installed. Clips will be merged without a compatibility check.")
+
+    async def warm_up(self):
+        """Look up ffmpeg ahead of the first merge"""
+        await asyncio.to_thread(lambda: self.ffprobe_available)
 
-    async def merge_videos(self, video_urls: list[str], user_id: str) -> str:
+    async def merge_videos(self, video_urls: list[str], user_id: str, output_format: str = "mp4") -> str:
         """
-        Merges multiple videos from URLs into a single video using FFmpeg with HTTP inputs.
-        This is the fastest approach - FFmpeg downloads and merges in one pass, no temporary files.
+        Merges multiple videos from URLs into a single video using FFmpeg.
+        Clips are prefetched concurrently into the local clip cache (only the ones that
+        changed since the last merge are downloaded), then concatenated from disk.
         
         Args:
             video_urls: List of video URLs in order (from root to end frame)
             user_id: User ID for organizing storage
+            output_format: "mp4" for a single file, "hls" for a segmented stream whose
+                playlist URL is returned as soon as the first segment is uploaded
             
         Returns:
-            Public URL of the merged video
+            Public URL of the merged video (or its HLS playlist)
+
+        Raises:
+            MergeQueueFullError: all ffmpeg slots are busy and the wait queue is full
         """
         start_time = time.time()
         print(f"[VIDEO MERGE] Starting merge for user {user_id}: {len(video_urls)} videos")
@@ -38,61 +100,369 @@ class VideoMergeService:
         
         if not video_urls:
             raise ValueError("No video URLs provided")
+
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format: {output_format}")
         
         if len(video_urls) == 1:
             # Single video, just return the URL
             return video_urls[0]
         
-        try:
-            # Merge videos using FFmpeg with HTTP inputs directly
-            merge_start = time.time()
-            
-            merged_video_data = await self._merge_with_ffmpeg_http(video_urls)
-            
-            merge_duration = time.time() - merge_start
-            merged_size = len(merged_video_data)
-            
-            # Upload to storage
-            upload_start = time.time()
-            video_id = str(uuid.uuid4())
-            video_path = f"videos/{user_id}/merged_{video_id}.mp4"
-            
-            public_url = await self.storage_service.upload_file(video_path, merged_video_data)
-            
-            upload_duration = time.time() - upload_start
-            total_duration = time.time() - start_time
-            
+        # Content-addressed: same clips (URL + object generation) in the same order -> same output
+        versions = await self.clip_cache.versions(video_urls)
+        merge_key = self.merge_key(video_urls, versions)
+        if merge_key is None:
+            # some clip has no version, so the result can't be reused
+            if output_format == "hls":
+                return await self._merge_hls(video_urls, versions, f"videos/{user_id}/merged_{uuid.uuid4()}", start_time)
+            video_path = f"videos/{user_id}/merged_{uuid.uuid4()}.mp4"
+            return await self._merge(video_urls, versions, video_path, start_time)
+
+        cached_url = await self._find_merged(merge_key, output_format)
+        if cached_url:
+            self.merge_stats["cache_hits"] += 1
+            print(f"[VIDEO MERGE] Reusing merged video {merge_key[:12]} for {len(video_urls)} videos")
+            return cached_url
+
+        async def merge_once() -> str:
+            inputs, input_versions = video_urls, versions
+            reused = 0
+            # Storyboards grow by appending clips: start from the longest already-merged prefix
+            # (MP4 prefixes only - they are the input for either output format)
+            prefix = await self._find_merged_prefix(video_urls, versions)
+            if prefix is not None:
+                prefix_length, prefix_url = prefix
+                prefix_version = await self.clip_cache.version(prefix_url)
+                if prefix_version is not None:
+                    inputs = [prefix_url] + video_urls[prefix_length:]
+                    input_versions = [prefix_version] + versions[prefix_length:]
+                    reused = prefix_length
+                    self.merge_stats["prefix_reuses"] += 1
+                    self.merge_stats["clips_skipped"] += prefix_length - 1
+                    print(f"[VIDEO MERGE] Reusing merged prefix of {prefix_length} videos, appending {len(video_urls) - prefix_length}")
+            path = self._merged_path(merge_key, output_format)
+            if output_format == "hls":
+                # indexed by _run_hls_merge, which also drops it again if the merge fails later
+                return await self._merge_hls(inputs, input_versions, os.path.dirname(path), start_time, reused)
+            public_url = await self._merge(inputs, input_versions, path, start_time, reused)
+            self._merged_urls.set(path, public_url)
             return public_url
+
+        # Identical requests arriving while this merge runs share its ffmpeg run
+        return await self._in_flight_merges.run((merge_key, output_format), merge_once)
+
+    @staticmethod
+    def merge_key(video_urls: list[str], versions: list[Optional[str]]) -> Optional[str]:
+        """Hash of the ordered clip list with each object's version; None if a version is unknown"""
+        if any(version is None for version in versions):
+            return None
+        return VideoMergeService._prefix_keys(video_urls, versions)[-1]
+
+    @staticmethod
+    def _prefix_keys(video_urls: list[str], versions: list[str]) -> list[str]:
+        """merge_key of every prefix: element i is the key of video_urls[:i + 1]"""
+        digest = hashlib.sha256()
+        keys = []
+        for url, version in zip(video_urls, versions):
+            digest.update(f"{url}\n{version}\n".encode())
+            keys.append(digest.copy().hexdigest())
+        return keys
+
+    async def _find_merged_prefix(self, video_urls: list[str], versions: list[str]) -> Optional[tuple[int, str]]:
+        """
+        Longest proper prefix (at least 2 clips) that was merged before, as (length, URL).
+        The in-process index covers every length; the bucket is only asked about the
+        one-clip-shorter prefix, the common "appended a frame" case.
+        """
+        prefix_keys = self._prefix_keys(video_urls, versions)
+        for length in range(len(video_urls) - 1, 1, -1):
+            key = prefix_keys[length - 1]
+            url = self._merged_urls.get(self._merged_path(key))
+            if url is None and length == len(video_urls) - 1:
+                url = await self._find_merged(key)
+            if url:
+                return length, url
+        return None
+
+    @staticmethod
+    def _merged_path(merge_key: str, output_format: str = "mp4") -> str:
+        if output_format == "hls":
+            return f"videos/merged/{merge_key}/{HLS_PLAYLIST}"
+        return f"videos/merged/{merge_key}.mp4"
+
+    async def _find_merged(self, merge_key: str, output_format: str = "mp4") -> Optional[str]:
+        path = self._merged_path(merge_key, output_format)
+        url = self._merged_urls.get(path)
+        # An HLS playlist in the bucket may belong to a merge that died half-way,
+        # so only playlists this process finished (or is still writing) are reused
+        if url is None and output_format == "mp4":
+            # merged earlier by another instance, or before a restart
+            url = await self.storage_service.find_public_url(path)
+            if url:
+                self._merged_urls.set(path, url)
+        return url
+
+    @asynccontextmanager
+    async def _prepared_clips(self, video_urls: list[str], versions: list[Optional[str]]) -> AsyncIterator[tuple[list[str], str]]:
+        """
+        Holds a merge slot and yields (clip paths ready for copy-concat, scratch directory).
+        The scratch directory sits next to the cache (same filesystem) and is removed on exit.
+        """
+        async with self.scheduler.slot():
+            slot_start = time.time()
+            with tempfile.TemporaryDirectory(prefix=".merge-", dir=settings.CLIP_CACHE_DIR) as work_dir:
+                async with self.clip_cache.checkout(video_urls, work_dir, versions) as clip_paths:
+                    print(f"[VIDEO MERGE] Prefetched {len(video_urls)} videos in {time.time() - slot_start:.2f}s")
+                    yield await self._conform_clips(clip_paths, work_dir), work_dir
+
+    @staticmethod
+    def _merged_clips_summary(video_urls: list[str], reused: int) -> str:
+        """
+        How many requested clips `video_urls` stands for. With `reused`, its first entry is an
+        earlier merge of that many clips and the rest are appended to it.
+        """
+        if not reused:
+            return f"{len(video_urls)} videos"
+        appended = len(video_urls) - 1
+        return f"{reused + appended} videos ({reused} reused from a merged prefix, {appended} appended)"
+
+    async def _merge(self, video_urls: list[str], versions: list[Optional[str]], video_path: str, start_time: float,
+                     reused: int = 0) -> str:
+        # FFmpeg output is streamed straight into a resumable upload while it is produced,
+        # so memory stays flat regardless of the merged video's size
+        async with self._prepared_clips(video_urls, versions) as (clip_paths, _):
+            public_url = await self.storage_service.upload_stream(
+                video_path,
+                self._stream_ffmpeg_concat(clip_paths),
+                content_type="video/mp4"
+            )
+
+        self.merge_stats["merges"] += 1
+        total_duration = time.time() - start_time
+        print(f"[VIDEO MERGE] Merged and uploaded {self._merged_clips_summary(video_urls, reused)} in {total_duration:.2f}s")
+        return public_url
+
+    async def _merge_hls(self, video_urls: list[str], versions: list[Optional[str]], base_path: str, start_time: float,
+                         reused: int = 0) -> str:
+        """
+        Segments the merged video into HLS under `base_path` and returns the playlist URL as soon
+        as the first segment is uploaded. The rest is uploaded in the background; the playlist
+        gains #EXT-X-ENDLIST when the last segment is in place.
+        """
+        ready = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(self._run_hls_merge(video_urls, versions, base_path, start_time, ready, reused))
+        self._background_merges.add(task)
+        task.add_done_callback(self._background_merges.discard)
+
+        await asyncio.wait({ready, task}, return_when=asyncio.FIRST_COMPLETED)
+        if ready.done():
+            return ready.result()
+        task.result()  # failed before the first segment - re-raises
+        raise RuntimeError("HLS merge finished without a playlist")
+
+    async def _run_hls_merge(self, video_urls: list[str], versions: list[Optional[str]], base_path: str,
+                             start_time: float, ready: asyncio.Future, reused: int = 0):
+        playlist_path = f"{base_path}/{HLS_PLAYLIST}"
+        uploaded: set[str] = set()
+        try:
+            async with self._prepared_clips(video_urls, versions) as (clip_paths, work_dir):
+                output_dir = os.path.join(work_dir, "hls")
+                os.mkdir(output_dir)
+
+                async def upload_new_segments(final: bool):
+                    playlist = await asyncio.to_thread(self._read_playlist, output_dir)
+                    if playlist is None:
+                        return
+                    # Everything the playlist lists is complete; upload it before the playlist itself
+                    new_files = [name for name in self._playlist_files(playlist) if name not in uploaded]
+                    if not new_files and not final:
+                        return
+                    for name in new_files:
+                        # recorded first, so a segment whose upload fails halfway is cleaned up too
+                        uploaded.add(name)
+                        await self.storage_service.upload_path(
+                            f"{base_path}/{name}", os.path.join(output_dir, name),
+                            content_type="video/mp4" if name.endswith(".mp4") else "video/iso.segment",
+                            cache_control=HLS_SEGMENT_CACHE_CONTROL
+                        )
+                    public_url = await self.storage_service.upload_file(
+                        playlist_path, playlist.encode(),
+                        content_type="application/vnd.apple.mpegurl",
+                        cache_control=HLS_PLAYLIST_CACHE_CONTROL
+                    )
+                    if not ready.done():
+                        print(f"[VIDEO MERGE] First HLS segment playable after {time.time() - start_time:.2f}s")
+                        self._merged_urls.set(playlist_path, public_url)
+                        ready.set_result(public_url)
+
+                async for _ in self._run_ffmpeg_hls(clip_paths, output_dir):
+                    await upload_new_segments(final=False)
+                await upload_new_segments(final=True)
         except Exception as e:
+            if ready.done():
+                # The URL was already handed out: drop the half-written playlist so it isn't reused,
+                # then the segments it pointed at
+                print(f"[ERROR] HLS merge into {base_path} failed after the first segment: {e}")
+                traceback.print_exc()
+                self._merged_urls.pop(playlist_path)
+                await self.storage_service.delete_file(playlist_path)
+                await asyncio.gather(*(self.storage_service.delete_file(f"{base_path}/{name}") for name in uploaded))
+                return
             raise
 
-    async def _merge_with_ffmpeg_http(self, video_urls: list[str]) -> bytes:
+        self.merge_stats["merges"] += 1
+        total_duration = time.time() - start_time
+        print(f"[VIDEO MERGE] Merged and uploaded {self._merged_clips_summary(video_urls, reused)} as HLS in {total_duration:.2f}s ({len(uploaded)} files)")
+
+    @staticmethod
+    def _read_playlist(output_dir: str) -> Optional[str]:
+        try:
+            with open(os.path.join(output_dir, HLS_PLAYLIST)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _playlist_files(playlist: str) -> list[str]:
+        """Init segment and media segments referenced by a playlist, in order"""
+        files = []
+        for line in playlist.splitlines():
+            line = line.strip()
+            if line.startswith("#EXT-X-MAP:"):
+                files.append(line.split('URI="', 1)[1].split('"', 1)[0])
+            elif line and not line.startswith("#"):
+                files.append(line)
+        return files
+
+    async def _run_ffmpeg_hls(self, clip_paths: list[str], output_dir: str) -> AsyncIterator[None]:
+        """
+        Concatenates local clip files into HLS (fMP4 segments of about HLS_SEGMENT_SECONDS,
+        cut at keyframes) in `output_dir`. Yields every HLS_POLL_INTERVAL while FFmpeg runs
+        so the caller can pick up finished segments; raises if FFmpeg failed.
+        """
+        ffmpeg_cmd = [
+            "ffmpeg",
+            "-protocol_whitelist", "file,fd",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", "-",  # Read concat file from stdin
+            "-c", "copy",
+            "-f", "hls",
+            "-hls_time", str(settings.HLS_SEGMENT_SECONDS),
+            "-hls_playlist_type", "event",  # segments are only ever appended
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", "init.mp4",
+            "-hls_segment_filename", os.path.join(output_dir, "segment_%05d.m4s"),
+            # segments and playlist appear atomically (written as .tmp, then renamed)
+            "-hls_flags", "independent_segments+temp_file",
+            os.path.join(output_dir, HLS_PLAYLIST)
+        ]
+        process = await asyncio.create_subprocess_exec(
+            *ffmpeg_cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stderr_task = asyncio.create_task(read_stderr_tail(process.stderr))
+        try:
+            process.stdin.write(self._concat_list(clip_paths))
+            await process.stdin.drain()
+            process.stdin.close()
+            await process.stdin.wait_closed()
+
+            wait = asyncio.ensure_future(process.wait())
+            while not wait.done():
+                await asyncio.wait({wait}, timeout=HLS_POLL_INTERVAL)
+                yield
+
+            stderr_data = await stderr_task
+            if process.returncode != 0:
+                error_msg = stderr_data.decode(errors="replace") if stderr_data else "Unknown FFmpeg error"
+                raise FFmpegError(f"FFmpeg failed with return code {process.returncode}: {error_msg}")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            if not stderr_task.done():
+                stderr_task.cancel()
+
+    @staticmethod
+    def _concat_list(clip_paths: list[str]) -> bytes:
         """
-        Merges videos using FFmpeg with HTTP inputs directly.
-        FFmpeg downloads and merges in one pass - no temporary files, no intermediate downloads.
-        Uses concat demuxer with HTTP URLs for maximum speed.
+        Concat demuxer input for local files:
+            file 'file:/path/one'
+            file 'file:/path/two'
+        (the file: prefix is needed because the concat list itself is read from fd:)
+        """
+        return "".join([f"file 'file:{path}'\n" for path in clip_paths]).encode("utf-8")
+
+    async def _conform_clips(self, clip_paths: list[str], work_dir: str) -> list[str]:
+        """
+        Makes the clips safe to concatenate with -c copy.
+        Probes every clip in parallel and takes the most common stream profile as the target;
+        only clips that differ from it are re-encoded (in parallel), the rest are used as-is.
+        Returns the paths to concatenate, in order.
+        """
+        if not self.ffprobe_available:
+            return clip_paths
+
+        profiles = await asyncio.gather(*(ffmpeg.probe(path) for path in clip_paths))
+        counts = Counter(profiles)
+        # most common profile; ties go to the earliest clip
+        target = max(profiles, key=lambda profile: counts[profile])
+        if counts[target] == len(profiles):
+            return clip_paths
+        target = target.encodable()
+
+        semaphore = asyncio.Semaphore(settings.MERGE_TRANSCODE_CONCURRENCY)
+
+        async def conform(index: int, path: str) -> str:
+            if profiles[index] == target:
+                return path
+            output_path = os.path.join(work_dir, f"{index}.mp4")
+            async with semaphore:
+                await ffmpeg.run(ffmpeg.conform_args(path, output_path, profiles[index], target))
+            return output_path
+
+        start = time.time()
+        conformed = await asyncio.gather(*(conform(i, path) for i, path in enumerate(clip_paths)))
+        reencoded = sum(1 for profile in profiles if profile != target)
+        self.merge_stats["clips_reencoded"] += reencoded
+        print(f"[VIDEO MERGE] Re-encoded {reencoded}/{len(clip_paths)} clips to {target.width}x{target.height} "
+              f"{target.video_codec}@{target.frame_rate} in {time.time() - start:.2f}s")
+        return list(conformed)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.merge_stats,
+            "coalesced": self._in_flight_merges.coalesced,
+            "scheduler": self.scheduler.get_stats(),
+            "clip_cache": self.clip_cache.get_stats(),
+        }
+
+    async def _stream_ffmpeg_concat(self, clip_paths: list[str]) -> AsyncIterator[bytes]:
+        """
+        Concatenates local clip files with FFmpeg and yields the output as it is produced.
+        The clips must share one stream profile (see _conform_clips).
         
         Strategy:
         1. Create concat file content in memory (as string)
         2. Pipe concat file to FFmpeg via stdin
-        3. FFmpeg reads videos directly from HTTP URLs
-        4. Stream output directly to stdout
+        3. FFmpeg reads the clips from the local clip cache
+        4. Yield stdout chunks as they arrive (fragmented MP4 needs no seeking)
+        Raises after the last chunk if FFmpeg failed, so a consumer never finalizes a broken file.
         """
         # Build concat file content in memory
-        # Format: file 'http://url1'
-        #         file 'http://url2'
-        #         ...
-        concat_content = "".join([f"file '{url}'\n" for url in video_urls])
-        concat_bytes = concat_content.encode('utf-8')
+        concat_bytes = self._concat_list(clip_paths)
         
         # FFmpeg command using concat demuxer with stdin for concat file
-        # -protocol_whitelist allows HTTP/HTTPS access (required for remote URLs)
+        # -protocol_whitelist only allows local files and fd for stdin
         # -f concat -safe 0 -i - reads concat file from stdin
         # -c copy uses stream copy (no re-encoding) for maximum speed
         # -movflags frag_keyframe+empty_moov enables streaming output
         ffmpeg_cmd = [
             "ffmpeg",
-            "-protocol_whitelist", "file,http,https,tcp,tls,fd",  # Allow HTTP/HTTPS protocols and fd for stdin
+            "-protocol_whitelist", "file,fd",
             "-f", "concat",
             "-safe", "0",
             "-i", "-",  # Read concat file from stdin
@@ -109,62 +479,31 @@ class VideoMergeService:
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
-        
-        # Write concat file to stdin first, then read output in parallel
-        async def write_concat_file():
-            """Write concat file content to FFmpeg stdin."""
-            try:
-                process.stdin.write(concat_bytes)
-                await process.stdin.drain()
-                process.stdin.close()
-                await process.stdin.wait_closed()
-            except Exception as e:
-                raise
-        
-        async def read_output():
-            """Read merged video output from FFmpeg stdout."""
-            chunks = []
-            try:
-                while True:
-                    chunk = await process.stdout.read(1024 * 1024)  # Read 1MB chunks
-                    if not chunk:
-                        break
-                    chunks.append(chunk)
-                return b"".join(chunks)
-            except Exception as e:
-                raise
-        
-        async def monitor_progress():
-            """Monitor FFmpeg stderr for progress and errors."""
-            chunks = []
-            try:
-                while True:
-                    chunk = await process.stderr.read(1024)
-                    if not chunk:
-                        break
-                    chunks.append(chunk)
-            except Exception as e:
-                pass
-            
-            return b"".join(chunks)
 
-        # Write concat file first, then read output and monitor progress in parallel
+        stderr_task = asyncio.create_task(read_stderr_tail(process.stderr))
         try:
-            await write_concat_file()
-            stdout_data, stderr_data = await asyncio.gather(
-                read_output(),
-                monitor_progress()
-            )
-        except Exception as e:
-            process.terminate()
-            await process.wait()
-            raise Exception(f"Error during FFmpeg execution: {e}")
-        
-        # Wait for process to complete
-        return_code = await process.wait()
+            # Write concat file to stdin first, then stream the output
+            process.stdin.write(concat_bytes)
+            await process.stdin.drain()
+            process.stdin.close()
+            await process.stdin.wait_closed()
 
-        if return_code != 0:
-            error_msg = stderr_data.decode() if stderr_data else "Unknown FFmpeg error"
-            raise Exception(f"FFmpeg failed with return code {return_code}: {error_msg}")
-        
-        return stdout_data
+            while True:
+                chunk = await process.stdout.read(READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+
+            # Wait for process to complete
+            return_code = await process.wait()
+            stderr_data = await stderr_task
+            if return_code != 0:
+                error_msg = stderr_data.decode(errors="replace") if stderr_data else "Unknown FFmpeg error"
+                raise FFmpegError(f"FFmpeg failed with return code {return_code}: {error_msg}")
+        finally:
+            # consumer gave up (upload failed, request cancelled) or we raised - don't leak ffmpeg
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            if not stderr_task.done():
+                stderr_task.cancel()
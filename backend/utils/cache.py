@@ -0,0 +1,237 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+
+class LRUCache:
+    """
+    In-memory LRU map bounded by total size (sizeof(value), len() by default),
+    with hit/miss/eviction counters. With a ttl (seconds) entries also expire.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int] = len, ttl: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._expires_at: Dict[Hashable, float] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        if self.ttl is not None and self._expires_at[key] <= time.monotonic():
+            self.pop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key]
+
+    def set(self, key: Hashable, value: Any):
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        if key in self._entries:
+            self.pop(key)
+        self._entries[key] = value
+        self._bytes += size
+        if self.ttl is not None:
+            self._expires_at[key] = time.monotonic() + self.ttl
+        while self._bytes > self.max_bytes:
+            evicted_key = next(iter(self._entries))
+            self.pop(evicted_key)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        value = self._entries.pop(key, None)
+        self._expires_at.pop(key, None)
+        if value is not None:
+            self._bytes -= self._sizeof(value)
+        return value
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class DiskCache:
+    """
+    Directory of files bounded by total size, evicting the least recently used
+    (oldest mtime) first. Keys must be safe file names, e.g. hex digests.
+    Pinned entries are never evicted, e.g. while a subprocess is reading them.
+    Blocking and thread-safe - call from a thread when used in async code.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # name -> size, in least-recently-used order (rebuilt from mtimes on startup)
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        files = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+        self._bytes = sum(self._entries.values())
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def touch(self, key: str) -> bool:
+        """Mark an entry as used; False (and counted as a miss) if it is not cached"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False
+            try:
+                os.utime(self.path(key))
+            except FileNotFoundError:
+                # removed behind our back
+                self._bytes -= self._entries.pop(key)
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True
+
+    def size(self, key: str) -> int:
+        return self._entries.get(key, 0)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if not self.touch(key):
+                return None
+            # keep it from being evicted between the check and the read
+            self.pin(key)
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        finally:
+            self.unpin(key)
+
+    def set(self, key: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self.add_file(key, tmp_path)
+
+    def add_file(self, key: str, src_path: str, pin: bool = False):
+        """Move a finished file (on the same filesystem) into the cache, optionally pinned"""
+        size = os.path.getsize(src_path)
+        with self._lock:
+            os.replace(src_path, self.path(key))
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)
+            self._entries[key] = size
+            self._bytes += size
+            if pin:
+                self.pin(key)
+            self._evict(keep=key)
+
+    def pin(self, key: str):
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: str):
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+            self._evict()
+
+    def _evict(self, keep: Optional[str] = None):
+        while self._bytes > self.max_bytes:
+            # least recently used entry that is not in use
+            key = next((key for key in self._entries if key != keep and key not in self._pins), None)
+            if key is None:
+                break
+            self._bytes -= self._entries.pop(key)
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            self.evictions += 1
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one; late callers share its result"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # mark retrieved so a failure nobody else awaited is not logged as "never retrieved"
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import Literal, Optional
 
 class Settings(BaseSettings):
     GOOGLE_CLOUD_PROJECT: str
@@ -7,8 +7,67 @@ class Settings(BaseSettings):
     GOOGLE_GENAI_USE_VERTEXAI: bool
     GOOGLE_CLOUD_BUCKET_NAME: Optional[str] = None  # Optional - not needed if using local storage
     GOOGLE_APPLICATION_CREDENTIALS: Optional[str] = None  # Optional - path to service account JSON
-    REDIS_URL: Optional[str] = None  # Optional - not needed for basic MVP
+    REDIS_URL: Optional[str] = None  # Optional - shared job store; in-memory (single worker) when unset
     FRONTEND_URL: str = "http://localhost:5173"  # Default for local dev
+    STARTUP_WARMUP: bool = True  # Create SDK clients in the background right after startup instead of on first use
+    VERTEX_MAX_CONCURRENCY: int = 8  # Max Vertex AI calls in flight at once per process
+    VERTEX_RETRY_ATTEMPTS: int = 4  # Attempts per Vertex call for 429 / 5xx / timeouts
+    VERTEX_RETRY_BASE_DELAY: float = 1.0  # First backoff ceiling in seconds, doubled per retry (full jitter)
+    VERTEX_RETRY_MAX_DELAY: float = 20.0  # Upper bound of a single backoff
+    VERTEX_TEXT_DEADLINE: float = 30.0  # Seconds per attempt for text answers
+    VERTEX_IMAGE_DEADLINE: float = 60.0  # Seconds per attempt for image answers
+    VERTEX_VIDEO_DEADLINE: float = 30.0  # Seconds per attempt for starting / polling Veo operations
+    VERTEX_HEDGE_IMAGE_CALLS: bool = False  # Send a duplicate image call when the first one is unusually slow
+    VERTEX_HEDGE_PERCENTILE: float = 95  # Latency percentile after which a hedge is sent
+    VERTEX_HEDGE_MAX_RATIO: float = 0.1  # At most this share of calls get hedged
+    VERTEX_CIRCUIT_FAILURES: int = 5  # Quota / 5xx / timeout errors in a row that open a model's circuit breaker
+    VERTEX_CIRCUIT_OPEN_SECONDS: float = 30.0  # How long an open breaker rejects calls before letting a probe through
+    FRAME_CACHE_MEMORY_BYTES: int = 64 * 1024 * 1024  # In-memory budget for cleaned frames
+    FRAME_CACHE_DIR: Optional[str] = None  # Optional directory for a persistent cleaned-frame cache
+    FRAME_CACHE_DISK_BYTES: int = 1024 * 1024 * 1024  # Size limit of FRAME_CACHE_DIR
+    ANALYSIS_CACHE_MAX_BYTES: int = 4 * 1024 * 1024  # In-memory budget for memoized annotation descriptions
+    ANALYSIS_CACHE_TTL_SECONDS: int = 24 * 3600  # How long an annotation description is reused
+    VERTEX_COMBINED_FRAME_CALL: bool = False  # Describe annotations and clean the starting frame in one image-model call
+    STORAGE_UPLOAD_CHUNK_BYTES: int = 8 * 1024 * 1024  # Resumable upload chunk size (multiple of 256 KiB)
+    STORAGE_STREAM_QUEUE_CHUNKS: int = 4  # Read-ahead chunks buffered while a streamed upload is in progress
+    STORAGE_IO_WORKERS: int = 16  # Threads (and pooled keep-alive connections) for Cloud Storage calls
+    STORAGE_COMPOSITE_THRESHOLD_BYTES: int = 64 * 1024 * 1024  # Uploads this big are sent as parallel parts and composed
+    STORAGE_COMPOSITE_PARTS: int = 8  # Parts of a composite upload (at most 32)
+    STORAGE_SIGNED_URL_TTL_SECONDS: int = 15 * 60  # Lifetime of signed upload / download URLs
+    STORAGE_UPLOAD_MAX_BYTES: int = 200 * 1024 * 1024  # Largest direct upload a signed URL accepts
+    STORAGE_EMULATOR_HOST: Optional[str] = None  # Optional - e.g. http://localhost:4443 for a local fake-GCS server
+    STORAGE_BACKEND: Optional[Literal["gcs", "local"]] = None  # Optional - defaults to gcs when GOOGLE_CLOUD_BUCKET_NAME is set, local otherwise
+    LOCAL_STORAGE_DIR: str = "/tmp/flowboard/storage"  # Where the local backend keeps objects
+    LOCAL_STORAGE_BASE_URL: str = "http://localhost:8000"  # Public URL of this API, local objects are served under /files
+    LOCAL_STORAGE_SIGNING_KEY: Optional[str] = None  # Optional - signs local upload URLs; set it when running several processes
+    CLIP_CACHE_DIR: str = "/tmp/flowboard/clips"  # Local cache of source clips for merging
+    CLIP_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # Size limit of the cached clips in CLIP_CACHE_DIR. On Cloud Run /tmp counts against memory, and each running merge adds scratch (conformed clips, HLS output) on top
+    CLIP_PREFETCH_CONCURRENCY: int = 4  # Parallel clip downloads
+    MERGE_MAX_CONCURRENCY: int = 2  # ffmpeg merge processes allowed at once per instance
+    MERGE_MAX_QUEUE: int = 8  # Merges allowed to wait for a slot before new ones get 503 + Retry-After
+    MERGE_TRANSCODE_CONCURRENCY: int = 2  # Mismatched clips re-encoded in parallel within one merge
+    HLS_SEGMENT_SECONDS: int = 4  # Target segment length for format=hls merges (cut at keyframes)
+    IMAGE_NORMALIZE: bool = True  # Crop/pad uploads to 16:9, downscale and re-encode as JPEG before Gemini/Veo
+    IMAGE_NORMALIZE_WORKERS: int = 2  # Threads for image normalization
+    IMAGE_TARGET_WIDTH: int = 1280  # Max size of normalized frames (Veo renders 720p)
+    IMAGE_TARGET_HEIGHT: int = 720
+    IMAGE_JPEG_QUALITY: int = 90  # JPEG quality of normalized frames
+    MEDIA_SPOOL_THRESHOLD_BYTES: int = 1024 * 1024  # Job images bigger than this wait for their job in temp files, not in memory
+    CONTEXT_KEYFRAME_MIN_BYTES: int = 16 * 1024 * 1024  # Smaller inline videos go to Gemini whole (uploading them is quicker than decoding them); bigger ones near the 20 MB inline limit as keyframes
+    CONTEXT_KEYFRAME_COUNT: int = 8  # Frames sampled from a video for /api/gemini/extract-context
+    CONTEXT_KEYFRAME_WIDTH: int = 512  # Width the sampled frames are scaled to (height keeps the aspect ratio)
+    CONTEXT_SCENE_THRESHOLD: float = 0.3  # ffmpeg scene score (0-1) that counts as a scene change
+    VEO_EXPECTED_SECONDS: int = 60  # Typical Veo generation time, status polls tighten around it
+    JOB_POLL_MIN_INTERVAL: float = 2.0  # Seconds between status polls near the expected finish
+    JOB_POLL_MAX_INTERVAL: float = 20.0  # Seconds between status polls for young or overdue jobs
+    JOB_POLL_TICK: float = 0.5  # How often the background poller looks for due jobs
+    JOB_RESULT_TTL_SECONDS: int = 3600  # How long finished/failed jobs stay queryable
+    JOB_ACTIVE_TTL_SECONDS: int = 6 * 3600  # Upper bound on how long an unfinished job is kept
+    JOB_EXECUTION_MODE: Literal["inline", "queue"] = "inline"  # "inline" runs jobs in the API process, "queue" hands them to worker.py (needs REDIS_URL)
+    JOB_WORKER_CONCURRENCY: int = 4  # Jobs processed in parallel by one worker.py process
+    JOB_VISIBILITY_TIMEOUT_SECONDS: int = 120  # A claimed job is redelivered if its worker stops renewing it this long
+    JOB_QUEUE_MAX_ATTEMPTS: int = 3  # Deliveries before a job is marked as failed
+    JOB_QUEUE_POLL_INTERVAL: float = 0.5  # Seconds an idle consumer waits before checking the queue again
     model_config = SettingsConfigDict(
         env_file=".env",
         case_sensitive=True,
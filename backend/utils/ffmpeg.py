@@ -0,0 +1,186 @@
+from dataclasses import dataclass, replace
+from typing import Optional
+import asyncio
+import json
+import os
+
+# Only the tail of ffmpeg's log is kept for error messages
+STDERR_TAIL_BYTES = 64 * 1024
+
+# Encoders used to conform a clip to a profile, by ffprobe codec_name
+VIDEO_ENCODERS = {"h264": "libx264", "hevc": "libx265"}
+AUDIO_ENCODERS = {"aac": "aac", "opus": "libopus", "mp3": "libmp3lame"}
+
+# ffprobe profile names -> -profile:v values for libx264
+H264_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high"}
+
+
+class FFmpegError(Exception):
+    """ffmpeg / ffprobe exited with an error"""
+
+
+@dataclass(frozen=True)
+class StreamProfile:
+    """Codec parameters that must be identical for clips to be concatenated with -c copy"""
+    video_codec: str
+    video_profile: Optional[str]
+    width: int
+    height: int
+    pix_fmt: str
+    frame_rate: str  # e.g. "24/1"
+    timescale: int  # video track time base denominator
+    audio_codec: Optional[str] = None  # None when the clip has no audio track
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+
+    def encodable(self) -> "StreamProfile":
+        """This profile, with codecs we have no encoder for swapped for h264 / aac"""
+        profile = self
+        if profile.video_codec not in VIDEO_ENCODERS:
+            profile = replace(profile, video_codec="h264", video_profile="High")
+        if profile.audio_codec is not None and profile.audio_codec not in AUDIO_ENCODERS:
+            profile = replace(profile, audio_codec="aac")
+        return profile
+
+
+async def read_stderr_tail(stderr: asyncio.StreamReader) -> bytes:
+    """Drain a running ffmpeg's stderr so it never blocks on a full pipe, keeping only the tail for errors"""
+    tail = b""
+    while True:
+        chunk = await stderr.read(1024)
+        if not chunk:
+            break
+        tail = (tail + chunk)[-STDERR_TAIL_BYTES:]
+    return tail
+
+
+async def run(args: list[str]) -> bytes:
+    """Run ffmpeg / ffprobe to completion and return stdout; FFmpegError with the log tail on failure"""
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    finally:
+        # cancelled while waiting - don't leak the process
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    if process.returncode != 0:
+        error_msg = stderr[-STDERR_TAIL_BYTES:].decode(errors="replace") or "Unknown error"
+        raise FFmpegError(f"{args[0]} failed with return code {process.returncode}: {error_msg}")
+    return stdout
+
+
+async def probe(path: str) -> StreamProfile:
+    """Stream profile of a local media file (first video and first audio stream)"""
+    output = await run([
+        "ffprobe",
+        "-v", "error",
+        "-show_entries",
+        "stream=codec_type,codec_name,profile,width,height,pix_fmt,r_frame_rate,time_base,sample_rate,channels",
+        "-of", "json",
+        path
+    ])
+    streams = json.loads(output).get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    if video is None:
+        raise ValueError(f"No video stream in {path}")
+
+    return StreamProfile(
+        video_codec=video["codec_name"],
+        video_profile=video.get("profile"),
+        width=int(video["width"]),
+        height=int(video["height"]),
+        pix_fmt=video.get("pix_fmt", "yuv420p"),
+        frame_rate=video["r_frame_rate"],
+        timescale=int(video["time_base"].split("/")[1]),
+        audio_codec=audio["codec_name"] if audio else None,
+        sample_rate=int(audio["sample_rate"]) if audio else None,
+        channels=int(audio["channels"]) if audio else None,
+    )
+
+
+def conform_args(src: str, dst: str, source: StreamProfile, target: StreamProfile) -> list[str]:
+    """
+    ffmpeg command that re-encodes `src` into `dst` with exactly `target`'s stream profile,
+    so it can be stream-copied next to clips that already have it.
+    Letterboxes instead of stretching, and adds silence if the clip has no audio.
+    """
+    video_filter = (
+        f"scale={target.width}:{target.height}:force_original_aspect_ratio=decrease,"
+        f"pad={target.width}:{target.height}:(ow-iw)/2:(oh-ih)/2,setsar=1,"
+        f"fps={target.frame_rate},format={target.pix_fmt}"
+    )
+    args = ["ffmpeg", "-nostdin", "-y", "-v", "error", "-i", src]
+    add_silence = target.audio_codec is not None and source.audio_codec is None
+    if add_silence:
+        args += ["-f", "lavfi", "-i", f"anullsrc=r={target.sample_rate}:cl=mono"]
+    args += [
+        "-map", "0:v:0",
+        "-vf", video_filter,
+        "-c:v", VIDEO_ENCODERS[target.video_codec],
+        "-preset", "veryfast",
+        "-crf", "18",
+        "-video_track_timescale", str(target.timescale),
+    ]
+    if target.video_codec == "h264":
+        if target.video_profile in H264_PROFILES:
+            args += ["-profile:v", H264_PROFILES[target.video_profile]]
+        # SPS/PPS in-band, so decoders pick them up where this clip starts in the merged file
+        args += ["-x264-params", "repeat-headers=1"]
+
+    if target.audio_codec is None:
+        args += ["-an"]
+    else:
+        args += [
+            "-map", "1:a:0" if add_silence else "0:a:0",
+            "-c:a", AUDIO_ENCODERS[target.audio_codec],
+            "-ar", str(target.sample_rate),
+            "-ac", str(target.channels),
+        ]
+        if add_silence:
+            # the silent track is endless, cut it to the video's length
+            args += ["-shortest"]
+    args += ["-f", "mp4", dst]
+    return args
+
+
+async def probe_duration(path: str) -> Optional[float]:
+    """Container duration in seconds, None if ffprobe is missing or can't tell"""
+    try:
+        output = await run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", path])
+        return float(json.loads(output)["format"]["duration"])
+    except (OSError, FFmpegError, KeyError, ValueError):
+        return None
+
+
+async def extract_keyframes(path: str, output_dir: str, count: int, width: int, threshold: float) -> list[str]:
+    """
+    Up to `count` JPEG frames of a video, `width` pixels wide, in chronological order.
+    Picks the first frame and every scene change (scene score above `threshold`), plus a
+    frame whenever no scene change happened for duration / count seconds, so single-shot
+    clips are still covered end to end. Evenly thins the picks down to `count`.
+    """
+    select = f"eq(n\\,0)+gt(scene\\,{threshold})"
+    duration = await probe_duration(path)
+    if duration:
+        select += f"+gte(t-prev_selected_t\\,{duration / count:.3f})"
+
+    await run([
+        "ffmpeg", "-nostdin", "-v", "error",
+        "-i", path,
+        "-vf", f"select='{select}',scale={width}:-2",
+        "-fps_mode", "vfr",  # one output image per selected frame
+        "-q:v", "4",
+        os.path.join(output_dir, "keyframe_%04d.jpg")
+    ])
+    frames = sorted(name for name in os.listdir(output_dir) if name.startswith("keyframe_"))
+    if len(frames) > count:
+        step = len(frames) / count
+        frames = [frames[int(i * step)] for i in range(count)]
+    return [os.path.join(output_dir, name) for name in frames]
@@ -0,0 +1,83 @@
+from PIL import Image, ImageOps
+from typing import Optional
+import io
+
+# Leading bytes of the formats browsers and Gemini produce
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+# Aspect ratios closer than this to the target are cropped, anything further off is padded
+CROP_TOLERANCE = 0.1
+
+
+def sniff_mime_type(data: bytes, default: str = "image/png") -> str:
+    """MIME type from the file's magic bytes, `default` if it isn't recognized"""
+    for signature, mime_type in _SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return default
+
+
+def normalize_image(data: bytes, width: int, height: int, quality: int, overlay: Optional[bytes] = None) -> bytes:
+    """
+    Re-encode an image as a width:height JPEG no larger than width x height.
+    Near-matching aspect ratios are center-cropped; others are padded with white so nothing
+    drawn on the canvas is cut off. Transparency is flattened onto white. Never upscales.
+    `overlay` (e.g. an annotation layer) is drawn on top first, stretched to the image's size.
+    Blocking - run it in a thread.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        if overlay is None:
+            # JPEGs can be decoded at a fraction of their size (still at least width x height)
+            image.draft("RGB", (width, height))
+        image = ImageOps.exif_transpose(image)
+        # Alpha is kept until after the resize, flattening a 4K image is the slow part
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha or overlay is not None else "RGB")
+    if overlay is not None:
+        with Image.open(io.BytesIO(overlay)) as layer:
+            layer = ImageOps.exif_transpose(layer).convert("RGBA")
+        if layer.size != image.size:
+            layer = layer.resize(image.size, Image.LANCZOS)
+        image = Image.alpha_composite(image, layer)
+        has_alpha = True
+    fill = (255, 255, 255, 0) if has_alpha else (255, 255, 255)
+
+    target_ratio = width / height
+    ratio = image.width / image.height
+    if abs(ratio / target_ratio - 1) <= CROP_TOLERANCE:
+        crop_width = min(image.width, round(image.height * target_ratio))
+        crop_height = min(image.height, round(image.width / target_ratio))
+        left = (image.width - crop_width) // 2
+        top = (image.height - crop_height) // 2
+        image = image.crop((left, top, left + crop_width, top + crop_height))
+    else:
+        padded_width = max(image.width, round(image.height * target_ratio))
+        padded_height = max(image.height, round(image.width / target_ratio))
+        padded = Image.new(image.mode, (padded_width, padded_height), fill)
+        padded.paste(image, ((padded_width - image.width) // 2, (padded_height - image.height) // 2))
+        image = padded
+
+    if image.width > width:
+        # Box-reduce by the integer part of the factor first (4K -> 720p is exactly 3x),
+        # it is several times faster than LANCZOS over the full-size image
+        factor = image.width // width
+        if factor >= 2:
+            image = image.reduce(factor)
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.LANCZOS)
+
+    if has_alpha:
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
@@ -0,0 +1,18 @@
+import asyncio
+from services.vertex_service import VertexService
+from services.job_service import JobService
+from services.storage_service import create_storage_service
+
+
+async def main():
+    """Video job worker for JOB_EXECUTION_MODE=queue (run next to the API: python worker.py)"""
+    job_service = JobService(VertexService(), storage_service=create_storage_service())
+    await job_service.start()
+    try:
+        await job_service.run_queue_worker()
+    finally:
+        await job_service.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())